@@ -24,15 +24,28 @@ except ImportError:
     import queue
 import time
 
+from event import MarketEvent, SignalEvent, OrderEvent, FillEvent, \
+    SignalBatchEvent, OrderBatchEvent
+from progress import ProgressReporter
+
 class Backtest(object):
     """
     Encapsulates the settings and components for carrying out an event-driven
     backtest
+
+    Several strategies can be run side by side over a single pass of the
+    data: each gets a distinct strategy_id and either its own Portfolio or
+    one shared by all of them, and its signals (and the resulting orders and
+    fills) are routed by strategy_id.
     """
 
+    event_queue_cls = queue.Queue # The type of the Event Queue
+
     def __init__(
-        self, csv_dir, symbol_list, initial_capital, heartbeat, data_handler,
-        execution_handler, portfolio, strategy):
+        self, csv_dir, symbol_list, initial_capital, heartbeat, start_date,
+        data_handler, execution_handler, portfolio, strategy, live=False,
+        strategy_params=None, stop_condition=None, shared_portfolio=False,
+        max_lookback=1000):
         """
         Initialize the backtest
 
@@ -46,7 +59,22 @@ class Backtest(object):
             execution_handler - (Class) Handles the orders/fills for trades
             portfolio - (Class) Keeps track of portfolio current and prior
             positions
-            strategy - (Class) Generates signals based on market data
+            strategy - (Class) Generates signals based on market data, or a
+            list of classes to run several strategies at once
+            live - If True the loop runs on the wall clock, sleeping for
+            heartbeat seconds every cycle. Otherwise the historical data is
+            fast forwarded through as quickly as possible
+            strategy_params - Optional dict of keyword arguments for the
+            strategy, e.g. {'short_window': 50, 'long_window': 200}, or a
+            list of them, one per strategy
+            stop_condition - Optional callable taking the (first) Portfolio,
+            checked after every bar. The run ends early as soon as it returns
+            True, e.g. lambda p: p.performance.max_drawdown > 0.5. Only
+            supported by the event-driven loop, not in vectorized mode
+            shared_portfolio - If True all the strategies trade a single
+            Portfolio, otherwise each has its own
+            max_lookback - The maximum number of bars the data handler keeps
+            per symbol, i.e. the longest lookback a strategy can ask for
         """
 
         self.csv_dir = csv_dir
@@ -54,18 +82,37 @@ class Backtest(object):
         self.initial_capital = initial_capital
         self.heartbeat = heartbeat
         self.start_date = start_date
+        self.live = live
+        self.max_lookback = max_lookback
 
         self.data_handler_cls = data_handler
         self.execution_handler_cls = execution_handler
         self.portfolio_cls = portfolio
-        self.strategy_cls = strategy
-
-        self.evebts = queue.Queue()
+        self.shared_portfolio = shared_portfolio
+
+        if isinstance(strategy, (list, tuple)):
+            self.strategy_cls = list(strategy)
+        else:
+            self.strategy_cls = [strategy]
+        if isinstance(strategy_params, (list, tuple)):
+            self.strategy_params = [p or {} for p in strategy_params]
+        else:
+            self.strategy_params = \
+                [strategy_params or {}] * len(self.strategy_cls)
+        if len(self.strategy_params) != len(self.strategy_cls):
+            raise ValueError(
+                "Got %d strategies but %d sets of strategy parameters" %
+                (len(self.strategy_cls), len(self.strategy_params))
+            )
+        self.stop_condition = stop_condition
+        self.stopped_early = False
+
+        self.events = self.event_queue_cls()
 
         self.signals = 0
         self.orders = 0
         self.fills = 0
-        self.num_strats = 1
+        self.num_strats = len(self.strategy_cls)
 
         self._generate_trading_instances()
 
@@ -76,21 +123,142 @@ class Backtest(object):
 
         print("Creating DataHandler, Strategy, Portfolio, and ExecutionHander")
 
-        self.date_handler = self.data_handler_cls(self.events, self.csv_dir,
-            self.symbol_list)
-
-        self.strategy = self.strategy_cls(self.data_handler, self.events)
+        self.data_handler = self.data_handler_cls(self.events, self.csv_dir,
+            self.symbol_list, max_lookback=self.max_lookback)
+
+        # Strategy ids start at 1, the default of a lone strategy
+        self.strategies = []
+        self.portfolios = {}
+        self.portfolio_list = []
+        for i in range(self.num_strats):
+            strategy = self.strategy_cls[i](self.data_handler, self.events,
+                **self.strategy_params[i])
+            strategy.strategy_id = i + 1
+            self.strategies.append(strategy)
+
+            if self.shared_portfolio and self.portfolio_list:
+                portfolio = self.portfolio_list[0]
+            else:
+                portfolio = self.portfolio_cls(self.data_handler, self.events,
+                    self.start_date, self.initial_capital)
+                self.portfolio_list.append(portfolio)
+            self.portfolios[strategy.strategy_id] = portfolio
 
-        self.portfolio = self.portfolio_cls(self.data_handler, self.events,
-                self.start_date, self.initial_capital)
+        # The first strategy and portfolio, all there is in a single
+        # strategy backtest
+        self.strategy = self.strategies[0]
+        self.portfolio = self.portfolio_list[0]
 
         self.execution_handler = self.execution_handler_cls(self.events)
 
+        self._register_event_handlers()
+
+    def _register_event_handlers(self):
+        """
+        Fills the dispatch table which maps each Event class to the list of
+        handlers it is sent to, in order. Looking the handlers up by the
+        class of the event replaces a chain of string comparisons per event.
+        """
+
+        self.event_handlers = {}
+
+        for strategy in self.strategies:
+            self.register_handler(MarketEvent, strategy.calculate_signals)
+        for portfolio in self.portfolio_list:
+            self.register_handler(MarketEvent, portfolio.update_timeindex)
+        # An execution handler simulating a market follows the bars as well
+        if hasattr(self.execution_handler, 'update_timeindex'):
+            self.register_handler(
+                MarketEvent, self.execution_handler.update_timeindex
+            )
+
+        # With a single portfolio there is nothing to route
+        if len(self.portfolio_list) == 1:
+            update_signal = self.portfolio.update_signal
+            update_signal_batch = self.portfolio.update_signal_batch
+            update_fill = self.portfolio.update_fill
+        else:
+            update_signal = self._route_signal
+            update_signal_batch = self._route_signal_batch
+            update_fill = self._route_fill
+
+        self.register_handler(SignalEvent, self._count_signal)
+        self.register_handler(SignalEvent, update_signal)
+
+        self.register_handler(OrderEvent, self._count_order)
+        self.register_handler(OrderEvent, self.execution_handler.execute_order)
+
+        # A whole bar of signals/orders at once, see SignalBatchEvent
+        self.register_handler(SignalBatchEvent, self._count_signal)
+        self.register_handler(SignalBatchEvent, update_signal_batch)
+
+        self.register_handler(OrderBatchEvent, self._count_order)
+        self.register_handler(
+            OrderBatchEvent, self.execution_handler.execute_order_batch
+        )
+
+        self.register_handler(FillEvent, self._count_fill)
+        self.register_handler(FillEvent, update_fill)
+
+    def register_handler(self, event_cls, handler):
+        """
+        Registers a handler to be called with every event of a given class,
+        after any handler already registered for that class.
+
+        Parameters:
+            event_cls - The Event subclass, e.g. MarketEvent
+            handler - A callable taking the event as its only argument
+        """
+
+        self.event_handlers.setdefault(event_cls, []).append(handler)
+
+    def _route_signal(self, event):
+        """
+        Sends a SignalEvent to the Portfolio of the strategy it came from
+        """
+        self.portfolios[event.strategy_id].update_signal(event)
+
+    def _route_signal_batch(self, event):
+        """
+        Sends a SignalBatchEvent to the Portfolio of the strategy it came from
+        """
+        self.portfolios[event.strategy_id].update_signal_batch(event)
+
+    def _route_fill(self, event):
+        """
+        Sends a FillEvent to the Portfolio whose order was filled, which the
+        ExecutionHandler must have tagged with the strategy_id of the order
+        """
+        self.portfolios[event.strategy_id].update_fill(event)
+
+    def _count_signal(self, event):
+        """
+        Keeps count of the SignalEvents (single or batched) for the
+        performance output
+        """
+        self.signals += len(event) if event.type == 'SIGNAL_BATCH' else 1
+
+    def _count_order(self, event):
+        """
+        Keeps count of the OrderEvents (single or batched) for the
+        performance output
+        """
+        self.orders += len(event) if event.type == 'ORDER_BATCH' else 1
+
+    def _count_fill(self, event):
+        """
+        Keeps count of the FillEvents for the performance output
+        """
+        self.fills += 1
+
     def _run_backtest(self):
         """
         This is orchestrator of the backtest and ties the backtesting programs
         together in a hopefully very clear manner.
 
+        Events are routed through the event_handlers dispatch table, see
+        _register_event_handlers. By default:
+
         For a MarketEvent, the Strategy object is told to recalculate new
         signals, while the Portfolio object is told to reindex the time. If a
         SignalEvent Object is received the Portfolio is told to handle the new
@@ -102,10 +270,19 @@ class Backtest(object):
         """
 
         cycle = 0
+        event_handlers = self.event_handlers
+
+        # A historical run follows a simulated clock, it never sleeps and
+        # only reports its progress once a second
+        if not self.live:
+            progress = ProgressReporter(self.data_handler.get_total_bars())
 
         while True:
             cycle += 1
-            print cycle
+            if self.live:
+                print(cycle)
+            else:
+                progress.update(cycle - 1)
 
             # Update the market bars
             if self.data_handler.continue_backtest == True:
@@ -121,50 +298,113 @@ class Backtest(object):
                     break
                 else:
                     if event is not None:
-                        if event.type == 'MARKET':
-                            self.strategy.calculate_signals(event)
-                            self.portfolio.update_timeindex(event)
+                        for handler in event_handlers.get(type(event), ()):
+                            handler(event)
 
-                        elif event.type == 'SIGNAL':
-                            self.signals += 1
-                            self.portfolio.update_signal(event)
+            # The online statistics of the portfolio are up to date here
+            if self.stop_condition is not None and \
+                    self.stop_condition(self.portfolio):
+                self.stopped_early = True
+                break
 
-                        elif event.type == 'ORDER':
-                            self.orders += 1
-                            self.execution_handler.execute_order(event)
+            if self.live:
+                time.sleep(self.heartbeat)
 
-                        elif event.type == 'FILL':
-                            self.fills += 1
-                            self.portfolio.update_fill(event)
+        # The last two cycles found the data exhausted and pushed no bar
+        if not self.live:
+            progress.finish(cycle if self.stopped_early else max(cycle - 2, 0))
 
-            time.sleep(self.heartbeat)
+    def _run_vectorized_backtest(self):
+        """
+        The vectorized counterpart of _run_backtest. Rather than drip feeding
+        bars through the event queue, the Strategy is asked for its signals
+        over the whole bar panel at once and the Portfolio turns them into
+        positions, holdings and the equity curve in a single pass of NumPy
+        array operations.
+
+        This is only valid for strategies whose signals do not depend on the
+        state of the portfolio (fills, cash, position sizing), such as the
+        Moving Average Crossover. For those it gives the same equity curve as
+        the event-driven loop in a fraction of the time.
+
+        Several strategies can only be vectorized with a Portfolio each.
+        """
+
+        if len(self.portfolio_list) != self.num_strats:
+            raise ValueError(
+                "Vectorized backtests need one Portfolio per strategy"
+            )
+
+        self.signals = self.fills = 0
+        for strategy in self.strategies:
+            signals = strategy.calculate_vectorized_signals()
+            self.signals += int(signals.notnull().values.sum())
+
+            portfolio = self.portfolios[strategy.strategy_id]
+            self.fills += portfolio.create_vectorized_equity_curve_dataframe(
+                signals
+            )
+        self.orders = self.fills
 
     def _output_performance(self):
         """
         Once the backtest simulation is complete the performance of the
         strategy can be displayed to the terminal/console. The pandas DataFrame
-        representing the Equity curve can be created along with summary
-        statistics
+        representing the Equity curve must already have been created, the
+        summary statistics are created here
         """
 
-        self.portfolio.create_equity_curve_dataframe()
+        for i, portfolio in enumerate(self.portfolio_list):
+            equity_filename = 'equity.csv'
+            if len(self.portfolio_list) > 1:
+                strategy = self.strategies[i]
+                print("Strategy %d: %s" % (
+                    strategy.strategy_id, type(strategy).__name__
+                ))
+                equity_filename = 'equity_%d.csv' % strategy.strategy_id
 
-        print("Creating summary statistics...")
-        stats = self.portfolio.output_summary_stats()
+            print("Creating summary statistics...")
+            stats = portfolio.output_summary_stats(equity_filename)
 
-        print("Creating the Equity curve (display tail(10))...")
-        print(self.portfolio.equity_curve.tail(10))
-        pprint.pprint(stats)
+            print("Creating the Equity curve (display tail(10))...")
+            print(portfolio.equity_curve.tail(10))
+            pprint.pprint(stats)
 
         print("Signals generated: %s" % self.signals)
         print("Order generated: %s" % self.orders)
-        print("Fills: %s" self.fills)
+        print("Fills: %s" % self.fills)
+
+    def run_backtest(self, vectorized=False):
+        """
+        Runs the backtest and creates the equity curve of the portfolio,
+        without any performance output
+
+        Parameters:
+            vectorized - If True run the whole backtest as array operations
+            over the full bar panel (see _run_vectorized_backtest) instead of
+            the event-driven loop
+        """
 
-    def simulate_trading(self):
+        if vectorized:
+            if self.stop_condition is not None:
+                raise ValueError(
+                    "A stop_condition needs the event-driven loop, it cannot "
+                    "be checked bar by bar in a vectorized backtest"
+                )
+            self._run_vectorized_backtest()
+        else:
+            self._run_backtest()
+            for portfolio in self.portfolio_list:
+                portfolio.create_equity_curve_dataframe()
+
+    def simulate_trading(self, vectorized=False):
         """
         Runs the backtest then output performance methods sequentially
+
+        Parameters:
+            vectorized - See run_backtest
         """
 
-        self._run_backtest()
-        self.output_performance()
+        self.run_backtest(vectorized)
+        self._output_performance()
 
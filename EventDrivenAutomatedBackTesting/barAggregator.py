@@ -0,0 +1,350 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#==========================================================
+#==================== barAggregator.py ====================
+#==========================================================
+
+# Purpose
+#----------------------------------------------------------
+# The HFT data handlers consume minute bars built by DTN IQFeed. The
+# BarAggregator builds OHLCV bars of any interval (1s, 5s, 1m, 5m, ...) from
+# a stream of ticks or trades instead, in a single pass and keeping only the
+# bar being built, so many bar resolutions can be generated from one tick
+# archive (see tickStore.py):
+#
+#   write_tick_bars  - offline, aggregates the ticks of a TickStore into a
+#                      CSV file in the IQFeed layout read by
+#                      HistoricCSVDataHandlerHFT (and write_bar_store)
+#   TickBarFeed      - online, turns an asynchronous tick stream into the
+#                      bar updates a LiveFeedDataHandler is fed with by the
+#                      LiveEngine (see liveEngine.py)
+#
+# Bars are stamped with the time their interval closes, like the IQFeed
+# minute bars, and intervals without any tick produce no bar (the data
+# handlers pad them).
+
+from __future__ import print_function
+
+import os, os.path
+import re
+
+import numpy as np
+
+from dataHandler import Bar
+
+# A completed bar, stamped in nanoseconds since the epoch
+BAR_DTYPE = np.dtype([
+    ('timestamp', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<i8'),
+])
+
+INTERVAL_UNITS = {
+    's': 10**9, 'm': 60 * 10**9, 'h': 3600 * 10**9, 'd': 86400 * 10**9
+}
+
+def parse_interval(interval):
+    """
+    Converts a bar interval into nanoseconds
+
+    Parameters:
+        interval - A string such as '1s', '5s', '1m', '5m', '1h' or '1d', a
+        number of seconds or a numpy timedelta64
+    """
+
+    if isinstance(interval, np.timedelta64):
+        ns = int(interval.astype('timedelta64[ns]').astype(np.int64))
+    elif isinstance(interval, str):
+        match = re.match(r'^\s*(\d+)\s*([smhd])\s*$', interval.lower())
+        if match is None:
+            raise ValueError("Unknown bar interval %r" % interval)
+        ns = int(match.group(1)) * INTERVAL_UNITS[match.group(2)]
+    else:
+        ns = int(round(interval * 10**9))
+    if ns <= 0:
+        raise ValueError("The bar interval must be positive")
+    return ns
+
+class BarAggregator(object):
+    """
+    Aggregates the ticks of one symbol into bars of a fixed interval. Ticks
+    are either fed one at a time with update, or an array at a time with
+    update_chunk, which works on whole arrays with NumPy. Only the bar being
+    built is kept between calls.
+    """
+
+    def __init__(self, interval):
+        """
+        Parameters:
+            interval - The bar interval, see parse_interval
+        """
+
+        self.interval = parse_interval(interval)
+        self.bucket = None # The interval of the bar being built
+        self.bar = None # [open, high, low, close, volume] of that bar
+
+    def _completed(self):
+        """
+        Returns the bar being built as a BAR_DTYPE tuple
+        """
+
+        return ((self.bucket + 1) * self.interval,) + tuple(self.bar)
+
+    def update(self, timestamp, price, size):
+        """
+        Adds a tick
+
+        Parameters:
+            timestamp - The time of the tick in nanoseconds since the epoch,
+            not earlier than the previous tick
+            price - The price of the tick
+            size - The quantity traded
+
+        Returns:
+            The bar completed by the tick as a BAR_DTYPE tuple, or None
+        """
+
+        bucket = timestamp // self.interval
+        if bucket == self.bucket:
+            bar = self.bar
+            if price > bar[1]:
+                bar[1] = price
+            elif price < bar[2]:
+                bar[2] = price
+            bar[3] = price
+            bar[4] += size
+            return None
+
+        completed = None
+        if self.bucket is not None:
+            completed = self._completed()
+        self.bucket = bucket
+        self.bar = [price, price, price, price, size]
+        return completed
+
+    def update_chunk(self, timestamps, prices, sizes):
+        """
+        Adds an array of ticks at once
+
+        Parameters:
+            timestamps - The times of the ticks in nanoseconds, in order
+            prices - The prices of the ticks
+            sizes - The quantities traded
+
+        Returns:
+            The bars completed by the ticks, as a BAR_DTYPE array
+        """
+
+        if len(timestamps) == 0:
+            return np.zeros(0, dtype=BAR_DTYPE)
+
+        prices = np.asarray(prices, dtype=np.float64)
+        sizes = np.asarray(sizes, dtype=np.int64)
+        buckets = np.asarray(timestamps, dtype=np.int64) // self.interval
+
+        # The first tick of each interval
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        ends = np.r_[starts[1:], len(buckets)] - 1
+
+        bars = np.empty(len(starts), dtype=BAR_DTYPE)
+        bars['timestamp'] = (buckets[starts] + 1) * self.interval
+        bars['open'] = prices[starts]
+        bars['high'] = np.maximum.reduceat(prices, starts)
+        bars['low'] = np.minimum.reduceat(prices, starts)
+        bars['close'] = prices[ends]
+        bars['volume'] = np.add.reduceat(sizes, starts)
+
+        # The bar left over from the previous chunk either continues into
+        # the first interval of this one or is complete
+        if self.bucket is not None:
+            if self.bucket == buckets[0]:
+                first = bars[0]
+                first['open'] = self.bar[0]
+                first['high'] = max(first['high'], self.bar[1])
+                first['low'] = min(first['low'], self.bar[2])
+                first['volume'] += self.bar[4]
+            else:
+                bars = np.concatenate(
+                    [np.array([self._completed()], dtype=BAR_DTYPE), bars]
+                )
+
+        # The last interval may still get more ticks
+        last = bars[-1]
+        self.bucket = int(buckets[-1])
+        self.bar = [
+            float(last['open']), float(last['high']), float(last['low']),
+            float(last['close']), int(last['volume'])
+        ]
+        return bars[:-1]
+
+    def flush(self):
+        """
+        Completes the bar being built, at the end of the tick stream
+
+        Returns:
+            The bar as a BAR_DTYPE tuple, or None if there is none
+        """
+
+        if self.bucket is None:
+            return None
+        completed = self._completed()
+        self.bucket = None
+        self.bar = None
+        return completed
+
+def to_bar_record(bar, bar_record=Bar):
+    """
+    Converts a BAR_DTYPE bar into a bar record of the data handlers, e.g.
+    Bar or BarHFT. An adj_close is the close and any other field not in a
+    BAR_DTYPE bar (e.g. the open interest) is 0.
+
+    Parameters:
+        bar - A BAR_DTYPE tuple or record
+        bar_record - The namedtuple class of the bar records
+    """
+
+    timestamp, o, h, l, c, v = tuple(bar)
+    values = {
+        'datetime': np.datetime64(int(timestamp), 'ns').astype(
+            'datetime64[us]').item(),
+        'open': o, 'high': h, 'low': l, 'close': c, 'volume': v,
+        'adj_close': c,
+    }
+    return bar_record(*[values.get(f, 0) for f in bar_record._fields])
+
+# The column layout of the IQFeed minute bar CSV files
+IQFEED_CSV_COLUMNS = [
+    'datetime', 'open', 'low', 'high', 'close', 'volume', 'oi'
+]
+
+def write_bar_csv(f, bars, columns=IQFEED_CSV_COLUMNS):
+    """
+    Writes BAR_DTYPE bars to an open CSV file, in a given column layout.
+    Columns not in a BAR_DTYPE bar are written as 0.
+
+    Parameters:
+        f - The open (text) file
+        bars - A BAR_DTYPE array
+        columns - The CSV column names, the first one being the datetime
+    """
+
+    if len(bars) == 0:
+        return
+    datetimes = np.datetime_as_string(
+        bars['timestamp'].view('datetime64[ns]'), unit='s'
+    )
+    values = [
+        bars[c] if c in BAR_DTYPE.names else np.zeros(len(bars), dtype=int)
+        for c in columns[1:]
+    ]
+    for row in zip(datetimes, *[v.tolist() for v in values]):
+        f.write(row[0].replace('T', ' '))
+        f.write(',%s' * len(values) % row[1:])
+        f.write('\n')
+
+def write_tick_bars(store, symbol, interval, csv_path, start=None,
+        end=None, columns=IQFEED_CSV_COLUMNS):
+    """
+    Aggregates the ticks of a symbol in a TickStore into bars and writes
+    them to a CSV file, one chunk of ticks at a time
+
+    Parameters:
+        store - The TickStore
+        symbol - The symbol string
+        interval - The bar interval, see parse_interval
+        csv_path - The CSV file to write, e.g. csv_dir/SYMBOL.csv
+        start, end - The time range of the ticks, see TickStore.iter_chunks
+        columns - The CSV column layout, by default that of the IQFeed
+        minute bars
+
+    Returns:
+        The number of bars written
+    """
+
+    directory = os.path.dirname(csv_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    aggregator = BarAggregator(interval)
+    n_bars = 0
+    with open(csv_path, 'w') as f:
+        f.write(','.join(columns) + '\n')
+        for ticks in store.iter_chunks(symbol, start, end):
+            bars = aggregator.update_chunk(
+                ticks['timestamp'], ticks['price'], ticks['size']
+            )
+            write_bar_csv(f, bars, columns)
+            n_bars += len(bars)
+
+        last = aggregator.flush()
+        if last is not None:
+            write_bar_csv(f, np.array([last], dtype=BAR_DTYPE), columns)
+            n_bars += 1
+    return n_bars
+
+class TickBarFeed(object):
+    """
+    Asynchronous feed of bar updates aggregated from an asynchronous tick
+    stream, for a LiveFeedDataHandler run by the LiveEngine.
+
+    The ticks of all the symbols share the interval boundaries: the first
+    tick past the current interval completes it, and the bars of every
+    symbol traded during it are yielded as one {symbol: bar record} update.
+    The last interval is completed at the end of the stream.
+    """
+
+    def __init__(self, ticks, symbol_list, interval, bar_record=Bar):
+        """
+        Parameters:
+            ticks - An asynchronous iterable of (timestamp, symbol, price,
+            size) tuples in timestamp order, timestamps in nanoseconds
+            symbol_list - The symbols to make bars of, others are ignored
+            interval - The bar interval, see parse_interval
+            bar_record - The namedtuple class of the bar records
+        """
+
+        self.ticks = ticks
+        self.bar_record = bar_record
+        self.interval = parse_interval(interval)
+        self.aggregators = dict(
+            (s, BarAggregator(interval)) for s in symbol_list
+        )
+
+    def __aiter__(self):
+        return self._aggregate()
+
+    def _complete(self):
+        """
+        Completes the bars of the current interval
+        """
+
+        bars = {}
+        for s, aggregator in self.aggregators.items():
+            bar = aggregator.flush()
+            if bar is not None:
+                bars[s] = to_bar_record(bar, self.bar_record)
+        return bars
+
+    async def _aggregate(self):
+        interval = self.interval
+        aggregators = self.aggregators
+        bucket = None
+        async for timestamp, symbol, price, size in self.ticks:
+            aggregator = aggregators.get(symbol)
+            if aggregator is None:
+                continue
+            if timestamp // interval != bucket:
+                if bucket is not None:
+                    bars = self._complete()
+                    if bars:
+                        yield bars
+                bucket = timestamp // interval
+            aggregator.update(timestamp, price, size)
+
+        bars = self._complete()
+        if bars:
+            yield bars
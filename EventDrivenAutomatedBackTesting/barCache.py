@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#==========================================================
+#====================== barCache.py =======================
+#==========================================================
+
+# Purpose
+#----------------------------------------------------------
+# Parsing the dates of every symbol.csv file dominates the start up time of a
+# backtest over a large universe (e.g. the S&P500). Since the CSV files rarely
+# change between runs, the parsed bars are cached in a binary columnar NumPy
+# file (.npz) next to each CSV. The cache is keyed on the size and
+# modification time of the CSV, so a CSV that has been re-downloaded or edited
+# is detected as stale and the cache is simply rebuilt from it.
+
+from __future__ import print_function
+
+import os, os.path
+import numpy as np
+import pandas as pd
+
+def cache_path(csv_path):
+    """
+    Returns the path of the binary cache file belonging to a CSV file, which
+    lives in the same directory, i.e. 'AAPL.csv' -> 'AAPL.csv.npz'
+
+    Parameters:
+        csv_path - Path to the CSV file
+    """
+
+    return csv_path + '.npz'
+
+def _csv_key(csv_path):
+    """
+    Returns the (size, mtime) pair identifying the current version of a CSV
+    """
+
+    st = os.stat(csv_path)
+    return st.st_size, st.st_mtime
+
+def _load_cache(csv_path, columns):
+    """
+    Loads the cached bars of a CSV file as a DataFrame, or returns None if
+    there is no cache or it no longer matches the CSV file (or its layout).
+    """
+
+    path = cache_path(csv_path)
+    if not os.path.exists(path):
+        return None
+
+    size, mtime = _csv_key(csv_path)
+    try:
+        with np.load(path, allow_pickle=False) as cache:
+            if int(cache['csv_size']) != size or \
+                float(cache['csv_mtime']) != mtime or \
+                list(cache['columns']) != list(columns):
+                return None
+            index = pd.DatetimeIndex(cache['datetime'], name=columns[0])
+            return pd.DataFrame(
+                cache['values'], index=index, columns=columns[1:]
+            )
+    except (IOError, OSError, KeyError, ValueError):
+        # A corrupt or partially written cache is treated as stale
+        return None
+
+def _write_cache(csv_path, columns, bars):
+    """
+    Writes the parsed bars of a CSV file to its cache. The file is first
+    written under a temporary name and then renamed over the cache, so a
+    concurrent reader never sees a half written cache. Failing to write (e.g.
+    a read-only data directory, or a column which is not numeric) is not
+    fatal, the CSV will just be parsed again next time.
+    """
+
+    size, mtime = _csv_key(csv_path)
+    path = cache_path(csv_path)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                datetime=bars.index.values.astype('datetime64[ns]'),
+                values=np.ascontiguousarray(bars.values, dtype=np.float64),
+                columns=np.array(columns),
+                csv_size=np.int64(size),
+                csv_mtime=np.float64(mtime)
+            )
+        # os.replace, unlike os.rename, overwrites an existing cache on
+        # Windows too
+        os.replace(tmp_path, path)
+    except (IOError, OSError, TypeError, ValueError) as e:
+        print("Could not write the bar cache %s: %s" % (path, e))
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def read_csv_bars(csv_path, columns, use_cache=True):
+    """
+    Reads a bar CSV file into a pandas DataFrame indexed on datetime and
+    sorted, going through the binary cache when possible.
+
+    Parameters:
+        csv_path - Path to the CSV file
+        columns - The CSV column names, the first one being the datetime
+        use_cache - Whether to read and (re)build the binary cache
+    """
+
+    if use_cache:
+        bars = _load_cache(csv_path, columns)
+        if bars is not None:
+            return bars
+
+    bars = pd.io.parsers.read_csv(
+        csv_path, header=0, index_col=0, parse_dates=True, names=columns
+    ).sort_index()
+
+    if use_cache:
+        _write_cache(csv_path, columns, bars)
+    return bars
@@ -0,0 +1,133 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#==========================================================
+#====================== barStore.py =======================
+#==========================================================
+
+# Purpose
+#----------------------------------------------------------
+# Years of DTN IQFeed minute bars over a few hundred symbols do not fit in
+# memory. This file implements a simple on-disk bar store which the data
+# handlers can memory map instead of loading:
+#
+#   store_dir/datetime.npy  - datetime64[ns] array of the common bar index
+#   store_dir/columns.npy   - the bar field names, in column order
+#   store_dir/SYMBOL.npy    - float64 array, one row per bar, one column per
+#                             field, already padded onto the common index
+#
+# Plain .npy files keep the store readable with np.load(..., mmap_mode='r').
+# The MappedArray below maps them itself so that the pages behind the bar
+# cursor can be handed back to the operating system, keeping the resident
+# memory of a backtest flat whatever the length of the history.
+
+from __future__ import print_function
+
+import mmap
+import os, os.path
+import numpy as np
+
+from barCache import read_csv_bars
+
+def write_bar_store(csv_dir, symbol_list, store_dir, columns):
+    """
+    Converts the 'symbol.csv' files of csv_dir into a bar store, padding
+    every symbol onto the union of all the datetimes exactly as the historic
+    CSV data handlers do. Only one symbol is held in memory at a time.
+
+    Parameters:
+        csv_dir - Absolute directory path to the CSV files
+        symbol_list - A list of symbol strings
+        store_dir - The directory to write the store to
+        columns - The CSV column names, the first one being the datetime
+    """
+
+    if not os.path.exists(store_dir):
+        os.makedirs(store_dir)
+
+    def csv_path(s):
+        return os.path.join(csv_dir, '%s.csv' % s)
+
+    # First pass, the common index
+    comb_index = None
+    for s in symbol_list:
+        index = read_csv_bars(csv_path(s), columns).index
+        if comb_index is None:
+            comb_index = index
+        else:
+            comb_index = comb_index.union(index)
+
+    np.save(os.path.join(store_dir, 'datetime.npy'),
+        comb_index.values.astype('datetime64[ns]'))
+    np.save(os.path.join(store_dir, 'columns.npy'), np.array(columns[1:]))
+
+    # Second pass, the padded bars of each symbol
+    for s in symbol_list:
+        bars = read_csv_bars(csv_path(s), columns).reindex(
+            index=comb_index, method='pad'
+        )
+        np.save(os.path.join(store_dir, '%s.npy' % s),
+            np.ascontiguousarray(bars.values, dtype=np.float64))
+
+def read_store_columns(store_dir):
+    """
+    Returns the list of bar field names of a bar store
+    """
+
+    return [str(c) for c in np.load(os.path.join(store_dir, 'columns.npy'))]
+
+class MappedArray(object):
+    """
+    A read-only, memory mapped view of a C-ordered .npy file.
+
+    Pages are only read from disk when the array is accessed. Since bars are
+    consumed strictly in order, release() lets the pages before a given row
+    be dropped from memory again, where the platform supports it.
+    """
+
+    def __init__(self, path):
+        """
+        Maps the .npy file at path
+
+        Parameters:
+            path - Path to the .npy file
+        """
+
+        with open(path, 'rb') as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran, dtype = \
+                    np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran, dtype = \
+                    np.lib.format.read_array_header_2_0(f)
+            if fortran:
+                raise ValueError("%s is not C-ordered" % path)
+            self.offset = f.tell()
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # Tell the kernel to read ahead, the bars are consumed in order
+        if hasattr(mmap, 'MADV_SEQUENTIAL'):
+            self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+
+        count = int(np.prod(shape))
+        self.array = np.frombuffer(
+            self._mmap, dtype=dtype, count=count, offset=self.offset
+        ).reshape(shape)
+        self.row_bytes = self.array.strides[0] if len(shape) > 0 else 0
+
+    def release(self, row):
+        """
+        Drops the (whole) pages holding the rows before row from memory. They
+        are transparently read back from disk if accessed again.
+
+        Parameters:
+            row - The first row which is still needed
+        """
+
+        if not hasattr(mmap, 'MADV_DONTNEED'):
+            return
+        end = self.offset + row * self.row_bytes
+        end -= end % mmap.PAGESIZE
+        if end > 0:
+            self._mmap.madvise(mmap.MADV_DONTNEED, 0, end)
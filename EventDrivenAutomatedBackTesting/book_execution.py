@@ -0,0 +1,295 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#==========================================================
+#=================== book_execution.py ====================
+#==========================================================
+
+# Purpose
+#----------------------------------------------------------
+# The SimulatedExecutionHandler fills every order in full at once, whatever
+# the liquidity. The BookReplayExecutionHandler instead rebuilds the limit
+# order book of every symbol traded from its recorded messages (see
+# orderBook.py) and fills the orders of the strategy against it:
+#
+#   Market orders    - trade with the recorded depth of the opposite side at
+#                      the time of the order, walking the price levels; what
+#                      the book cannot fill is cancelled
+#   Limit orders     - trade with the opposite side up to their price, the
+#                      rest joins the back of the queue of its level and is
+#                      filled as the recorded executions and trades reach
+#                      it, or as recorded orders crossing it are added
+#
+# The orders of the strategy do not take liquidity away from the recorded
+# orders, which keep being updated by their own messages. The recorded
+# levels a limit order traded with therefore stay in the book, and the rest
+# of a limit order which traded through the opposite side is capped one
+# tick short of its best price, so the book is never crossed.
+#
+# The recorded messages of each symbol are kept in a NumPy .npy file,
+# <message_dir>/<symbol>.npy, of MESSAGE_DTYPE records in timestamp order:
+#
+#   ADD      - A new order (order_id, side, price, quantity)
+#   EXECUTE  - A resting order traded (order_id, quantity)
+#   REDUCE   - Part of a resting order cancelled (order_id, quantity)
+#   DELETE   - A resting order cancelled (order_id)
+#   TRADE    - A trade against the orders resting at a price, when the
+#              orders themselves are not known, e.g. tick data (side of the
+#              resting orders, price, quantity)
+#
+# The book is brought up to date with the timestamp of every MarketEvent,
+# the files being read through memory maps and replayed in chunks.
+
+from __future__ import print_function
+
+import datetime as dt
+import os
+
+import numpy as np
+
+from event import FillEvent, OrderStatusEvent
+from execution import ExecutionHandler
+from orderBook import OrderBook, BUY, SELL
+
+ADD, EXECUTE, REDUCE, DELETE, TRADE = range(5)
+
+MESSAGE_DTYPE = np.dtype([
+    ('timestamp', '<i8'), # Nanoseconds since the epoch
+    ('kind', 'i1'),
+    ('side', 'i1'), # BUY (1) or SELL (-1)
+    ('order_id', '<i8'),
+    ('price', '<f8'),
+    ('quantity', '<i8'),
+])
+
+def write_book_messages(path, messages):
+    """
+    Saves the recorded book messages of a symbol
+
+    Parameters:
+        path - The .npy file to write
+        messages - A structured array (or list of tuples) of MESSAGE_DTYPE,
+        in timestamp order
+    """
+
+    messages = np.asarray(messages, dtype=MESSAGE_DTYPE)
+    if len(messages) and np.any(np.diff(messages['timestamp']) < 0):
+        raise ValueError("Book messages must be in timestamp order")
+    np.save(path, messages)
+
+def read_book_messages(path, mmap=True):
+    """
+    Loads the recorded book messages of a symbol
+
+    Parameters:
+        path - The .npy file written by write_book_messages
+        mmap - Whether to map the file rather than read it into memory
+    """
+
+    messages = np.load(path, mmap_mode='r' if mmap else None)
+    if messages.dtype != MESSAGE_DTYPE:
+        raise ValueError("%s does not hold book messages" % path)
+    return messages
+
+class BookReplay(object):
+    """
+    Replays the recorded messages of one symbol through an OrderBook
+    """
+
+    chunk_size = 65536 # The number of messages converted at a time
+
+    def __init__(self, messages, tick_size=0.01):
+        """
+        Parameters:
+            messages - The MESSAGE_DTYPE array, see read_book_messages
+            tick_size - The minimum price increment of the symbol
+        """
+
+        self.messages = messages
+        self.timestamps = messages['timestamp']
+        self.book = OrderBook(tick_size)
+        self.cursor = 0
+
+    def replay_until(self, timestamp):
+        """
+        Applies every message up to and including a timestamp
+
+        Parameters:
+            timestamp - Nanoseconds since the epoch
+
+        Returns:
+            A list of (order_id, quantity, price) filled of the own orders
+        """
+
+        end = int(np.searchsorted(self.timestamps, timestamp, side='right'))
+        fills = []
+        while self.cursor < end:
+            stop = min(self.cursor + self.chunk_size, end)
+            self._apply(self.messages[self.cursor:stop], fills)
+            self.cursor = stop
+        return fills
+
+    def _apply(self, chunk, fills):
+        """
+        Applies a chunk of messages. The columns are converted to lists
+        first, iterating over them is several times faster than over the
+        array records.
+        """
+
+        book = self.book
+        add, execute, reduce, cancel, trade = \
+            book._add, book.execute, book.reduce, book.cancel, book.trade
+        match_own, own_heaps = book.match_own, book.own_heaps
+        ticks = np.rint(chunk['price'] / book.tick_size).astype(np.int64)
+
+        for kind, side, order_id, tick, price, quantity in zip(
+                chunk['kind'].tolist(), chunk['side'].tolist(),
+                chunk['order_id'].tolist(), ticks.tolist(),
+                chunk['price'].tolist(), chunk['quantity'].tolist()):
+            if kind == ADD:
+                if own_heaps[-side]:
+                    filled = match_own(side, tick, quantity)
+                    if filled:
+                        fills.extend(filled)
+                add(order_id, side, tick, quantity)
+            elif kind == EXECUTE:
+                filled = execute(order_id, quantity)
+                if filled:
+                    fills.extend(filled)
+            elif kind == DELETE:
+                cancel(order_id)
+            elif kind == REDUCE:
+                reduce(order_id, quantity)
+            elif kind == TRADE:
+                filled = trade(side, price, quantity)
+                if filled:
+                    fills.extend(filled)
+
+class BookReplayExecutionHandler(ExecutionHandler):
+    """
+    Fills orders against the order books rebuilt from the recorded messages
+    of every symbol, see the Purpose above.
+
+    The handler follows the timestamps of the MarketEvents, which the
+    Backtest sends it through update_timeindex. As the Backtest constructs
+    the execution handler from the Event Queue only, the other parameters
+    are bound beforehand, e.g.
+    functools.partial(BookReplayExecutionHandler, message_dir='/data/book')
+
+    The own orders are given negative order IDs, recorded orders are
+    expected to have positive ones.
+    """
+
+    exchange = 'SIM'
+
+    def __init__(self, events, message_dir, tick_size=0.01):
+        """
+        Parameters:
+            events - The Queue of Event objects
+            message_dir - The directory of the <symbol>.npy message files
+            tick_size - The minimum price increment of the symbols
+        """
+
+        self.events = events
+        self.message_dir = message_dir
+        self.tick_size = tick_size
+
+        self.replays = {}
+        self.own_orders = {} # Order ID -> OrderEvent of the resting orders
+        self.next_order_id = -1
+        self.timestamp = None # Nanoseconds since the epoch
+        self.datetime = None
+
+    def _replay(self, symbol):
+        """
+        Returns the BookReplay of a symbol, loading its messages and
+        replaying them up to the current time the first time it is traded
+        """
+
+        replay = self.replays.get(symbol)
+        if replay is None:
+            replay = BookReplay(read_book_messages(
+                os.path.join(self.message_dir, '%s.npy' % symbol)
+            ), self.tick_size)
+            if self.timestamp is not None:
+                replay.replay_until(self.timestamp)
+            self.replays[symbol] = replay
+        return replay
+
+    def update_timeindex(self, event):
+        """
+        Brings the books of the symbols traded so far up to the time of a
+        MarketEvent, filling the resting own orders reached meanwhile
+
+        Parameters:
+            event - A MarketEvent carrying its datetime
+        """
+
+        if event.datetime is None:
+            return
+        self.datetime = event.datetime
+        self.timestamp = int(
+            np.datetime64(event.datetime, 'ns').astype(np.int64)
+        )
+        for replay in self.replays.values():
+            fills = replay.replay_until(self.timestamp)
+            for order_id, quantity, price in fills:
+                self._fill(self.own_orders[order_id], quantity, price)
+            # Forget the orders filled in full
+            for order_id, _, _ in fills:
+                if order_id not in replay.book:
+                    self.own_orders.pop(order_id, None)
+
+    def _fill(self, order, quantity, price):
+        """
+        Puts a FillEvent for part of an own order on the Event Queue
+        """
+
+        self.events.put(FillEvent(
+            self.datetime or dt.datetime.utcnow(), order.symbol,
+            self.exchange, quantity, order.direction, price,
+            strategy_id=order.strategy_id
+        ))
+
+    def execute_order(self, event):
+        """
+        Trades an order with the current book of its symbol, resting what is
+        left of a limit order in the book and cancelling what is left of a
+        market order
+
+        Parameters:
+            event - Contains an Event object with order information
+        """
+
+        if event.type != 'ORDER':
+            return
+
+        book = self._replay(event.symbol).book
+        side = BUY if event.direction == 'BUY' else SELL
+        price = event.price if event.order_type == 'LMT' else None
+        order_id = self.next_order_id
+        self.next_order_id -= 1
+
+        # A single fill at the average price of the levels traded with
+        trades = book.sweep(side, event.quantity, price)
+        filled = sum(q for _, q in trades)
+        if filled:
+            self._fill(event, filled, sum(p * q for p, q in trades) / filled)
+
+        remaining = event.quantity - filled
+        if remaining <= 0:
+            return
+        if price is None:
+            self.events.put(OrderStatusEvent(
+                order_id, event.symbol, 'CANCELLED', event.strategy_id
+            ))
+            return
+
+        # The recorded levels traded with are still in the book, rest one
+        # tick short of the opposite side rather than crossing it
+        best = book.best_ask() if side == BUY else book.best_bid()
+        if best is not None and (book.to_ticks(price) -
+                book.to_ticks(best)) * side >= 0:
+            price = book.to_price(book.to_ticks(best) - side)
+        book.add(order_id, side, price, remaining, own=True)
+        self.own_orders[order_id] = event
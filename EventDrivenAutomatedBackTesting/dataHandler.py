@@ -19,12 +19,16 @@
 from __future__ import print_function
 
 from abc import ABCMeta, abstractmethod
+from collections import deque, namedtuple
+from itertools import islice
 import datetime as dt
 import os, os.path
-import numpy as mp
+import numpy as np
 import pandas as pd
 
+from barCache import read_csv_bars
 from event import MarketEvent
+from ringBuffer import RingBuffer
 
 class DataHandler(object):
     """
@@ -73,12 +77,19 @@ class DataHandler(object):
         raise NotImplementedError("Should implement get_latest_bar_value()")
 
     @abstractmethod
-    def get_latest_bar_values(self, symbol, val_type, N=1):
+    def get_latest_bars_values(self, symbol, val_type, N=1):
         """
         Returns the last N bar values from the latest_symbol list, or N-k if N
         is not fully available
         """
-        raise NotImplementedError("Should implement get_latest_bar_values()")
+        raise NotImplementedError("Should implement get_latest_bars_values()")
+
+    def get_total_bars(self):
+        """
+        Returns the total number of bars that will be pushed, or None if it
+        is not known in advance (e.g. a live feed)
+        """
+        return None
 
     @abstractmethod
     def update_bars(self):
@@ -99,83 +110,141 @@ class DataHandler(object):
 # a simpler mechanism of importing (potentially large) CSV files. This will help
 # us focus on the data handler itself.
 
-class HistoricCSVDateaHandler(DataHandler):
+# A bar handed out by the historic data handlers. A named tuple is far
+# cheaper to build than the pandas Series produced by iterrows() and still
+# allows access by field name, e.g. bar.adj_close, or by position, bar[0]
+Bar = namedtuple(
+    'Bar', ['datetime', 'open', 'high', 'low', 'close', 'volume', 'adj_close']
+)
+
+class HistoricCSVDataHandler(DataHandler):
     """
     HistoricCSVDataHandler is designed to read  CSV files for each requested
     symbol from disk and provide an interface to obtain the "latest" bar in a
     manner identical to a live trading interface
-    """
 
-    def __init__(self, events, csv_dir, symbol_list):
+    Once loaded, the bars of each symbol are kept as one contiguous NumPy
+    array (one row per bar, one column per field) and a single integer cursor,
+    bar_index, marks the next bar to be pushed for all symbols.
     """
-    Initializes the historic data handler by requesting the location of the CSV
-    files and a list of symbols
 
-    It will be assumed that all filenames are of the form 'symbol.csv', where
-    symbol is a string in the list.
+    # The CSV column layout and the record type bars are handed out as.
+    # Subclasses for other data vendors only need to override these
+    csv_columns = [
+        'datetime', 'open', 'high', 'low', 'close', 'volume', 'adj_close'
+    ]
+    bar_record = Bar
+
+    def __init__(self, events, csv_dir, symbol_list, max_lookback=1000,
+        use_cache=True):
+        """
+        Initializes the historic data handler by requesting the location of the CSV
+        files and a list of symbols
 
-    Parameters:
-        events - The Event Queue
-        csv_dir - Absolute directory path to the CSV files
-        symbol_list - A list of symbol strings
+        It will be assumed that all filenames are of the form 'symbol.csv', where
+        symbol is a string in the list.
 
-    """
+        Only the latest max_lookback bars of each symbol are kept in memory,
+        requests for more bars than that return max_lookback bars.
 
-    self.events = events
-    self.csv_dir = csv_dir
-    self.symbol_list = symbol_list
+        Parameters:
+            events - The Event Queue
+            csv_dir - Absolute directory path to the CSV files
+            symbol_list - A list of symbol strings
+            max_lookback - The maximum number of bars kept per symbol
+            use_cache - Whether to go through the binary cache of the parsed
+            CSV files (see barCache.py)
 
-    self.symbol_data = {}
-    self.latest_symbol_data = {}
-    self.continue_backtest = True
-    self.bar_index = 0
+        """
+
+        self.events = events
+        self.csv_dir = csv_dir
+        self.symbol_list = symbol_list
+        self.max_lookback = max_lookback
+        self.use_cache = use_cache
+
+        self.bar_fields = self.csv_columns[1:]
+        self.bar_datetimes = None
+        self.symbol_data = {}
+        self.latest_symbol_data = {}
+        self.latest_symbol_values = {}
+        self.continue_backtest = True
+        self.bar_index = 0
 
-    self._open_convert_csv_files()
+        self._open_convert_csv_files()
 
     def _open_convert_csv_files(self):
         """
         Opens the CSV files from the data directory, converting them into
-        pandas DataFrames within a symbol dictionary.
+        NumPy arrays within a symbol dictionary.
 
         For this handler it will be assumed that the data is pulled from
         Yahoo finance, therefore the CSVs will follow a very consistent
         layout
         """
 
+        frames = {}
         comb_index = None
         for s in self.symbol_list:
-            # Load in the CSV file with no header information, indexed on date
-            self.symbol_data[s] = pd.io.parsers.read_csv(
+            # Load in the CSV file with no header information, indexed on
+            # date. Only parsed once, later runs read the binary cache
+            frames[s] = read_csv_bars(
                 os.path.join(self.csv_dir, '%s.csv' % s),
-                header=0, index_col=0, parse_dates=True,
-                names=[
-                    'datetime', 'open', 'high', 'low', 'close', 'volume',
-                    'adj_close'
-                ]
-            ).sort()
+                self.csv_columns, use_cache=self.use_cache
+            )
 
             # Combine the index to pad forward values
-            if _comb_index is None:
-                comb_index = self.symbol_data[s].index
+            if comb_index is None:
+                comb_index = frames[s].index
             else:
-                comb_index.union(self.symbol_data[s].index)
+                comb_index = comb_index.union(frames[s].index)
 
-            # Set the latest symbol_data to None
-            self.latest_symbol_data[s] = []
+            # Set the latest symbol_data to None, keeping at most
+            # max_lookback bars
+            self._init_latest(s)
 
-        # Reindex the dataframes
+        # Reindex the dataframes and keep only their values, as one
+        # contiguous float array per symbol
         # NOTE: can be updated with "prod" data.py
+        self.bar_datetimes = comb_index.to_pydatetime()
         for s in self.symbol_list:
-            self.symbol_data[s] = self.symbol_data[s].\
-                reindex(index=comb_index, method='pad').iterrows()
+            self.symbol_data[s] = np.ascontiguousarray(
+                frames[s].reindex(index=comb_index, method='pad')
+                [self.bar_fields].values, dtype=np.float64
+            )
+
+    def _init_latest(self, symbol):
+        """
+        Sets up the empty latest bar structures of a symbol: the deque of its
+        latest bar records and one preallocated ring buffer per bar field for
+        fast lookbacks, each keeping at most max_lookback bars
+        """
+
+        self.latest_symbol_data[symbol] = deque(maxlen=self.max_lookback)
+        self.latest_symbol_values[symbol] = dict(
+            (f, RingBuffer(self.max_lookback)) for f in self.bar_fields
+        )
+
+    def _check_lookback(self, N):
+        """
+        Raises a ValueError if more bars are asked for than are kept
+        """
+
+        if N > self.max_lookback:
+            raise ValueError(
+                "%d bars asked for but only the latest %d are kept, raise "
+                "max_lookback" % (N, self.max_lookback)
+            )
 
     def _get_new_bar(self, symbol):
         """
-        Returns the latest bar from the data feed
+        Returns the bar under the cursor from the data feed as a bar record
         """
 
-        for b in self.symbol_data[symbol]:
-            yield b
+        return self.bar_record(
+            self.bar_datetimes[self.bar_index],
+            *self.symbol_data[symbol][self.bar_index].tolist()
+        )
 
     def get_latest_bar(self, symbol):
         """
@@ -189,18 +258,19 @@ class HistoricCSVDateaHandler(DataHandler):
         else:
             return bars_list[-1]
 
-    def get_latest_bars(self, symbol, N-1):
+    def get_latest_bars(self, symbol, N=1):
         """
         Returns the last N bars from the latest_symbol list, or N-k if less
-        available
+        available. N cannot exceed max_lookback.
         """
+        self._check_lookback(N)
         try:
             bars_list = self.latest_symbol_data[symbol]
         except KeyError:
             print("That symbol is not available in the historical data set.")
             raise
         else:
-            return bars_list[-N:]
+            return list(islice(bars_list, max(len(bars_list) - N, 0), None))
 
     def get_latest_bar_datetime(self, symbol):
         """
@@ -209,8 +279,7 @@ class HistoricCSVDateaHandler(DataHandler):
         try:
             bars_list = self.latest_symbol_data[symbol]
         except KeyError:
-            print("That symbol is not available in the historical data
-            set.")
+            print("That symbol is not available in the historical data set.")
             raise
         else:
             return bars_list[-1][0]
@@ -218,43 +287,78 @@ class HistoricCSVDateaHandler(DataHandler):
     def get_latest_bar_value(self, symbol, val_type):
         """
         Returns one of the Open, High, Low, Close, Volume, or OI values from
-        the pandas Bar series object
+        the latest bar
         """
 
         try:
-            bars_list = self.latest_symbol_data[symbol]
+            values = self.latest_symbol_values[symbol]
         except KeyError:
             print("That symbol is not available in the historical data set.")
             raise
         else:
-            return getattr(bars_list[-1][1], val_type)
+            return values[val_type].last()
 
     def get_latest_bars_values(self, symbol, val_type, N=1):
         """
-        Returns the last N bar values from the latest_symbol list, or N-k if
-        less available
+        Returns the last N bar values from the latest_symbol ring buffers, or
+        N-k if less available. N cannot exceed max_lookback.
+
+        The returned NumPy array is a view on the ring buffer, not a copy. It
+        is only valid until the next call to update_bars.
         """
+        self._check_lookback(N)
         try:
-            bars_list = self.get_latest_bars(symbol, N)
+            values = self.latest_symbol_values[symbol]
         except KeyError:
             print("That symbol is not available in the historical data set.")
             raise
         else:
-            return np.array([getattr(b[1], val_type) for b in bars_list])
+            return values[val_type].latest(N)
+
+    def get_total_bars(self):
+        """
+        Returns the total number of bars in the (padded) historical data set
+        """
+        return len(self.bar_datetimes)
+
+    def get_bar_panel(self, val_type):
+        """
+        Returns the full (padded) history of one of the Open, High, Low,
+        Close, Volume, or OI values for every symbol as a pandas DataFrame
+        indexed on datetime with one column per symbol, in symbol_list order.
+
+        This bypasses the "drip feed" of update_bars and is only meant for the
+        vectorized backtest, where the strategy has no path dependence and can
+        see the whole panel at once.
+
+        Parameters:
+            val_type - The bar field, e.g. 'adj_close'
+        """
+
+        j = self.bar_fields.index(val_type)
+        return pd.DataFrame(
+            dict((s, self.symbol_data[s][:, j]) for s in self.symbol_list),
+            index=pd.DatetimeIndex(self.bar_datetimes, name='datetime'),
+            columns=self.symbol_list
+        )
 
     def update_bars(self):
         """
         Pushes the latest bar to the latest_symbol_data structure fo all
-        symbols in the symbol list
+        symbols in the symbol list, then advances the cursor
         """
 
-        for s in self.symbol_list:
-            try:
-                bar = next(self._get_new_bar(s))
-            except StopIteration:
-                self.continue_backtest = False
-            else:
-                if bar is not None:
-                    self.latest_symbol_data[s].append(bar)
-        self.events.put(MarketEvent())
+        if self.bar_index >= len(self.bar_datetimes):
+            # Do not signal a new bar once the data has run out, otherwise
+            # the last bar is processed twice
+            self.continue_backtest = False
+            return
 
+        for s in self.symbol_list:
+            bar = self._get_new_bar(s)
+            self.latest_symbol_data[s].append(bar)
+            values = self.latest_symbol_values[s]
+            for f, value in zip(self.bar_fields, bar[1:]):
+                values[f].append(value)
+        self.events.put(MarketEvent(self.bar_datetimes[self.bar_index]))
+        self.bar_index += 1
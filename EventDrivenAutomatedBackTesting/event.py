@@ -18,8 +18,13 @@ class Event(object):
     Parent/ base class providing an interface for all subsequent
     (inhereted) events. This class will trigger further events in the
     automated trading infrastructure
+
+    Millions of events are created over a minute bar backtest, so every event
+    declares its attributes in __slots__ rather than carrying a per-instance
+    dict. The event type string is a class attribute for the same reason.
     """
-    pass
+
+    __slots__ = ()
 
 class MarketEvent(Event):
     """
@@ -28,14 +33,19 @@ class MarketEvent(Event):
     DataHandler object recieves a new update of market data for any symbols
     which are currently being trackd. It is used to trigger the Strategy
     object to generate a new batch of trading signals. It simply contains an
-    identification that is a market event, with no other structure
+    identification that is a market event, and the timestamp of the update
+    if the DataHandler provides it
     """
 
-    def __init__(self):
+    __slots__ = ('datetime',)
+    type = 'MARKET'
+
+    def __init__(self, datetime=None):
         """
-        Initializes the MarketEvent
+        Parameters:
+            datetime - The timestamp of the new bars, if known
         """
-        self.type = 'MARKET'
+        self.datetime = datetime
 
 class SignalEvent(Event):
     """
@@ -48,8 +58,13 @@ class SignalEvent(Event):
     SignalEvents are utilized by the Portfolio object as advice for how to trade
     """
 
+    __slots__ = (
+        'strategy_id', 'symbol', 'datetime', 'signal_type', 'strength'
+    )
+    type = 'SIGNAL'
+
     def __init__ (self, strategy_id, symbol, datetime, signal_type,
-            stength):
+            strength):
         """ Initialized the SignalEvent
 
         Parameters:
@@ -62,13 +77,62 @@ class SignalEvent(Event):
             quantity at the portfolio level. Useful for pairs strategies.
         """
 
-        self.type = 'SIGNAL'
         self.strategy_id = strategy_id
         self.symbol = symbol
         self.datetime = datetime
         self.signal_type = signal_type
         self.strength = strength
 
+class SignalBatchEvent(Event):
+    """
+    Handles all the signals of a Strategy for one bar as a single event, so
+    that a rebalance over many symbols is a single round trip through the
+    queue rather than one per symbol. The Portfolio sizes the whole batch at
+    once (see Portfolio.update_signal_batch).
+
+    The signals are held column-wise: the i-th signal is (symbols[i],
+    signal_types[i], strengths[i]).
+    """
+
+    __slots__ = (
+        'strategy_id', 'datetime', 'symbols', 'signal_types', 'strengths'
+    )
+    type = 'SIGNAL_BATCH'
+
+    def __init__(self, strategy_id, datetime, symbols, signal_types,
+            strengths):
+        """
+        Initializes the SignalBatchEvent
+
+        Parameters:
+            strategy_id - The unique identifier for the strategy that
+            generated the signals
+            datetime - The timestamp at which the signals were generated
+            symbols - A list of ticker symbols
+            signal_types - A list of 'LONG', 'SHORT' or 'EXIT', one per symbol
+            strengths - A list of strengths, one per symbol (see SignalEvent)
+        """
+
+        self.strategy_id = strategy_id
+        self.datetime = datetime
+        self.symbols = symbols
+        self.signal_types = signal_types
+        self.strengths = strengths
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def signals(self):
+        """
+        Yields the batch as individual SignalEvents
+        """
+        for symbol, signal_type, strength in zip(
+                self.symbols, self.signal_types, self.strengths):
+            yield SignalEvent(
+                self.strategy_id, symbol, self.datetime, signal_type,
+                strength
+            )
+
 class OrderEvent(Event):
     """
     When a Portfolio object receives SignalEvents it assesses them in a wider
@@ -85,7 +149,14 @@ class OrderEvent(Event):
     TLDR: Handles the event of sending an Order to the execution system
     """
 
-    def __init__(self, symbol, order_type, quanitity, direction):
+    __slots__ = (
+        'symbol', 'order_type', 'quantity', 'direction', 'strategy_id',
+        'price'
+    )
+    type = 'ORDER'
+
+    def __init__(self, symbol, order_type, quantity, direction,
+            strategy_id=None, price=None):
         """
         Initializes the order type, setting whether it is a Market order
         ('MKT') or Limit order ('LMT'), has a quantity (integer), and its
@@ -96,13 +167,16 @@ class OrderEvent(Event):
         order_type - 'MKT' or 'LMT'
         quantity - Non-negative integer for quantity
         direction - 'BUY' or 'SELL' for long or short
+        strategy_id - The strategy whose signal led to the order, if any
+        price - The limit price of a 'LMT' order
         """
-        
-        self.type = 'ORDER'
+
         self.symbol = symbol
         self.order_type = order_type
         self.quantity = quantity
         self.direction = direction
+        self.strategy_id = strategy_id
+        self.price = price
 
     def print_order(self):
         """
@@ -113,6 +187,79 @@ class OrderEvent(Event):
                 (self.symbol, self.order_type, self.quantity,
                     self.direction)
             )
+class OrderBatchEvent(Event):
+    """
+    Handles all the orders resulting from a SignalBatchEvent as a single
+    event, to be sent to an ExecutionHandler in one go (see
+    ExecutionHandler.execute_order_batch).
+
+    The orders are held column-wise: the i-th order is (symbols[i],
+    order_type, quantities[i], directions[i]).
+    """
+
+    __slots__ = (
+        'symbols', 'order_type', 'quantities', 'directions', 'strategy_id'
+    )
+    type = 'ORDER_BATCH'
+
+    def __init__(self, symbols, order_type, quantities, directions,
+            strategy_id=None):
+        """
+        Initializes the OrderBatchEvent
+
+        Parameters:
+        symbols - A list of instruments to trade
+        order_type - 'MKT' or 'LMT', for all the orders
+        quantities - A list of non-negative integer quantities
+        directions - A list of 'BUY' or 'SELL', one per order
+        strategy_id - The strategy whose signals led to the orders, if any
+        """
+
+        self.symbols = symbols
+        self.order_type = order_type
+        self.quantities = quantities
+        self.directions = directions
+        self.strategy_id = strategy_id
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def orders(self):
+        """
+        Yields the batch as individual OrderEvents
+        """
+        for symbol, quantity, direction in zip(
+                self.symbols, self.quantities, self.directions):
+            yield OrderEvent(
+                symbol, self.order_type, quantity, direction,
+                self.strategy_id
+            )
+
+class OrderStatusEvent(Event):
+    """
+    Handles the event of a brokerage reporting on the state of an order it
+    was sent, e.g. its acknowledgement, independently of any fill
+    """
+
+    __slots__ = ('order_id', 'symbol', 'status', 'strategy_id')
+    type = 'ORDER_STATUS'
+
+    def __init__(self, order_id, symbol, status, strategy_id=None):
+        """
+        Initializes the OrderStatusEvent
+
+        Parameters:
+        order_id - The identifier the brokerage gave the order
+        symbol - The instrument of the order
+        status - The new state of the order, e.g. 'ACKNOWLEDGED'
+        strategy_id - The strategy whose signal led to the order, if any
+        """
+
+        self.order_id = order_id
+        self.symbol = symbol
+        self.status = status
+        self.strategy_id = strategy_id
+
 # When an ExecutionHandler receives an OrderEvent it must transact the
 # order. Once an order has been transacted it generates a FillEvent which
 # describes the cost of purchase or sale as well as the transaction costs,
@@ -134,8 +281,14 @@ class FillEvent(Event):
     price. In addition, store the commission of the trade from the brokerage
     """
 
+    __slots__ = (
+        'timeindex', 'symbol', 'exchange', 'quantity', 'direction',
+        'fill_cost', 'commission', 'strategy_id'
+    )
+    type = 'FILL'
+
     def __init__(self, timeindex, symbol, exchange, quantity, direction,
-            fill_cost, commission=None):
+            fill_cost, commission=None, strategy_id=None):
         """
         Initialize the FillEvent object. Set the symbol, exchange, quantity,
         direction, cost of fill and optional commission.
@@ -152,21 +305,22 @@ class FillEvent(Event):
         direction - The direction of fill ('BUT' or 'SELL')
         fill_cost - The holding value in dollars.
         commission - An optional commission sent from IB
+        strategy_id - The strategy whose order was filled, if known
         """
 
-        self.type = 'FILL'
         self.timeindex = timeindex
         self.symbol = symbol
         self.exchange = exchange
         self.quantity = quantity
         self.direction = direction
         self.fill_cost = fill_cost
+        self.strategy_id = strategy_id
 
-    # Calculate commission
-    if commission is None:
-        self.commission = self.calculate_ib_commission()
-    else:
-        self.commission = commission
+        # Calculate commission
+        if commission is None:
+            self.commission = self.calculate_ib_commission()
+        else:
+            self.commission = commission
 
     def calculate_ib_commission(self):
         """
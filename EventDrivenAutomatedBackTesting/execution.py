@@ -51,6 +51,20 @@ class ExecutionHandler(object):
 
         raise NotImplentedError("Should implement execute_order()")
 
+    def execute_order_batch(self, event):
+        """
+        Takes an OrderBatch event and executes all of its orders. By default
+        the orders are executed one by one with execute_order, handlers
+        which can submit a whole batch at once should override this.
+
+        Parameters:
+            event - Contains an OrderBatchEvent
+        """
+
+        if event.type == 'ORDER_BATCH':
+            for order in event.orders():
+                self.execute_order(order)
+
 class SimulatedExecutionHandler(ExecutionHandler):
     """
     The simulated execution handler simply converts all order objects into
@@ -85,6 +99,25 @@ class SimulatedExecutionHandler(ExecutionHandler):
         if event.type == 'ORDER':
             fill_event = FillEvent(
                 dt.datetime.utcnow(), event.symbol,
-                'ARCA', event.quantity, event.direction, None
+                'ARCA', event.quantity, event.direction, None,
+                strategy_id=event.strategy_id
             )
             self.events.put(fill_event)
+
+    def execute_order_batch(self, event):
+        """
+        Converts all the orders of an OrderBatch object into Fill objects at
+        once, in the same naive manner as execute_order.
+
+        Parameters:
+            event - Contains an OrderBatchEvent
+        """
+
+        if event.type == 'ORDER_BATCH':
+            timeindex = dt.datetime.utcnow()
+            for symbol, quantity, direction in zip(
+                    event.symbols, event.quantities, event.directions):
+                self.events.put(FillEvent(
+                    timeindex, symbol, 'ARCA', quantity, direction, None,
+                    strategy_id=event.strategy_id
+                ))
@@ -14,14 +14,11 @@
 
 from __future__ import print_function
 
-from abc import ABCMeta, abstractmethod
-import datetime as dt
+from collections import namedtuple
 import os, os.path
-import numpy as mp
-import pandas as pd
 
-from event import MarketEvent
-from dataHandler import DataHandler
+from barStore import MappedArray, read_store_columns
+from dataHandler import HistoricCSVDataHandler
 
 #class DataHandler(object):
 #    """
@@ -96,163 +93,101 @@ from dataHandler import DataHandler
 ## a simpler mechanism of importing (potentially large) CSV files. This will help
 ## us focus on the data handler itself.
 
-class HistoricCSVDateaHandler(DataHandler):
-    """
-    HistoricCSVDataHandler is designed to read  CSV files for each requested
-    symbol from disk and provide an interface to obtain the "latest" bar in a
-    manner identical to a live trading interface
-    """
+# Bars from DTN IQFeed carry open interest instead of an adjusted close and
+# list the low before the high
+BarHFT = namedtuple(
+    'BarHFT', ['datetime', 'open', 'low', 'high', 'close', 'volume', 'oi']
+)
 
-    def __init__(self, events, csv_dir, symbol_list):
+class HistoricCSVDataHandlerHFT(HistoricCSVDataHandler):
+    """
+    HistoricCSVDataHandlerHFT reads the minutely CSV files downloaded from DTN
+    IQFeed for each requested symbol. Everything but the CSV layout is shared
+    with HistoricCSVDataHandler, in particular the NumPy bar arrays and the
+    integer cursor, which matter most here given the millions of minute bars
+    involved.
     """
-    Initializes the historic data handler by requesting the location of the CSV
-    files and a list of symbols
-
-    It will be assumed that all filenames are of the form 'symbol.csv', where
-    symbol is a string in the list.
 
-    Parameters:
-        events - The Event Queue
-        csv_dir - Absolute directory path to the CSV files
-        symbol_list - A list of symbol strings
+    #NOTE: must use this format to be compatible with DTN IQFeed
+    csv_columns = [
+        'datetime', 'open', 'low', 'high', 'close', 'volume', 'oi'
+    ]
+    bar_record = BarHFT
 
+class HistoricMemmapDataHandlerHFT(HistoricCSVDataHandlerHFT):
+    """
+    HistoricMemmapDataHandlerHFT serves the same minutely IQFeed bars as
+    HistoricCSVDataHandlerHFT, but reads them from a memory mapped bar store
+    (see barStore.py, built once with write_bar_store) rather than loading
+    every symbol into memory.
+
+    Pages of the store are only faulted in as the bar cursor reaches them and
+    every release_every bars the pages behind the cursor are dropped again,
+    so the resident memory stays flat however long the history is.
     """
 
-    self.events = events
-    self.csv_dir = csv_dir
-    self.symbol_list = symbol_list
+    def __init__(self, events, store_dir, symbol_list, max_lookback=1000,
+        release_every=65536):
+        """
+        Initializes the memory mapped data handler
 
-    self.symbol_data = {}
-    self.latest_symbol_data = {}
-    self.continue_backtest = True
-    self.bar_index = 0
+        Parameters:
+            events - The Event Queue
+            store_dir - Absolute directory path to the bar store
+            symbol_list - A list of symbol strings
+            max_lookback - The maximum number of bars kept per symbol
+            release_every - The number of bars between releases of the pages
+            behind the cursor
+        """
 
-    self._open_convert_csv_files()
+        self.release_every = release_every
+        self.mapped = {}
+        super(HistoricMemmapDataHandlerHFT, self).__init__(
+            events, store_dir, symbol_list, max_lookback, use_cache=False
+        )
 
     def _open_convert_csv_files(self):
         """
-        Opens the CSV files from the data directory, converting them into
-        pandas DataFrames within a symbol dictionary.
-
-        For this handler it will be assumed that the data is pulled from
-        Yahoo finance, therefore the CSVs will follow a very consistent
-        layout
+        Maps the bar store instead of reading the CSV files. The arrays are
+        already padded onto the common index by write_bar_store.
         """
 
-        comb_index = None
-        for s in self.symbol_list:
-            # Load in the CSV file with no header information, indexed on date
-            self.symbol_data[s] = pd.io.parsers.read_csv(
-                os.path.join(self.csv_dir, '%s.csv' % s),
-                header=0, index_col=0, parse_dates=True,
-                #NOTE: must use this format to be compatible with DTN IQFeed
-                names=[
-                    'datetime', 'open', 'low', 'high', 'close', 'volume',
-                    'oi']
-                ]
-            ).sort()
-
-            # Combine the index to pad forward values
-            if _comb_index is None:
-                comb_index = self.symbol_data[s].index
-            else:
-                comb_index.union(self.symbol_data[s].index)
+        if read_store_columns(self.csv_dir) != self.bar_fields:
+            raise ValueError(
+                "The bar store in %s does not have the IQFeed layout %s" %
+                (self.csv_dir, self.bar_fields)
+            )
 
-            # Set the latest symbol_data to None
-            self.latest_symbol_data[s] = []
+        self.mapped['datetime'] = MappedArray(
+            os.path.join(self.csv_dir, 'datetime.npy')
+        )
+        self.bar_datetimes = self.mapped['datetime'].array
 
-        # Reindex the dataframes
-        # NOTE: can be updated with "prod" hft_dataHandler.py
         for s in self.symbol_list:
-            self.symbol_data[s] = self.symbol_data[s].\
-                reindex(index=comb_index, method='pad').iterrows()
+            self.mapped[s] = MappedArray(
+                os.path.join(self.csv_dir, '%s.npy' % s)
+            )
+            self.symbol_data[s] = self.mapped[s].array
+            self._init_latest(s)
 
     def _get_new_bar(self, symbol):
         """
-        Returns the latest bar from the data feed
-        """
-
-        for b in self.symbol_data[symbol]:
-            yield b
-
-    def get_latest_bar(self, symbol):
-        """
-        Returns the last bar from the latest_symbol list
+        Returns the bar under the cursor as a bar record, converting the
+        stored datetime64 into a python datetime object
         """
-        try:
-            bars_list = self.latest_symbol_data[symbol]
-        except KeyError:
-            print("That symbol is not available in the historical data set.")
-            raise
-        else:
-            return bars_list[-1]
 
-    def get_latest_bars(self, symbol, N-1):
-        """
-        Returns the last N bars from the latest_symbol list, or N-k if less
-        available
-        """
-        try:
-            bars_list = self.latest_symbol_data[symbol]
-        except KeyError:
-            print("That symbol is not available in the historical data set.")
-            raise
-        else:
-            return bars_list[-N:]
-
-    def get_latest_bar_datetime(self, symbol):
-        """
-        Returns a python datetime object for the last bar
-        """
-        try:
-            bars_list = self.latest_symbol_data[symbol]
-        except KeyError:
-            print("That symbol is not available in the historical data
-            set.")
-            raise
-        else:
-            return bars_list[-1][0]
-
-    def get_latest_bar_value(self, symbol, val_type):
-        """
-        Returns one of the Open, High, Low, Close, Volume, or OI values from
-        the pandas Bar series object
-        """
-
-        try:
-            bars_list = self.latest_symbol_data[symbol]
-        except KeyError:
-            print("That symbol is not available in the historical data set.")
-            raise
-        else:
-            return getattr(bars_list[-1][1], val_type)
-
-    def get_latest_bars_values(self, symbol, val_type, N=1):
-        """
-        Returns the last N bar values from the latest_symbol list, or N-k if
-        less available
-        """
-        try:
-            bars_list = self.get_latest_bars(symbol, N)
-        except KeyError:
-            print("That symbol is not available in the historical data set.")
-            raise
-        else:
-            return np.array([getattr(b[1], val_type) for b in bars_list])
+        return self.bar_record(
+            self.bar_datetimes[self.bar_index].astype('datetime64[us]').item(),
+            *self.symbol_data[symbol][self.bar_index].tolist()
+        )
 
     def update_bars(self):
         """
-        Pushes the latest bar to the latest_symbol_data structure fo all
-        symbols in the symbol list
+        Pushes the latest bar for all symbols, periodically dropping the pages
+        of the store the cursor has moved past
         """
 
-        for s in self.symbol_list:
-            try:
-                bar = next(self._get_new_bar(s))
-            except StopIteration:
-                self.continue_backtest = False
-            else:
-                if bar is not None:
-                    self.latest_symbol_data[s].append(bar)
-        self.events.put(MarketEvent())
-
+        super(HistoricMemmapDataHandlerHFT, self).update_bars()
+        if self.bar_index % self.release_every == 0:
+            for m in self.mapped.values():
+                m.release(self.bar_index)
@@ -0,0 +1,161 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#==========================================================
+#===================== ibBenchmark.py =====================
+#==========================================================
+
+# Purpose
+#----------------------------------------------------------
+# Measures the order throughput of the IBExecutionHandler against a local
+# TWSStandIn (see twsStandIn.py): a burst of orders is executed as fast as
+# possible and the time from each execute_order call to the FillEvent that
+# completes the order is recorded. Reports the orders per second and the
+# percentiles of the submit-to-fill latency.
+
+from __future__ import print_function
+
+import threading
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+import numpy as np
+
+from event import OrderEvent
+from ib_execution import IBExecutionHandler
+from twsStandIn import TWSStandIn, TWSStandInConnection
+
+class StandInIBExecutionHandler(IBExecutionHandler):
+    """
+    IBExecutionHandler connected to a TWSStandIn instead of a real TWS, and
+    without printing every server response
+    """
+
+    verbose = False
+
+    def __init__(self, events, address, **kwargs):
+        """
+        Parameters:
+            events - The Queue of Event objects
+            address - The (host, port) of the TWSStandIn
+            kwargs - As for IBExecutionHandler
+        """
+
+        self.address = address
+        super(StandInIBExecutionHandler, self).__init__(events, **kwargs)
+
+    def create_tws_connection(self):
+        return TWSStandInConnection(*self.address)
+
+def run_benchmark(n_orders=1000, max_in_flight=50, ack_latency=0.0,
+        fill_latency=0.0, partial_fills=1, quantity=100, timeout=60.0):
+    """
+    Executes n_orders market orders through an IBExecutionHandler connected
+    to a fresh TWSStandIn, as fast as possible
+
+    Parameters:
+        n_orders - The number of orders, each for a distinct symbol
+        max_in_flight - As for IBExecutionHandler
+        ack_latency, fill_latency, partial_fills - As for TWSStandIn
+        quantity - The quantity of every order
+        timeout - The maximum number of seconds to wait for all the fills
+
+    Returns:
+        A dict of the results: the number of orders filled, the elapsed
+        seconds, the orders per second, and the p50/p90/p99/max submit to
+        fill latencies in milliseconds. If no order was filled within the
+        timeout, the number of orders is 0, the elapsed seconds are those
+        waited and there are no latencies.
+    """
+
+    symbols = ['S%05d' % i for i in range(n_orders)]
+    submitted = {}
+    completed = {}
+    all_filled = threading.Event()
+    events = queue.Queue()
+
+    def consume():
+        # The order is complete once its FillEvents add up to the quantity
+        filled = dict((s, 0) for s in symbols)
+        while len(completed) < n_orders:
+            event = events.get()
+            if event is None:
+                return
+            if event.type == 'FILL':
+                filled[event.symbol] += event.quantity
+                if filled[event.symbol] >= quantity:
+                    completed[event.symbol] = time.time()
+        all_filled.set()
+
+    with TWSStandIn(ack_latency=ack_latency, fill_latency=fill_latency,
+            partial_fills=partial_fills) as server:
+        handler = StandInIBExecutionHandler(
+            events, (server.host, server.port), max_in_flight=max_in_flight
+        )
+        consumer = threading.Thread(target=consume)
+        consumer.daemon = True
+        consumer.start()
+
+        start = time.time()
+        for s in symbols:
+            submitted[s] = time.time()
+            handler.execute_order(OrderEvent(s, 'MKT', quantity, 'BUY'))
+        submit_time = time.time() - start
+
+        all_filled.wait(timeout)
+        events.put(None)
+        handler.tws_conn.disconnect()
+
+    if not completed:
+        return {
+            'orders': 0,
+            'elapsed': time.time() - start,
+            'orders_per_sec': 0.0,
+            'submit_per_sec': n_orders / submit_time,
+        }
+
+    latencies = np.array(
+        [completed[s] - submitted[s] for s in completed]
+    ) * 1000.0
+    elapsed = max(completed.values()) - start
+
+    results = {
+        'orders': len(completed),
+        'elapsed': elapsed,
+        'orders_per_sec': len(completed) / elapsed,
+        'submit_per_sec': n_orders / submit_time,
+    }
+    for p in (50, 90, 99):
+        results['p%d_ms' % p] = np.percentile(latencies, p)
+    results['max_ms'] = latencies.max()
+    return results
+
+def format_results(results):
+    """
+    Returns the results of run_benchmark as a line of text
+    """
+
+    if results['orders'] == 0:
+        return (
+            "0 orders completed in %(elapsed).3fs (submitted at "
+            "%(submit_per_sec).0f/sec)" % results
+        )
+    return (
+        "%(orders)d orders in %(elapsed).3fs: %(orders_per_sec).0f orders/sec "
+        "(submitted at %(submit_per_sec).0f/sec), submit to fill latency "
+        "p50 %(p50_ms).2fms, p90 %(p90_ms).2fms, p99 %(p99_ms).2fms, "
+        "max %(max_ms).2fms" % results
+    )
+
+if __name__ == "__main__":
+    for max_in_flight in (1, 10, 50):
+        print("max_in_flight=%d, 1ms acknowledgement, 5ms fill in 2 parts" %
+            max_in_flight)
+        print(format_results(run_benchmark(
+            n_orders=500, max_in_flight=max_in_flight, ack_latency=0.001,
+            fill_latency=0.005, partial_fills=2
+        )))
@@ -26,15 +26,23 @@
 
 from __future__ import print_function
 
+from collections import deque
 import datetime as dt
-import time
-
-from ib.ext.Contract import Contract
-from ib.ext.Order import Order
-from ib.opt import ibConnection, message
-
-from event import FillEvent, OrderEvent
-from exectution import ExecutionHandler
+import threading
+
+try:
+    from ib.ext.Contract import Contract
+    from ib.ext.Order import Order
+    from ib.opt import ibConnection, message
+except ImportError:
+    # IbPy is only needed to connect to a real TWS, the handler can still run
+    # against the local stand-in (see twsStandIn.py)
+    from twsStandIn import Contract, Order
+    ibConnection = message = None
+
+from event import FillEvent, OrderEvent, OrderStatusEvent
+from execution import ExecutionHandler
+from orderState import OrderStateStore, ACKNOWLEDGED, CANCELLED, REJECTED
 
 class IBExecutionHandler(ExecutionHandler):
     """
@@ -43,73 +51,149 @@ class IBExecutionHandler(ExecutionHandler):
 
     The default order routing will be SOR (Smart Order Routing) and the default
     ccy will be USD.
+
+    Orders are pipelined: execute_order places the order and returns at once,
+    and the acknowledgement and fill are matched to it by order ID when IB's
+    replies come in on the connection's own thread. At most max_in_flight
+    orders are outstanding at IB at any time, any further order is held back
+    and placed as soon as an earlier one completes.
+
+    The lock is never held while writing to the connection: orders are
+    given their ID under the lock and queued, then sent in ID order once it
+    is released, so neither execute_order nor the replies ever wait on
+    another thread's network write.
+
+    The state of every order is kept in an OrderStateStore (see
+    orderState.py): each change of state is reported as an OrderStatusEvent,
+    and every partial fill as a FillEvent for the quantity newly filled.
     """
 
-    def __init__(self, events, order_routing="SMART", currency="USD"):
+    # The IB order statuses and the order states they move an order to. Fills
+    # are tracked from the filled quantity of every status message instead
+    ib_statuses = {
+        "PreSubmitted": ACKNOWLEDGED,
+        "Submitted": ACKNOWLEDGED,
+        "Cancelled": CANCELLED,
+        "ApiCancelled": CANCELLED,
+        "Inactive": REJECTED,
+    }
+
+    # Whether to print every server response to the terminal
+    verbose = True
+
+    # The IB error codes which mean an order was refused
+    reject_codes = (
+        103, 104, 105, 106, 107, 109, 110, 111, 113, 116, 117, 118, 119, 200,
+        201, 203
+    )
+
+    # The IB error codes which mean an order was cancelled
+    cancel_codes = (202,)
+
+    def __init__(self, events, order_routing="SMART", currency="USD",
+            max_in_flight=50, order_id_timeout=10.0):
         """
         Initializes the IBExecutionHandler instance
 
         Parameters:
             events - The Queue of Event objects
+            order_routing - The exchange orders are routed to
+            currency - The currency of the contracts
+            max_in_flight - The maximum number of orders outstanding at IB
+            order_id_timeout - The number of seconds to wait for TWS to send
+            the next valid order ID upon connection
         """
 
         self.events = events
         self.order_routing = order_routing
         self.currency = currency
-        self.fill_dict = {}
-
-        self.tws_conn self.create_tws_connection()
-        self.order_id = self.create_initial_order_id()
+        self.max_in_flight = max_in_flight
+        self.order_id_timeout = order_id_timeout
+        self.order_store = OrderStateStore()
+
+        # The replies arrive on the connection's thread, the lock guards the
+        # order IDs, order_store, the in-flight/held back orders and the
+        # orders given an ID but not sent yet
+        self.lock = threading.Condition()
+        self.in_flight = set()
+        self.backlog = deque()
+        self.unsent = deque()
+        self.sending = False
+        self.order_id = None
+
+        # The handlers must be in place before connecting, TWS sends the next
+        # valid order ID straight away
+        self.tws_conn = self.create_tws_connection()
         self.register_handlers()
+        self.tws_conn.connect()
+        self.order_id = self.create_initial_order_id()
 
     def _error_handler(self, msg):
         """
-        Handles the capturing of error messages. Simply prints to the terminal.
-        Further error handling functionality should be implemented.
+        Handles the capturing of error messages. Errors refusing or
+        cancelling one of our orders reject or cancel it, everything else is
+        simply printed to the terminal.
         """
 
+        if msg.errorCode in self.reject_codes:
+            self.update_order_status(msg.id, REJECTED)
+        elif msg.errorCode in self.cancel_codes:
+            self.update_order_status(msg.id, CANCELLED)
         print("Server Error: %s" % msg)
 
     def _reply_handler(self, msg):
         """
-        Handles server replies
+        Handles server replies, matching them to the orders placed by their
+        order ID
         """
 
-        # Handle open order orderID processing
-        if msg.typeName == "openOrder" and  msg.orderID == self.order_id and \
-            not self.fill_dict.has_key(msg.orderID):
-            self.create_fill_dict_entry(msg)
-        # Handle Fills
-        if msg.typeName == "orderStatus" and msg.status == "Filled" and \
-            self.fill_dict[msg.orderID]["filled"] == False:
+        # Handle the next valid order ID
+        if msg.typeName == "nextValidId":
+            with self.lock:
+                if self.order_id is None or msg.orderId > self.order_id:
+                    self.order_id = msg.orderId
+                self.lock.notify_all()
+        # Handle open order acknowledgements
+        elif msg.typeName == "openOrder":
+            self.update_order_status(msg.orderId, ACKNOWLEDGED)
+        # Handle (partial) Fills, then any other change of state
+        elif msg.typeName == "orderStatus":
             self.create_fill(msg)
-        print("Server Response: %s, %s\n" % (msg.typeName, msg))
+            status = self.ib_statuses.get(msg.status)
+            if status is not None:
+                self.update_order_status(msg.orderId, status)
+        if self.verbose:
+            print("Server Response: %s, %s\n" % (msg.typeName, msg))
 
     def create_tws_connection(self):
         """
-        Connect to the Trader Workstation (TWS, IB API using the IbPy ibConnection
-        object) using the standard port of 7496, with a clientId of 10.
+        Creates the connection to the Trader Workstation (TWS, IB API using
+        the IbPy ibConnection object) using the standard port of 7496, with a
+        clientId of 10. It is only connected once the handlers are registered.
 
         The clientId is chosen by the user and we will need separate IDs for
         both the execution connection and the market data connection, if the
         latter is also used elsewhere.
+
+        Override to connect elsewhere, e.g. to a TWSStandIn.
         """
 
-        tws_conn = ibConnection()
-        tws_conn.connect()
-        return tws_conn
+        if ibConnection is None:
+            raise RuntimeError("IbPy is required to connect to TWS")
+        return ibConnection()
 
     def create_initial_order_id(self):
         """
-        Creates the initial order ID used for Interactive Brokers to keep track
-        of submitted orders.
-
-        There is certainly scope for more sophisticated logic here. For example
-        a more correct approach would be to query IB for the latest next
-        available ID.
+        Returns the initial order ID used for Interactive Brokers to keep
+        track of submitted orders, i.e. the next valid ID TWS sends upon
+        connection. IDs below it have already been used by this client.
         """
 
-        return 1
+        with self.lock:
+            if not self.lock.wait_for(
+                    lambda: self.order_id is not None, self.order_id_timeout):
+                raise RuntimeError("No next valid order ID received from TWS")
+            return self.order_id
 
     def register_handlers(self):
         """
@@ -146,7 +230,7 @@ class IBExecutionHandler(ExecutionHandler):
         contract.m_secType = sec_type
         contract.m_exchange = exch
         contract.m_primaryExch = prim_exch
-        contract.m_currenct = curr
+        contract.m_currency = curr
         return contract
 
     def create_order(self, order_type, quantity, action):
@@ -166,51 +250,134 @@ class IBExecutionHandler(ExecutionHandler):
         order.m_action = action
         return order
 
-    def create_fill_dict_entry(self, msg):
+    def update_order_status(self, order_id, status):
         """
-        In order to avoid duplicating FillEvent instances for a particular
-        order ID, we will utilize a dictionary called fill_dict to store keys
-        that match particular order IDs. When a fill has been generated the
-        "filled" key of an entry for a particular order ID will be set to True.
-        Any subsequent "Server Response" messages recieved will not lead to a
-        new fill.
-
-        TLDR: Creates an entry in the Fill Dictionary that lists orderIds and
-        provides security information. This is needed for the event-driven
-        behaviour of the IB server message behaviour.
+        Moves one of our orders to a new state and places an
+        OrderStatusEvent onto the events queue, unless the order was already
+        in that state (or past it). An order reaching a final state frees its
+        in-flight slot.
+
+        Parameters:
+            order_id - The IB order ID
+            status - The new order state, see orderState.py
         """
 
-        self.fill_dict[msg.orderId] = {
-            "symbol" : msg.contract.m_symbol,
-            "exchange" : msg.contract.m_exchange,
-            "direction" : msg.order.m_action,
-            "filled": False
-        }
+        with self.lock:
+            record = self.order_store.transition(order_id, status)
+            if record is None:
+                return
+            if record.done:
+                self.complete_order(order_id)
+        self._send_orders()
+
+        self.events.put(OrderStatusEvent(
+            order_id, record.symbol, record.status, record.strategy_id
+        ))
 
     def create_fill(self, msg):
         """
         Handles the creation of the FillEvent that will be placed onto the
-        events queue subsequent to an order being filled
+        events queue whenever an orderStatus message reports more of an order
+        filled than before. The FillEvent is for the newly filled quantity
+        only, at the average price of that quantity, so every partial fill is
+        reported exactly once.
         """
 
-        fd = self.fill_dict[msg.orderId]
+        with self.lock:
+            fill = self.order_store.update_fill(
+                msg.orderId, msg.filled, msg.avgFillPrice
+            )
+            if fill is None:
+                return
+            record = self.order_store.get(msg.orderId)
+            if record.done:
+                self.complete_order(msg.orderId)
+        self._send_orders()
 
         # Prepare the fill data
-        symbol = fd["symbol"]
-        exchange = fd["exchange"]
-        filled = msg.filled
-        direction = fd["direction"]
-        fill_cost = msg.avgFillPrice
+        filled, fill_cost = fill
+
+        # Create a fill event object and an OrderStatusEvent for the new
+        # state of the order
+        fill_event = FillEvent(dt.datetime.utcnow(), record.symbol,
+                record.exchange, filled, record.direction, fill_cost,
+                strategy_id=record.strategy_id)
+        status_event = OrderStatusEvent(
+            record.order_id, record.symbol, record.status, record.strategy_id
+        )
+
+        # Place the events onto the event queue
+        self.events.put(fill_event)
+        self.events.put(status_event)
 
-        # Create a fill event object
-        fill = FillEvent(dt.datetime.utcnow(), symbol, exchange, filled,
-                direction, fill_cost)
+    def complete_order(self, order_id):
+        """
+        Frees the in-flight slot of an order IB is done with, and queues the
+        oldest held back order in its place. Must be called with the lock
+        held, and followed by _send_orders once it is released.
+        """
 
-        # Make sure that multiple messages don't create additional fills
-        self.fill_dict[msg.orderID]["filled"] = True
+        if order_id not in self.in_flight:
+            return
+        self.in_flight.discard(order_id)
+        if self.backlog:
+            self._place_order(self.backlog.popleft())
+        self.lock.notify_all()
 
-        # Place the fill event onto the event queue
-        self.events.put(fill_event)
+    def _place_order(self, event):
+        """
+        Gives an OrderEvent the next order ID and queues it to be sent to IB
+        by _send_orders. Must be called with the lock held.
+        """
+
+        order_id = self.order_id
+        self.order_id += 1
+
+        # Create the Interactive Brokers contract and order via the passed
+        # Order event
+        ib_contract = self.create_contract(
+            event.symbol, "STK", self.order_routing, self.order_routing,
+            self.currency
+        )
+        ib_order = self.create_order(
+            event.order_type, event.quantity, event.direction
+        )
+
+        # Replies are matched by order ID, so the order must be known before
+        # it is sent
+        self.order_store.add(
+            order_id, event.symbol, self.order_routing, event.direction,
+            event.quantity, event.strategy_id
+        )
+        self.in_flight.add(order_id)
+        self.unsent.append((order_id, ib_contract, ib_order))
+        return order_id
+
+    def _send_orders(self):
+        """
+        Sends the queued orders to IB, in order ID order, without holding
+        the lock during the network writes. Must be called without the lock
+        held. If another thread is already sending, it sends these too.
+        """
+
+        with self.lock:
+            if self.sending:
+                return
+            self.sending = True
+        try:
+            while True:
+                with self.lock:
+                    if not self.unsent:
+                        self.sending = False
+                        return
+                    order_id, ib_contract, ib_order = self.unsent.popleft()
+
+                # Use the connection to send the order to IB
+                self.tws_conn.placeOrder(order_id, ib_contract, ib_order)
+        except Exception:
+            with self.lock:
+                self.sending = False
+            raise
 
     def execute_order(self, event):
         """
@@ -223,44 +390,35 @@ class IBExecutionHandler(ExecutionHandler):
         parameters. Lastly use the IbPy method placeOrder to establish
         connection and place the order with an associated order_id.
 
-        The results are then queried in order to generate a corresponding Fill
-        object, which is placed back into the event queue.
+        The method returns as soon as the order is placed (or held back, if
+        max_in_flight orders are already outstanding). The corresponding Fill
+        object is placed onto the event queue by _reply_handler once IB
+        reports the order as filled.
 
         Parameters:
             event - Contains an Event object with order information
         """
 
         if event.type == 'ORDER':
-            # Prepare the parameters for the asset order
-            asset = event.symbol
-            asset_type = "STK"
-            order_type = event.order_type
-            quantity = event.quantity
-            direction = event.direction
-
-            # Create the Interactive Brokers contract via the passed Order
-            # event
-            ib_contract = sefl.create_contract(
-                asset, asset_type, self.order_routing, self.order_routing,
-                self.currency
-                )
-            # Create the Interactive Brokers order via the passed Order event
-            ib_order = self.create_order(
-                order_type, quantity, direction
-                )
-
-            # Use the connection to send the order to IB
-            self.tws_conn.placeOrder(
-                self.order_id, ib_contract, ib_order
-            )
+            with self.lock:
+                if len(self.in_flight) < self.max_in_flight:
+                    self._place_order(event)
+                else:
+                    self.backlog.append(event)
+            self._send_orders()
+
+    def wait_until_done(self, timeout=None):
+        """
+        Blocks until IB is done with every order executed so far
 
-            # NOTE: The following line is essential to ensure that orders
-            # connect and collect server responses appropriately. In essence a
-            # one second delay between filling and returning order details
-            # ensures that each order processes optimally. Without this I've
-            # witnessed the process crash.
-            time.sleep(1)
+        Parameters:
+            timeout - The maximum number of seconds to wait, None for no limit
 
-            # Increment the order ID for this ordering session
-            self.order_id += 1
+        Returns:
+            True if all the orders are done, False on timeout
+        """
 
+        with self.lock:
+            return self.lock.wait_for(
+                lambda: not self.in_flight and not self.backlog, timeout
+            )
@@ -0,0 +1,356 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#==========================================================
+#===================== indicators.py ======================
+#==========================================================
+
+# Purpose
+#----------------------------------------------------------
+# Strategies used to fetch a whole window of bars and recompute their
+# indicators from scratch on every MarketEvent, i.e. O(window) work per bar per
+# symbol. The indicators below are instead updated incrementally with the
+# latest bar value only, in O(1) (amortised) time:
+#
+#   SMA               - running sum over a rolling window
+#   EMA               - exponential moving average
+#   RollingVariance   - running sum and sum of squares over a rolling window
+#   RollingMin/Max    - monotonic queue over a rolling window
+#   RollingOLS        - running sums of a pair over a rolling window, giving
+#                       the OLS hedge ratio and the z-score of the spread
+#
+# All the rolling indicators behave like their NumPy equivalents over the
+# latest bars available from a DataHandler: over fewer than window values at
+# the start of the data, and NaN while the window holds a missing (NaN) value.
+
+from __future__ import print_function
+
+from abc import ABCMeta, abstractmethod
+from collections import deque
+import math
+
+class Indicator(object):
+    """
+    Indicator is an abstract base class providing an interface for all
+    subsequent (inherited) incremental indicators.
+
+    An indicator is fed one new value per bar through update() and its
+    current value is available at any time as the value attribute (NaN until
+    it has seen any data).
+    """
+
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def update(self, x):
+        """
+        Updates the indicator with the latest value and returns its new value
+        """
+        raise NotImplementedError("Should implement update()")
+
+class RollingIndicator(Indicator):
+    """
+    Base class for the indicators over a rolling window of the latest values.
+    Keeps the window itself and the number of NaN values within it.
+    """
+
+    def __init__(self, window):
+        """
+        Parameters:
+            window - The number of latest values the indicator is computed on
+        """
+
+        if window < 1:
+            raise ValueError("window must be at least 1")
+
+        self.window = window
+        self.values = deque()
+        self.nan_count = 0
+        self.value = float('nan')
+
+    def _push(self, x):
+        """
+        Adds x to the window and returns the value that left it, or None
+        """
+
+        self.values.append(x)
+        if x != x:
+            self.nan_count += 1
+
+        old = None
+        if len(self.values) > self.window:
+            old = self.values.popleft()
+            if old != old:
+                self.nan_count -= 1
+        return old
+
+class SMA(RollingIndicator):
+    """
+    Simple moving average, from a running sum of the window.
+
+    The sum is recomputed from the window every time it has been fully
+    replaced, so floating point errors cannot accumulate over long runs.
+    """
+
+    def __init__(self, window):
+        super(SMA, self).__init__(window)
+        self.total = 0.0
+        self.updates = 0
+
+    def update(self, x):
+        """
+        Updates the indicator with the latest value and returns its new value
+        """
+        old = self._push(x)
+        if x == x:
+            self.total += x
+        if old is not None and old == old:
+            self.total -= old
+
+        self.updates += 1
+        if self.updates % self.window == 0:
+            self.total = math.fsum(v for v in self.values if v == v)
+
+        if self.nan_count > 0:
+            self.value = float('nan')
+        else:
+            self.value = self.total / len(self.values)
+        return self.value
+
+class EMA(Indicator):
+    """
+    Exponential moving average with a smoothing factor of 2 / (span + 1),
+    seeded with the first value
+    """
+
+    def __init__(self, span):
+        """
+        Parameters:
+            span - The span (in bars) of the average
+        """
+
+        self.alpha = 2.0 / (span + 1.0)
+        self.value = float('nan')
+
+    def update(self, x):
+        """
+        Updates the indicator with the latest value and returns its new value
+        """
+        if self.value != self.value:
+            self.value = x
+        else:
+            self.value += self.alpha * (x - self.value)
+        return self.value
+
+class RollingVariance(RollingIndicator):
+    """
+    Variance over a rolling window, from running sums of the values and of
+    their squares. Like np.var, ddof=0 gives the population variance.
+
+    The sums are recomputed from the window every time it has been fully
+    replaced, so cancellation errors cannot accumulate over long runs.
+    """
+
+    def __init__(self, window, ddof=0):
+        """
+        Parameters:
+            window - The number of latest values the variance is computed on
+            ddof - Delta degrees of freedom, 1 for the sample variance
+        """
+
+        super(RollingVariance, self).__init__(window)
+        self.ddof = ddof
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.updates = 0
+
+    def update(self, x):
+        """
+        Updates the indicator with the latest value and returns its new value
+        """
+        old = self._push(x)
+        if x == x:
+            self.total += x
+            self.total_sq += x * x
+        if old is not None and old == old:
+            self.total -= old
+            self.total_sq -= old * old
+
+        self.updates += 1
+        if self.updates % self.window == 0:
+            valid = [v for v in self.values if v == v]
+            self.total = math.fsum(valid)
+            self.total_sq = math.fsum(v * v for v in valid)
+
+        n = len(self.values)
+        if self.nan_count > 0 or n - self.ddof <= 0:
+            self.value = float('nan')
+        else:
+            mean = self.total / n
+            self.value = max(self.total_sq / n - mean * mean, 0.0) * \
+                n / (n - self.ddof)
+        return self.value
+
+    @property
+    def std(self):
+        """
+        The rolling standard deviation
+        """
+        return math.sqrt(self.value)
+
+class RollingMax(RollingIndicator):
+    """
+    Maximum over a rolling window, using a monotonic queue of (index, value)
+    pairs: every value is pushed and popped at most once.
+    """
+
+    def __init__(self, window):
+        super(RollingMax, self).__init__(window)
+        self.candidates = deque()
+        self.updates = 0
+
+    def _better(self, a, b):
+        """
+        Whether a makes b redundant as a candidate
+        """
+        return a >= b
+
+    def update(self, x):
+        """
+        Updates the indicator with the latest value and returns its new value
+        """
+        self._push(x)
+        i = self.updates
+        self.updates += 1
+
+        if x == x:
+            while self.candidates and self._better(x, self.candidates[-1][1]):
+                self.candidates.pop()
+            self.candidates.append((i, x))
+        while self.candidates and self.candidates[0][0] <= i - self.window:
+            self.candidates.popleft()
+
+        if self.nan_count > 0:
+            self.value = float('nan')
+        else:
+            self.value = self.candidates[0][1]
+        return self.value
+
+class RollingMin(RollingMax):
+    """
+    Minimum over a rolling window, see RollingMax
+    """
+
+    def _better(self, a, b):
+        """
+        Whether a makes b redundant as a candidate
+        """
+        return a <= b
+
+class RollingOLS(Indicator):
+    """
+    Rolling regression through the origin, y = beta * x, as fitted by
+    sm.OLS(y, x) (no constant) over the latest window (x, y) pairs, together
+    with the z-score of the latest residual (the spread y - beta * x).
+
+    Running sums of x, y, x*x, x*y and y*y over the window give the hedge
+    ratio beta = sum(xy) / sum(xx), and the mean and standard deviation of the
+    spread over the whole window for the current beta, in O(1) per update:
+
+        mean = (sum(y) - beta * sum(x)) / n
+        var = (sum(yy) - 2 beta sum(xy) + beta^2 sum(xx)) / n - mean^2
+
+    The sums are recomputed from the window every time it has been fully
+    replaced, so cancellation errors cannot accumulate over long runs.
+    """
+
+    def __init__(self, window):
+        """
+        Parameters:
+            window - The number of latest (x, y) pairs the fit is computed on
+        """
+
+        if window < 1:
+            raise ValueError("window must be at least 1")
+
+        self.window = window
+        self.pairs = deque()
+        self.nan_count = 0
+        self.updates = 0
+        self.sx = self.sy = self.sxx = self.sxy = self.syy = 0.0
+
+        self.value = float('nan')
+        self.zscore = float('nan')
+
+    def _add(self, x, y, sign):
+        """
+        Adds (sign=1) or removes (sign=-1) a pair from the running sums
+        """
+
+        if x != x or y != y:
+            self.nan_count += sign
+        else:
+            self.sx += sign * x
+            self.sy += sign * y
+            self.sxx += sign * x * x
+            self.sxy += sign * x * y
+            self.syy += sign * y * y
+
+    def _resync(self):
+        """
+        Recomputes the running sums exactly from the window
+        """
+
+        valid = [(x, y) for x, y in self.pairs if x == x and y == y]
+        self.sx = math.fsum(x for x, y in valid)
+        self.sy = math.fsum(y for x, y in valid)
+        self.sxx = math.fsum(x * x for x, y in valid)
+        self.sxy = math.fsum(x * y for x, y in valid)
+        self.syy = math.fsum(y * y for x, y in valid)
+
+    @property
+    def ready(self):
+        """
+        Whether a full window of pairs has been seen
+        """
+        return len(self.pairs) == self.window
+
+    def update(self, x, y):
+        """
+        Updates the fit with the latest (x, y) pair and returns the new hedge
+        ratio. The z-score of the latest spread is left in zscore.
+        """
+
+        self.pairs.append((x, y))
+        self._add(x, y, 1)
+        if len(self.pairs) > self.window:
+            old_x, old_y = self.pairs.popleft()
+            self._add(old_x, old_y, -1)
+
+        self.updates += 1
+        if self.updates % self.window == 0:
+            self._resync()
+
+        n = len(self.pairs)
+        if self.nan_count > 0 or self.sxx == 0.0:
+            self.value = self.zscore = float('nan')
+            return self.value
+
+        beta = self.sxy / self.sxx
+        mean = (self.sy - beta * self.sx) / n
+        var = (self.syy - 2.0 * beta * self.sxy + beta * beta * self.sxx) / n \
+            - mean * mean
+
+        self.value = beta
+        if var > 0.0:
+            self.zscore = (y - beta * x - mean) / math.sqrt(var)
+        else:
+            self.zscore = float('nan')
+        return self.value
+
+    @property
+    def hedge_ratio(self):
+        """
+        The current hedge ratio (beta) of y on x
+        """
+        return self.value
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#==========================================================
+#======================= ledger.py ========================
+#==========================================================
+
+# Purpose
+#----------------------------------------------------------
+# The Portfolio records its positions and holdings once per bar. Kept as a
+# list of dictionaries this history takes several GB over long minute bar
+# runs and has to be converted into a DataFrame at the end. The Ledger stores
+# it column-wise instead: one preallocated NumPy array with one row per bar
+# and one column per symbol (plus e.g. cash, commission and total), which
+# grows geometrically when full and can be wrapped in a pandas DataFrame
+# without copying.
+
+from __future__ import print_function
+
+import numpy as np
+import pandas as pd
+
+class Ledger(object):
+    """
+    A growable, time-indexed table of floats with fixed columns
+    """
+
+    def __init__(self, columns, capacity=1024):
+        """
+        Initializes an empty ledger
+
+        Parameters:
+            columns - The list of column names
+            capacity - The number of rows initially allocated
+        """
+
+        self.columns = list(columns)
+        self.column_index = dict((c, i) for i, c in enumerate(self.columns))
+        self.n_rows = 0
+
+        capacity = max(capacity, 1)
+        self._data = np.zeros((capacity, len(self.columns)))
+        self._datetimes = np.zeros(capacity, dtype='datetime64[ns]')
+
+    def __len__(self):
+        return self.n_rows
+
+    def _grow(self):
+        """
+        Doubles the allocated number of rows
+        """
+
+        capacity = 2 * self._data.shape[0]
+        data = np.zeros((capacity, len(self.columns)))
+        data[:self.n_rows] = self._data[:self.n_rows]
+        datetimes = np.zeros(capacity, dtype='datetime64[ns]')
+        datetimes[:self.n_rows] = self._datetimes[:self.n_rows]
+        self._data, self._datetimes = data, datetimes
+
+    def append(self, datetime, row):
+        """
+        Adds a row to the ledger
+
+        Parameters:
+            datetime - The timestamp of the row
+            row - A sequence of values, one per column, in column order
+        """
+
+        if self.n_rows == self._data.shape[0]:
+            self._grow()
+        self._data[self.n_rows] = row
+        self._datetimes[self.n_rows] = np.datetime64(datetime, 'ns')
+        self.n_rows += 1
+
+    @property
+    def values(self):
+        """
+        A (rows x columns) view of the recorded values
+        """
+        return self._data[:self.n_rows]
+
+    @property
+    def datetimes(self):
+        """
+        A view of the recorded timestamps
+        """
+        return self._datetimes[:self.n_rows]
+
+    def column(self, name):
+        """
+        A view of the recorded values of one column
+
+        Parameters:
+            name - The column name
+        """
+        return self._data[:self.n_rows, self.column_index[name]]
+
+    def to_dataframe(self):
+        """
+        Wraps the recorded rows in a pandas DataFrame indexed on datetime,
+        without copying them
+        """
+
+        return pd.DataFrame(
+            self.values, columns=self.columns, copy=False,
+            index=pd.DatetimeIndex(self.datetimes, name='datetime')
+        )
@@ -0,0 +1,549 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#==========================================================
+#===================== liveEngine.py ======================
+#==========================================================
+
+# Purpose
+#----------------------------------------------------------
+# In live mode the Backtest polls a queue.Queue and sleeps for a whole
+# heartbeat between cycles, so a market update can wait up to a heartbeat
+# before the strategy sees it. The LiveEngine runs the same DataHandler,
+# Strategy, Portfolio and ExecutionHandler roles on an asyncio event loop
+# instead: market data, order acknowledgements and fills are awaited and
+# dispatched to their handlers as soon as they arrive.
+#
+# So that the engine can be run without any market connection:
+#   ReplayFeed    - replays historic CSV bars as an asynchronous feed
+#   LocalBroker   - an in-process stand-in for a brokerage, acknowledging and
+#                   filling orders after configurable latencies
+#
+# When replaying, every order is settled before the next bar is pushed, as in
+# the Backtest, so a replay gives the same results as a backtest of the same
+# data. On a live feed bars keep arriving while orders are in flight, and the
+# Portfolio only learns of an order once it is filled. So that a repeated
+# signal does not send the same order twice, the LiveEngine holds back the
+# signals of a symbol while an order of that Portfolio for the symbol is in
+# flight, i.e. until it is completely filled, cancelled or rejected. The
+# results of a live run can still differ from a backtest.
+#
+# NOTE: requires Python 3.7+ for asyncio
+
+from __future__ import print_function
+
+import asyncio
+import datetime as dt
+
+from backtest import Backtest
+from dataHandler import HistoricCSVDataHandler
+from event import (
+    MarketEvent, SignalEvent, SignalBatchEvent, OrderEvent, OrderBatchEvent,
+    FillEvent, OrderStatusEvent
+)
+from execution import ExecutionHandler
+from orderState import CANCELLED, REJECTED
+
+# Put on the Event Queue to stop the dispatcher. None cannot be used, the
+# Portfolio queues a None order for signals it does not act upon
+_STOP = object()
+
+class AsyncEventQueue(object):
+    """
+    The Event Queue of the LiveEngine. Events are awaited with get(), while
+    put() never blocks or needs awaiting, so that the existing components can
+    keep calling events.put(event) from their (synchronous) handlers.
+
+    The queue is handed to the components when the engine is constructed,
+    outside of any event loop, but before Python 3.10 an asyncio.Queue is
+    bound to the event loop current when it is created. The asyncio.Queue
+    behind it is therefore only created by open(), from the running loop.
+    """
+
+    def __init__(self):
+        self.queue = None
+
+    def open(self):
+        """
+        Creates the underlying asyncio.Queue on the running event loop
+        """
+        self.queue = asyncio.Queue()
+
+    def put(self, item):
+        self.queue.put_nowait(item)
+
+    def get(self):
+        return self.queue.get()
+
+    def task_done(self):
+        self.queue.task_done()
+
+    def join(self):
+        return self.queue.join()
+
+    def empty(self):
+        return self.queue.empty()
+
+class ReplayFeed(object):
+    """
+    Simulated market data feed replaying the bars of a historic data handler
+    as an asynchronous iterator of updates. Each update is a dict of symbol
+    to bar record, holding one bar for every symbol.
+    """
+
+    def __init__(self, csv_dir, symbol_list, interval=0.0,
+            data_handler=HistoricCSVDataHandler):
+        """
+        Loads the historic bars to replay
+
+        Parameters:
+            csv_dir - Absolute directory path to the CSV files
+            symbol_list - A list of symbol strings
+            interval - The number of seconds between two updates
+            data_handler - (Class) The historic data handler reading the bars
+        """
+
+        self.interval = interval
+        self.source = data_handler(None, csv_dir, symbol_list)
+
+    def __aiter__(self):
+        return self._replay()
+
+    async def _replay(self):
+        source = self.source
+        for i in range(source.get_total_bars()):
+            source.bar_index = i
+            yield dict((s, source._get_new_bar(s)) for s in source.symbol_list)
+            await asyncio.sleep(self.interval)
+
+class LiveFeedDataHandler(HistoricCSVDataHandler):
+    """
+    LiveFeedDataHandler keeps the latest bars pushed by an asynchronous feed
+    (see ReplayFeed) and serves them exactly like the historic data handlers.
+    The LiveEngine iterates over the feed and hands every update to on_bars.
+
+    As it is constructed by the engine, the feed is passed in place of the
+    csv_dir.
+    """
+
+    def __init__(self, events, feed, symbol_list, max_lookback=1000):
+        """
+        Initializes the data handler on a feed
+
+        Parameters:
+            events - The Event Queue
+            feed - An asynchronous iterable of {symbol: bar record} updates
+            symbol_list - A list of symbol strings
+            max_lookback - The maximum number of bars kept per symbol
+        """
+
+        self.feed = feed
+        super(LiveFeedDataHandler, self).__init__(
+            events, None, symbol_list, max_lookback, use_cache=False
+        )
+
+    def _open_convert_csv_files(self):
+        """
+        There is nothing to load, only the latest bar structures are set up
+        """
+
+        for s in self.symbol_list:
+            self._init_latest(s)
+
+    def get_total_bars(self):
+        """
+        The length of a live feed is not known in advance
+        """
+        return None
+
+    def get_bar_panel(self, val_type):
+        raise NotImplementedError("A live feed has no bar panel")
+
+    def update_bars(self):
+        raise NotImplementedError(
+            "Bars are pushed by the feed as they arrive, see on_bars()"
+        )
+
+    def on_bars(self, bars):
+        """
+        Pushes an update of the feed to the latest_symbol_data structure and
+        signals it with a MarketEvent. A symbol missing from the update
+        repeats its previous bar, as the historic handlers pad their data.
+
+        Parameters:
+            bars - A dict of symbol to bar record
+        """
+
+        datetime = next(iter(bars.values()))[0]
+        for s in self.symbol_list:
+            bar = bars.get(s)
+            if bar is None:
+                if not self.latest_symbol_data[s]:
+                    continue
+                bar = self.latest_symbol_data[s][-1]._replace(
+                    datetime=datetime
+                )
+            self.latest_symbol_data[s].append(bar)
+            values = self.latest_symbol_values[s]
+            for f, value in zip(self.bar_fields, bar[1:]):
+                values[f].append(value)
+        self.bar_index += 1
+        self.events.put(MarketEvent(datetime))
+
+class LocalBroker(object):
+    """
+    In-process stand-in for a brokerage connection. Every order submitted is
+    acknowledged after ack_latency seconds and then filled in full after a
+    further fill_latency seconds, each reported through a callback. Orders
+    are worked concurrently, each in its own task.
+    """
+
+    def __init__(self, on_status, on_fill, ack_latency=0.0, fill_latency=0.0,
+            exchange='ARCA'):
+        """
+        Parameters:
+            on_status - Called with (order_id, order, status)
+            on_fill - Called with (order_id, order) once the order is filled
+            ack_latency - Seconds before an order is acknowledged
+            fill_latency - Seconds between acknowledgement and fill
+            exchange - The exchange reported for the fills
+        """
+
+        self.on_status = on_status
+        self.on_fill = on_fill
+        self.ack_latency = ack_latency
+        self.fill_latency = fill_latency
+        self.exchange = exchange
+
+        self.next_order_id = 1
+        self.working = set()
+
+    def submit(self, order):
+        """
+        Accepts an order without waiting for it to be worked
+
+        Returns:
+            The order id given to the order
+        """
+
+        order_id = self.next_order_id
+        self.next_order_id += 1
+
+        task = asyncio.ensure_future(self._work(order_id, order))
+        self.working.add(task)
+        task.add_done_callback(self.working.discard)
+        return order_id
+
+    async def _work(self, order_id, order):
+        await asyncio.sleep(self.ack_latency)
+        self.on_status(order_id, order, 'ACKNOWLEDGED')
+        await asyncio.sleep(self.fill_latency)
+        self.on_fill(order_id, order)
+
+    async def drain(self):
+        """
+        Waits until every order submitted so far has been filled
+        """
+        while self.working:
+            await asyncio.wait(list(self.working))
+
+class LocalBrokerExecutionHandler(ExecutionHandler):
+    """
+    Sends orders to a LocalBroker and turns its acknowledgements and fills
+    into OrderStatusEvents and FillEvents as they arrive. The latencies are
+    class attributes so that a subclass can simulate a slower brokerage.
+    """
+
+    ack_latency = 0.0
+    fill_latency = 0.0
+
+    def __init__(self, events):
+        """
+        Initializes the handler and its broker
+
+        Parameters:
+            events - The Queue of Event objects
+        """
+
+        self.events = events
+        self.broker = LocalBroker(
+            self._on_status, self._on_fill, self.ack_latency,
+            self.fill_latency
+        )
+
+    def execute_order(self, event):
+        """
+        Submits the order to the broker and returns straight away
+
+        Parameters:
+            event - Contains an Event object with order information
+        """
+
+        if event.type == 'ORDER':
+            self.broker.submit(event)
+
+    def _on_status(self, order_id, order, status):
+        self.events.put(OrderStatusEvent(
+            order_id, order.symbol, status, order.strategy_id
+        ))
+
+    def _on_fill(self, order_id, order):
+        self.events.put(FillEvent(
+            dt.datetime.utcnow(), order.symbol, self.broker.exchange,
+            order.quantity, order.direction, None,
+            strategy_id=order.strategy_id
+        ))
+
+    async def drain(self):
+        """
+        Waits until every order sent so far has been filled
+        """
+        await self.broker.drain()
+
+class LiveEngine(Backtest):
+    """
+    Runs DataHandler, Strategy, Portfolio and ExecutionHandler objects on an
+    asyncio event loop. It takes the same arguments as the Backtest (without
+    the heartbeat), with an asynchronous feed passed in place of the csv_dir
+    for a data handler such as LiveFeedDataHandler.
+
+    Every event is dispatched as soon as it is awaited from the queue. The
+    next update of the feed is only pushed once every event caused by the
+    previous one has been handled, so the strategy always sees the bar its
+    MarketEvent was for. Acknowledgements and fills arriving meanwhile are
+    handled straight away.
+
+    An execution handler with a drain() coroutine (e.g.
+    LocalBrokerExecutionHandler) has its outstanding orders waited for at
+    the end of the feed and, when replaying, before every update, see the
+    Purpose above.
+
+    The quantity of the orders in flight is kept per Portfolio and symbol in
+    in_flight, and the signals of a symbol with an order in flight are held
+    back rather than sent to its Portfolio.
+    """
+
+    event_queue_cls = AsyncEventQueue
+
+    def __init__(
+        self, feed, symbol_list, initial_capital, start_date, data_handler,
+        execution_handler, portfolio, strategy, strategy_params=None,
+        stop_condition=None, shared_portfolio=False, replay=None,
+        max_lookback=1000):
+        """
+        Initialize the engine, see Backtest for the other parameters
+
+        Parameters:
+            replay - If True every order is settled before the next update
+            of the feed is pushed, as in a backtest. None is True for a
+            ReplayFeed and False for any other feed
+        """
+
+        if replay is None:
+            replay = isinstance(feed, ReplayFeed)
+        self.replay = replay
+        self.acks = 0
+        self.held_signals = 0
+        self.in_flight = {}
+        self._failure = None
+        super(LiveEngine, self).__init__(
+            feed, symbol_list, initial_capital, 0.0, start_date,
+            data_handler, execution_handler, portfolio, strategy, live=True,
+            strategy_params=strategy_params, stop_condition=stop_condition,
+            shared_portfolio=shared_portfolio, max_lookback=max_lookback
+        )
+
+    def _register_event_handlers(self):
+        """
+        Adds the order acknowledgements to the dispatch table of the Backtest
+        """
+
+        super(LiveEngine, self)._register_event_handlers()
+        self.register_handler(OrderStatusEvent, self._count_ack)
+
+        # The signals reach their Portfolio through _hold_signal(_batch),
+        # which the Backtest registered them to last
+        self._update_signal = self.event_handlers[SignalEvent].pop()
+        self._update_signal_batch = self.event_handlers[SignalBatchEvent].pop()
+        self.register_handler(SignalEvent, self._hold_signal)
+        self.register_handler(SignalBatchEvent, self._hold_signal_batch)
+
+        self.register_handler(OrderEvent, self._track_order)
+        self.register_handler(OrderBatchEvent, self._track_order_batch)
+        self.register_handler(FillEvent, self._track_fill)
+        self.register_handler(OrderStatusEvent, self._track_status)
+
+    def _count_ack(self, event):
+        """
+        Keeps count of the order acknowledgements for the performance output
+        """
+        if event.status == 'ACKNOWLEDGED':
+            self.acks += 1
+
+    def _in_flight_key(self, strategy_id, symbol):
+        """
+        The key of in_flight for a symbol of the Portfolio a strategy trades,
+        shared by all the strategies of a shared Portfolio. Events without a
+        known strategy_id are for the first Portfolio.
+        """
+        portfolio = self.portfolios.get(strategy_id, self.portfolio)
+        return id(portfolio), symbol
+
+    def _hold_signal(self, event):
+        """
+        Sends a SignalEvent on to its Portfolio, unless an order for its
+        symbol is still in flight
+        """
+
+        if self._in_flight_key(event.strategy_id, event.symbol) in \
+                self.in_flight:
+            self.held_signals += 1
+            return
+        self._update_signal(event)
+
+    def _hold_signal_batch(self, event):
+        """
+        Sends on a SignalBatchEvent without the signals of the symbols which
+        have an order in flight
+        """
+
+        keep = [
+            i for i, s in enumerate(event.symbols)
+            if self._in_flight_key(event.strategy_id, s) not in self.in_flight
+        ]
+        self.held_signals += len(event) - len(keep)
+        if len(keep) < len(event):
+            if not keep:
+                return
+            event = SignalBatchEvent(
+                event.strategy_id, event.datetime,
+                [event.symbols[i] for i in keep],
+                [event.signal_types[i] for i in keep],
+                [event.strengths[i] for i in keep]
+            )
+        self._update_signal_batch(event)
+
+    def _add_in_flight(self, strategy_id, symbol, quantity):
+        """
+        Adds to (or, for a negative quantity, takes from) the quantity in
+        flight of a symbol, forgetting it once nothing is left
+        """
+
+        key = self._in_flight_key(strategy_id, symbol)
+        quantity += self.in_flight.get(key, 0)
+        if quantity > 0:
+            self.in_flight[key] = quantity
+        else:
+            self.in_flight.pop(key, None)
+
+    def _track_order(self, event):
+        """
+        Records the quantity of an OrderEvent as in flight
+        """
+        self._add_in_flight(event.strategy_id, event.symbol, event.quantity)
+
+    def _track_order_batch(self, event):
+        """
+        Records the quantities of an OrderBatchEvent as in flight
+        """
+        for symbol, quantity in zip(event.symbols, event.quantities):
+            self._add_in_flight(event.strategy_id, symbol, quantity)
+
+    def _track_fill(self, event):
+        """
+        Takes the quantity of a (partial) fill off the quantity in flight
+        """
+        self._add_in_flight(event.strategy_id, event.symbol, -event.quantity)
+
+    def _track_status(self, event):
+        """
+        Forgets the quantity in flight of an order which was cancelled or
+        rejected, the part of it already filled was taken off by _track_fill
+        """
+
+        if event.status in (CANCELLED, REJECTED):
+            self.in_flight.pop(
+                self._in_flight_key(event.strategy_id, event.symbol), None
+            )
+
+    async def _dispatch(self):
+        """
+        Awaits the events and sends each one to its handlers, until _STOP is
+        received. A failing handler is recorded, the run is then stopped by
+        _run_async, and the remaining events are only consumed.
+        """
+
+        event_handlers = self.event_handlers
+        while True:
+            event = await self.events.get()
+            try:
+                if event is _STOP:
+                    return
+                if event is not None and self._failure is None:
+                    for handler in event_handlers.get(type(event), ()):
+                        handler(event)
+            except Exception as e:
+                self._failure = e
+            finally:
+                self.events.task_done()
+
+    async def _join(self):
+        """
+        Waits until every event queued so far has been handled
+        """
+
+        await self.events.join()
+        if self._failure is not None:
+            raise self._failure
+
+    async def _settle(self):
+        """
+        Waits until every event queued so far has been handled and every
+        order sent so far has been filled. Fills may lead to more events,
+        so this goes on until nothing is left.
+        """
+
+        await self._join()
+        drain = getattr(self.execution_handler, 'drain', None)
+        while drain is not None:
+            await drain()
+            if self.events.empty():
+                break
+            await self._join()
+
+    async def _run_async(self):
+        """
+        Pushes the updates of the feed as they arrive, then waits for the
+        outstanding orders to be filled
+        """
+
+        self.events.open()
+        dispatcher = asyncio.ensure_future(self._dispatch())
+        try:
+            async for bars in self.data_handler.feed:
+                if self.replay:
+                    await self._settle()
+                else:
+                    await self._join()
+                if self.stop_condition is not None and \
+                        self.stop_condition(self.portfolio):
+                    self.stopped_early = True
+                    break
+                self.data_handler.on_bars(bars)
+
+            await self._settle()
+        finally:
+            self.data_handler.continue_backtest = False
+            self.events.put(_STOP)
+            await dispatcher
+
+    def _run_backtest(self):
+        """
+        Runs the engine on a new event loop until the feed is exhausted
+        """
+        asyncio.run(self._run_async())
+
+    def _output_performance(self):
+        super(LiveEngine, self)._output_performance()
+        print("Acknowledgements: %s" % self.acks)
+        print("Held back signals: %s" % self.held_signals)
@@ -0,0 +1,491 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#==========================================================
+#====================== orderBook.py ======================
+#==========================================================
+
+# Purpose
+#----------------------------------------------------------
+# A limit order book for a single instrument, and a price-time priority
+# matching engine on top of it, for simulating execution at the level of
+# individual orders rather than bars.
+#
+# Each side keeps a dict of price level -> PriceLevel, a FIFO queue of the
+# orders resting at that price, and a heap of its prices so that the best
+# price is found in O(1) and a new level is added in O(log n). Every order is
+# also indexed by its ID, so a cancellation or execution of a known order is
+# O(1). Cancelled orders are only marked as such and dropped from their queue
+# once they reach its front (or the queue is compacted), and empty levels are
+# dropped from the heap the next time they reach its top.
+#
+# Prices are stored as whole numbers of ticks, so they can be compared and
+# used as dict keys exactly.
+#
+# Orders can be flagged as own orders: the simulated orders of a strategy
+# placed among the recorded orders of a replayed market (see
+# book_execution.py). They keep their place in the queue but do not count
+# towards the recorded volume of their level. Each side also keeps a heap of
+# the prices of its levels holding own orders, so the own orders an incoming
+# recorded order crosses are found without scanning the book.
+
+from __future__ import print_function
+
+from collections import deque, namedtuple
+import heapq
+
+BUY = 1
+SELL = -1
+
+# A trade between a resting (maker) order and an incoming (taker) one
+Trade = namedtuple('Trade', ['price', 'quantity', 'maker_id', 'taker_id'])
+
+class BookOrder(object):
+    """
+    An order resting in the book. A quantity of 0 marks an order which has
+    been filled or cancelled but is still in the queue of its level.
+    """
+
+    __slots__ = ('order_id', 'side', 'price', 'quantity', 'own')
+
+    def __init__(self, order_id, side, price, quantity, own=False):
+        """
+        Parameters:
+            order_id - The identifier of the order
+            side - BUY or SELL
+            price - The limit price in ticks
+            quantity - The quantity still resting
+            own - Whether this is one of our own (simulated) orders
+        """
+
+        self.order_id = order_id
+        self.side = side
+        self.price = price
+        self.quantity = quantity
+        self.own = own
+
+class PriceLevel(object):
+    """
+    The orders resting at one price, in time priority
+    """
+
+    __slots__ = ('orders', 'volume', 'live', 'own')
+
+    def __init__(self):
+        self.orders = deque()
+        self.volume = 0 # Recorded quantity resting, own orders excluded
+        self.live = 0 # Number of orders still resting, own ones included
+        self.own = 0 # Number of own orders still resting
+
+    def compact(self):
+        """
+        Drops the filled and cancelled orders from the queue
+        """
+        self.orders = deque(o for o in self.orders if o.quantity > 0)
+
+class OrderBook(object):
+    """
+    A limit order book with price-time priority matching
+    """
+
+    # A queue is compacted once it holds this many more dead orders than
+    # live ones
+    compact_threshold = 64
+
+    def __init__(self, tick_size=0.01):
+        """
+        Initializes an empty book
+
+        Parameters:
+            tick_size - The minimum price increment of the instrument
+        """
+
+        self.tick_size = tick_size
+        self.orders = {}
+        # The heaps hold the prices negated for the bids and as they are for
+        # the asks, so that the best price of either side is at the top
+        self.levels = {BUY: {}, SELL: {}}
+        self.heaps = {BUY: [], SELL: []}
+        self.own_heaps = {BUY: [], SELL: []}
+
+    def __len__(self):
+        return len(self.orders)
+
+    def __contains__(self, order_id):
+        return order_id in self.orders
+
+    def to_ticks(self, price):
+        """
+        Converts a price into a whole number of ticks
+        """
+        return int(round(price / self.tick_size))
+
+    def to_price(self, ticks):
+        """
+        Converts a whole number of ticks into a price
+        """
+        return round(ticks * self.tick_size, 10)
+
+    def _best(self, side):
+        """
+        Returns the best price level of a side in ticks, or None if the side
+        is empty, discarding the empty levels at the top of the heap
+        """
+
+        heap = self.heaps[side]
+        levels = self.levels[side]
+        while heap:
+            ticks = -heap[0] * side
+            level = levels.get(ticks)
+            if level is not None and level.live > 0:
+                return ticks
+            if level is not None:
+                del levels[ticks]
+            heapq.heappop(heap)
+        return None
+
+    def _iter_levels(self, side):
+        """
+        Yields the price levels of a side in ticks, best price first, empty
+        ones included, without changing the heap. The heap is walked from
+        its top, each level costing O(log k) for the k levels yielded so far
+        rather than a sort of the whole side.
+        """
+
+        heap = self.heaps[side]
+        if not heap:
+            return
+        candidates = [(heap[0], 0)]
+        while candidates:
+            key, i = heapq.heappop(candidates)
+            yield -key * side
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(heap):
+                    heapq.heappush(candidates, (heap[child], child))
+
+    def best_bid(self):
+        """
+        Returns the highest bid price, or None
+        """
+        ticks = self._best(BUY)
+        return None if ticks is None else self.to_price(ticks)
+
+    def best_ask(self):
+        """
+        Returns the lowest ask price, or None
+        """
+        ticks = self._best(SELL)
+        return None if ticks is None else self.to_price(ticks)
+
+    def depth(self, side, n_levels=5):
+        """
+        Returns the recorded volume of the best price levels of a side
+
+        Parameters:
+            side - BUY or SELL
+            n_levels - The number of price levels
+
+        Returns:
+            A list of (price, volume), best price first
+        """
+
+        levels = self.levels[side]
+        depth = []
+        for ticks in self._iter_levels(side):
+            if len(depth) == n_levels:
+                break
+            level = levels.get(ticks)
+            if level is not None and level.volume > 0:
+                depth.append((self.to_price(ticks), level.volume))
+        return depth
+
+    def add(self, order_id, side, price, quantity, own=False):
+        """
+        Places an order at the back of the queue of its price level, without
+        matching it, as a recorded order added to the book
+
+        Parameters:
+            order_id - The identifier of the order, unique in the book
+            side - BUY or SELL
+            price - The limit price
+            quantity - The quantity of the order
+            own - Whether this is one of our own (simulated) orders
+
+        Returns:
+            The BookOrder
+        """
+
+        if order_id in self.orders:
+            raise ValueError("Order ID %s is already in the book" % order_id)
+        return self._add(order_id, side, self.to_ticks(price), quantity, own)
+
+    def _add(self, order_id, side, ticks, quantity, own=False):
+        """
+        As add, with the price in ticks and without checking the order ID
+        """
+
+        levels = self.levels[side]
+        level = levels.get(ticks)
+        if level is None:
+            level = levels[ticks] = PriceLevel()
+            heapq.heappush(self.heaps[side], -ticks * side)
+
+        order = BookOrder(order_id, side, ticks, quantity, own)
+        level.orders.append(order)
+        level.live += 1
+        if own:
+            if level.own == 0:
+                heapq.heappush(self.own_heaps[side], -ticks * side)
+            level.own += 1
+        else:
+            level.volume += quantity
+        self.orders[order_id] = order
+        return order
+
+    def _remove(self, order, level, quantity):
+        """
+        Takes quantity off an order, removing it from the book once nothing
+        is left of it
+        """
+
+        order.quantity -= quantity
+        if not order.own:
+            level.volume -= quantity
+        if order.quantity > 0:
+            return
+
+        del self.orders[order.order_id]
+        level.live -= 1
+        if order.own:
+            level.own -= 1
+
+        orders = level.orders
+        while orders and orders[0].quantity <= 0:
+            orders.popleft()
+        dead = len(orders) - level.live
+        if dead > self.compact_threshold and dead > level.live:
+            level.compact()
+
+    def reduce(self, order_id, quantity):
+        """
+        Takes part of the quantity of an order off the book, keeping its
+        place in the queue. Unknown orders are ignored.
+
+        Returns:
+            The quantity taken off
+        """
+
+        order = self.orders.get(order_id)
+        if order is None:
+            return 0
+        quantity = min(quantity, order.quantity)
+        self._remove(order, self.levels[order.side][order.price], quantity)
+        return quantity
+
+    def cancel(self, order_id):
+        """
+        Removes an order from the book. Unknown orders are ignored.
+
+        Returns:
+            The quantity which was still resting
+        """
+
+        order = self.orders.get(order_id)
+        if order is None:
+            return 0
+        quantity = order.quantity
+        self._remove(order, self.levels[order.side][order.price], quantity)
+        return quantity
+
+    def _fill_own_ahead(self, level, quantity, until=None):
+        """
+        Fills the own orders of a level in queue order with the quantity
+        traded at its price, up to (not including) a given order
+
+        Returns:
+            A list of (order_id, quantity, price) filled
+        """
+
+        fills = []
+        price = None
+        for order in list(level.orders):
+            if order is until or quantity <= 0:
+                break
+            if order.own and order.quantity > 0:
+                if price is None:
+                    price = self.to_price(order.price)
+                filled = min(order.quantity, quantity)
+                quantity -= filled
+                fills.append((order.order_id, filled, price))
+                self._remove(order, level, filled)
+        return fills
+
+    def execute(self, order_id, quantity):
+        """
+        Applies a recorded execution of a resting order. The own orders ahead
+        of it in the queue would have been traded with first, so they are
+        filled with the executed quantity before it.
+
+        Returns:
+            A list of (order_id, quantity, price) filled of the own orders
+        """
+
+        order = self.orders.get(order_id)
+        if order is None:
+            return []
+
+        level = self.levels[order.side][order.price]
+        fills = []
+        if level.own:
+            fills = self._fill_own_ahead(level, quantity, until=order)
+        self._remove(order, level, min(quantity, order.quantity))
+        return fills
+
+    def trade(self, side, price, quantity):
+        """
+        Applies a recorded trade whose resting orders are not known, e.g.
+        from tick data: the quantity is taken off the level in queue order,
+        own orders included
+
+        Parameters:
+            side - The side of the resting orders traded with
+            price - The price of the trade
+            quantity - The quantity traded
+
+        Returns:
+            A list of (order_id, quantity, price) filled of the own orders
+        """
+
+        level = self.levels[side].get(self.to_ticks(price))
+        if level is None:
+            return []
+
+        fills = []
+        for order in list(level.orders):
+            if quantity <= 0:
+                break
+            if order.quantity <= 0:
+                continue
+            filled = min(order.quantity, quantity)
+            quantity -= filled
+            if order.own:
+                fills.append((order.order_id, filled, price))
+            self._remove(order, level, filled)
+        return fills
+
+    def match_own(self, side, ticks, quantity):
+        """
+        Fills the own orders of the opposite side which an incoming recorded
+        order crosses, in price-time priority and at their own prices, as
+        they would have traded with it first. The recorded order itself is
+        left as it is, own orders do not take liquidity away from recorded
+        ones.
+
+        Parameters:
+            side - The side of the incoming order
+            ticks - Its limit price in ticks
+            quantity - Its quantity
+
+        Returns:
+            A list of (order_id, quantity, price) filled of the own orders
+        """
+
+        other = -side
+        heap = self.own_heaps[other]
+        levels = self.levels[other]
+        fills = []
+        while quantity > 0 and heap:
+            own_ticks = -heap[0] * other
+            level = levels.get(own_ticks)
+            if level is None or level.own == 0:
+                heapq.heappop(heap)
+                continue
+            if (own_ticks - ticks) * other < 0:
+                break
+
+            price = self.to_price(own_ticks)
+            for order in list(level.orders):
+                if quantity <= 0:
+                    break
+                if order.own and order.quantity > 0:
+                    filled = min(order.quantity, quantity)
+                    quantity -= filled
+                    fills.append((order.order_id, filled, price))
+                    self._remove(order, level, filled)
+        return fills
+
+    def match(self, order_id, side, quantity, price=None, rest=True):
+        """
+        Matches an incoming order against the opposite side of the book in
+        price-time priority. Each price level reached is found in O(log n)
+        and each resting order traded with in O(1).
+
+        Parameters:
+            order_id - The identifier of the incoming order
+            side - BUY or SELL
+            quantity - The quantity of the order
+            price - The limit price, None for a market order
+            rest - Whether what is left of a limit order is added to the book
+
+        Returns:
+            The list of Trades, in the order they took place
+        """
+
+        other = -side
+        levels = self.levels[other]
+        limit = None if price is None else self.to_ticks(price)
+        trades = []
+
+        while quantity > 0:
+            best = self._best(other)
+            if best is None or (limit is not None and
+                    (best - limit) * side > 0):
+                break
+            level = levels[best]
+            while quantity > 0 and level.live > 0:
+                maker = level.orders[0]
+                filled = min(maker.quantity, quantity)
+                quantity -= filled
+                trades.append(Trade(
+                    self.to_price(best), filled, maker.order_id, order_id
+                ))
+                self._remove(maker, level, filled)
+
+        if quantity > 0 and price is not None and rest:
+            self.add(order_id, side, price, quantity)
+        return trades
+
+    def sweep(self, side, quantity, price=None):
+        """
+        Works out how an incoming order would trade against the recorded
+        orders of the opposite side, without changing the book
+
+        Parameters:
+            side - BUY or SELL
+            quantity - The quantity of the order
+            price - The limit price, None for a market order
+
+        Returns:
+            A list of (price, quantity) traded, best price first
+        """
+
+        other = -side
+        levels = self.levels[other]
+        limit = None if price is None else self.to_ticks(price)
+        fills = []
+
+        if self._best(other) is None:
+            return fills
+
+        for ticks in self._iter_levels(other):
+            if limit is not None and (ticks - limit) * side > 0:
+                break
+            level = levels.get(ticks)
+            if level is None or level.volume <= 0:
+                continue
+            filled = min(level.volume, quantity)
+            quantity -= filled
+            fills.append((self.to_price(ticks), filled))
+            if quantity <= 0:
+                break
+        return fills
@@ -0,0 +1,184 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#==========================================================
+#===================== orderState.py ======================
+#==========================================================
+
+# Purpose
+#----------------------------------------------------------
+# A brokerage reports on every order it is sent many times over: it is
+# acknowledged, may be filled in several parts, and may be cancelled or
+# rejected at any point before it is completely filled. The OrderStateStore
+# keeps the state of every order keyed by its order ID, so each report is
+# matched to its order in O(1), and turns the cumulative fill quantities the
+# brokerage reports into the increments each FillEvent is for.
+#
+# The states of an order, and the states each can move to:
+#
+#   SUBMITTED         -> ACKNOWLEDGED, PARTIALLY_FILLED, FILLED, CANCELLED,
+#                        REJECTED
+#   ACKNOWLEDGED      -> PARTIALLY_FILLED, FILLED, CANCELLED, REJECTED
+#   PARTIALLY_FILLED  -> PARTIALLY_FILLED, FILLED, CANCELLED, REJECTED
+#   FILLED, CANCELLED, REJECTED are final
+#
+# The rest of a partially filled order can still be rejected (e.g. IB turns
+# it Inactive), the part already filled stays filled.
+#
+# Reports may arrive late, twice, or out of order, a report which would move
+# an order backwards (or out of a final state) is ignored.
+
+from __future__ import print_function
+
+SUBMITTED = 'SUBMITTED'
+ACKNOWLEDGED = 'ACKNOWLEDGED'
+PARTIALLY_FILLED = 'PARTIALLY_FILLED'
+FILLED = 'FILLED'
+CANCELLED = 'CANCELLED'
+REJECTED = 'REJECTED'
+
+TRANSITIONS = {
+    SUBMITTED: (ACKNOWLEDGED, PARTIALLY_FILLED, FILLED, CANCELLED, REJECTED),
+    ACKNOWLEDGED: (PARTIALLY_FILLED, FILLED, CANCELLED, REJECTED),
+    PARTIALLY_FILLED: (PARTIALLY_FILLED, FILLED, CANCELLED, REJECTED),
+    FILLED: (),
+    CANCELLED: (),
+    REJECTED: (),
+}
+
+FINAL_STATES = (FILLED, CANCELLED, REJECTED)
+
+class OrderRecord(object):
+    """
+    The state of a single order at the brokerage
+    """
+
+    __slots__ = (
+        'order_id', 'symbol', 'exchange', 'direction', 'quantity',
+        'strategy_id', 'status', 'filled', 'avg_fill_price'
+    )
+
+    def __init__(self, order_id, symbol, exchange, direction, quantity,
+            strategy_id=None):
+        """
+        Parameters:
+            order_id - The identifier the brokerage knows the order by
+            symbol - The instrument of the order
+            exchange - The exchange the order is routed to
+            direction - 'BUY' or 'SELL'
+            quantity - The total quantity ordered
+            strategy_id - The strategy whose signal led to the order, if any
+        """
+
+        self.order_id = order_id
+        self.symbol = symbol
+        self.exchange = exchange
+        self.direction = direction
+        self.quantity = quantity
+        self.strategy_id = strategy_id
+
+        self.status = SUBMITTED
+        self.filled = 0
+        self.avg_fill_price = 0.0
+
+    @property
+    def remaining(self):
+        """
+        The quantity still to be filled
+        """
+        return self.quantity - self.filled
+
+    @property
+    def done(self):
+        """
+        Whether the order has reached a final state
+        """
+        return self.status in FINAL_STATES
+
+class OrderStateStore(object):
+    """
+    The OrderRecords of all the orders sent to a brokerage, indexed by order
+    ID, together with the set of the IDs of those not yet in a final state.
+
+    The store is not thread safe by itself, a handler receiving reports on
+    several threads must serialise its calls.
+    """
+
+    def __init__(self):
+        self.orders = {}
+        self.open_orders = set()
+
+    def __len__(self):
+        return len(self.orders)
+
+    def __contains__(self, order_id):
+        return order_id in self.orders
+
+    def get(self, order_id):
+        """
+        Returns the OrderRecord of an order ID, or None if it is unknown
+        """
+        return self.orders.get(order_id)
+
+    def add(self, order_id, symbol, exchange, direction, quantity,
+            strategy_id=None):
+        """
+        Records a newly submitted order and returns its OrderRecord, see
+        OrderRecord for the parameters
+        """
+
+        if order_id in self.orders:
+            raise ValueError("Order ID %s is already in use" % order_id)
+
+        record = OrderRecord(
+            order_id, symbol, exchange, direction, quantity, strategy_id
+        )
+        self.orders[order_id] = record
+        self.open_orders.add(order_id)
+        return record
+
+    def transition(self, order_id, status):
+        """
+        Moves an order to a new state, if that is a valid move from its
+        current state
+
+        Returns:
+            The OrderRecord if the order changed state, otherwise None
+        """
+
+        record = self.orders.get(order_id)
+        if record is None or status not in TRANSITIONS[record.status]:
+            return None
+
+        record.status = status
+        if status in FINAL_STATES:
+            self.open_orders.discard(order_id)
+        return record
+
+    def update_fill(self, order_id, filled, avg_fill_price):
+        """
+        Applies a report of the cumulative filled quantity of an order and its
+        average fill price, moving it to PARTIALLY_FILLED or FILLED.
+
+        Returns:
+            (quantity, price) of the part filled since the previous report,
+            or None if the report holds no new fill
+        """
+
+        record = self.orders.get(order_id)
+        if record is None or filled <= record.filled:
+            return None
+
+        status = FILLED if filled >= record.quantity else PARTIALLY_FILLED
+        if status not in TRANSITIONS[record.status]:
+            return None
+
+        # The price of the new part follows from the change in total cost
+        quantity = filled - record.filled
+        price = (filled * avg_fill_price - \
+            record.filled * record.avg_fill_price) / quantity
+
+        record.filled = filled
+        record.avg_fill_price = avg_fill_price
+        self.transition(order_id, status)
+        return quantity, price
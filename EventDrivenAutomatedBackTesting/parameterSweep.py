@@ -0,0 +1,175 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#==========================================================
+#=================== parameterSweep.py ====================
+#==========================================================
+
+# Purpose
+#----------------------------------------------------------
+# Strategy parameters (e.g. short_window/long_window of the Moving Average
+# Crossover, or ols_window/zscore_low/zscore_high of the intraday mean
+# reverting pairs strategy) are tuned by running the same Backtest over a grid
+# of values. The sweep below runs every combination of a parameter grid in its
+# own worker process, using all the cores of the machine, and collects the
+# summary statistics of every run into a single pandas DataFrame.
+#
+# Every run gets a fresh process, so a run that raises (or leaks memory) does
+# not affect any other. A worker process that dies (killed for running out of
+# memory, a segfault in an extension) breaks the whole pool, so the runs it
+# took down are run again one at a time, each in a pool of its own, and only
+# the run that kills its worker again is reported as failed. The rows of the
+# result always follow the order of the grid, whatever order the runs
+# complete in.
+
+from __future__ import print_function
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import itertools
+import multiprocessing
+import sys
+import traceback
+
+import pandas as pd
+
+from backtest import Backtest
+
+def parameter_grid(param_grid):
+    """
+    Expands a parameter grid into the list of all its combinations, in a
+    deterministic order (parameter names sorted, values in the given order).
+
+    Parameters:
+        param_grid - A dict of parameter name to list of values, e.g.
+        {'short_window': [50, 100], 'long_window': [200, 400]}
+    """
+
+    names = sorted(param_grid.keys())
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*[param_grid[n] for n in names])
+    ]
+
+def _parse_stat(value):
+    """
+    Turns a formatted statistic from output_summary_stats (e.g. '12.34%')
+    back into a float
+    """
+
+    try:
+        return float(value.rstrip('%'))
+    except (AttributeError, ValueError):
+        return value
+
+def _run_single(args):
+    """
+    Runs a single backtest of the sweep in a worker process. Any exception is
+    caught and returned so that one failed run never stops the sweep.
+    """
+
+    backtest_args, params, vectorized, stop_condition = args
+    try:
+        backtest = Backtest(
+            *backtest_args, strategy_params=params,
+            stop_condition=stop_condition
+        )
+        backtest.run_backtest(vectorized)
+        stats = backtest.portfolio.output_summary_stats(None)
+        stats = [(k, _parse_stat(v)) for k, v in stats]
+        if stop_condition is not None:
+            stats.append(("Stopped Early", backtest.stopped_early))
+        return stats, None
+    except Exception:
+        return [], traceback.format_exc()
+
+def _run_pool(tasks, workers):
+    """
+    Runs _run_single over the tasks in a pool of worker processes, a fresh
+    process per task where supported (Python 3.11+)
+
+    Returns:
+        The list of the results, in task order, None for the tasks lost to a
+        worker process which died
+    """
+
+    kwargs = {'max_workers': workers}
+    if sys.version_info >= (3, 11):
+        kwargs['max_tasks_per_child'] = 1
+    executor = ProcessPoolExecutor(**kwargs)
+    try:
+        futures = [executor.submit(_run_single, task) for task in tasks]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except BrokenProcessPool:
+                results.append(None)
+    finally:
+        executor.shutdown(wait=True)
+    return results
+
+def run_parameter_sweep(
+    csv_dir, symbol_list, initial_capital, heartbeat, start_date,
+    data_handler, execution_handler, portfolio, strategy, param_grid,
+    workers=None, vectorized=False, stop_condition=None):
+    """
+    Runs a Backtest for every combination of the parameter grid in a pool of
+    worker processes and collects the summary statistics.
+
+    Parameters:
+        csv_dir, ..., strategy - As for Backtest
+        param_grid - A dict of strategy parameter name to list of values
+        workers - The number of worker processes, defaults to the number of
+        cores
+        vectorized - Run each backtest in vectorized mode (see Backtest)
+        stop_condition - Optional early stopping rule of every run (see
+        Backtest), it must be picklable, i.e. a module level function
+
+    Returns:
+        A pandas DataFrame with one row per combination, in grid order, with
+        the parameters, the summary statistics (as floats, percentages in %)
+        and an 'error' column holding the traceback of any failed run.
+    """
+
+    backtest_args = (
+        csv_dir, symbol_list, initial_capital, heartbeat, start_date,
+        data_handler, execution_handler, portfolio, strategy
+    )
+    combinations = parameter_grid(param_grid)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+
+    tasks = [
+        (backtest_args, params, vectorized, stop_condition)
+        for params in combinations
+    ]
+    results = _run_pool(tasks, workers)
+
+    # A dead worker takes every run still in the pool down with it: run
+    # these again in isolation to find the one responsible
+    for i, result in enumerate(results):
+        if result is None:
+            result = _run_pool([tasks[i]], 1)[0]
+        if result is None:
+            result = ([], "The worker process running it died unexpectedly")
+        results[i] = result
+
+    rows = []
+    for params, (stats, error) in zip(combinations, results):
+        row = dict(params)
+        row.update(stats)
+        row['error'] = error
+        if error is not None:
+            print("Run %s failed:\n%s" % (params, error))
+        rows.append(row)
+
+    stat_names = []
+    for stats, error in results:
+        for k, v in stats:
+            if k not in stat_names:
+                stat_names.append(k)
+
+    return pd.DataFrame(
+        rows, columns=sorted(param_grid.keys()) + stat_names + ['error']
+    )
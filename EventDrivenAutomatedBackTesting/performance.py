@@ -33,6 +33,10 @@ def create_drawdowns(pnl):
     the duration of the drawdown. Requires that the pnl_returns is a pandas
     Series
 
+    The High Water Mark is a cumulative maximum and the durations count the
+    bars since the drawdown was last zero, so the whole curve is processed with
+    array operations rather than a Python loop over every bar.
+
     Parameters:
         pnl - A pandas Series representing period percentage returns.
 
@@ -40,20 +44,221 @@ def create_drawdowns(pnl):
         drawdown, duration - Highest peak-to-trough drawdown and duration
     """
 
-    # Calculate the cumulative returns curve and set up the High Water Mark
-    hwm = [0]
-
-    # Create the drawdown and duration series
     idx = pnl.index
-    drawdown = pd.Series(index = idx)
-    duration = pd.Series(index = idx)
+    values = np.asarray(pnl, dtype=np.float64)
+    n = len(values)
+
+    # Calculate the cumulative returns curve and set up the High Water Mark,
+    # which starts at zero and ignores missing values
+    hwm = np.zeros(n)
+    if n > 1:
+        hwm[1:] = np.fmax.accumulate(np.fmax(values[1:], 0.0))
 
-    # Loop over the index range
-    for t in range(1, len(idx)):
-        hwm.append(max(hwm[t-1], pnl[t]))
-        drawdown[t] = (hwm[t]-pnl[t])
-        duration[t] = (0 if drawdown[t] == 0 else duration[t-1]+1)
+    # Create the drawdown and duration series, undefined on the first bar
+    drawdown = hwm - values
+    drawdown[0:1] = np.nan
+
+    # The duration is the number of bars since the drawdown was last zero,
+    # undefined before the first time it is
+    bars = np.arange(n)
+    last_zero = np.maximum.accumulate(np.where(drawdown == 0.0, bars, -1))
+    duration = np.where(last_zero >= 0, bars - last_zero, np.nan)
+
+    drawdown = pd.Series(drawdown, index=idx)
+    duration = pd.Series(duration, index=idx)
 
     return drawdown, drawdown.max(), duration.max()
 
+class DrawdownTracker(object):
+    """
+    Streaming counterpart of create_drawdowns. The Portfolio updates it with
+    the equity curve one bar at a time, so the current and maximum drawdown
+    and its duration are known at any bar without rebuilding the curve.
+    """
+
+    def __init__(self):
+        """
+        Initializes the tracker with a High Water Mark of zero
+        """
+
+        self.hwm = 0.0
+        self.drawdown = float('nan')
+        self.duration = float('nan')
+        self.max_drawdown = float('nan')
+        self.max_duration = float('nan')
+
+    def update(self, pnl):
+        """
+        Updates the drawdown with the latest value of the equity curve
+
+        Parameters:
+            pnl - The latest value of the equity curve
+        """
+
+        if pnl > self.hwm:
+            self.hwm = pnl
+        self.drawdown = self.hwm - pnl
+
+        if self.drawdown == 0.0:
+            self.duration = 0
+        else:
+            self.duration += 1
+
+        # Like pandas, the maxima skip missing values
+        if not self.max_drawdown >= self.drawdown:
+            if self.drawdown == self.drawdown:
+                self.max_drawdown = self.drawdown
+        if not self.max_duration >= self.duration:
+            if self.duration == self.duration:
+                self.max_duration = self.duration
+
+class RunningStatistics(object):
+    """
+    Running mean and variance of a stream of values, using Welford's
+    algorithm so that they are numerically stable over millions of bars.
+    Missing (NaN) values are skipped, like np.mean/np.std on a pandas Series.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = float('nan')
+        self.m2 = 0.0
+
+    def update(self, x):
+        """
+        Adds the latest value to the statistics
+
+        Parameters:
+            x - The latest value
+        """
+
+        if x != x:
+            return
+        self.count += 1
+        if self.count == 1:
+            self.mean = x
+        else:
+            delta = x - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (x - self.mean)
+
+    @property
+    def variance(self):
+        """
+        The population variance (ddof=0, like np.std) of the values so far
+        """
+        if self.count == 0:
+            return float('nan')
+        return self.m2 / self.count
+
+    @property
+    def std(self):
+        """
+        The population standard deviation of the values so far
+        """
+        return np.sqrt(self.variance)
+
+class OnlinePerformance(object):
+    """
+    Streaming counterpart of the summary statistics of the Portfolio. It is
+    updated with the portfolio total on every bar and with the traded value
+    of every fill, so the total return, Sharpe Ratio, drawdown, turnover and
+    exposure of the run so far can all be read in O(1) at any bar, without
+    building the equity curve DataFrame (e.g. for live monitoring, or to stop
+    a hopeless run early).
+    """
+
+    def __init__(self, initial_capital, periods=252):
+        """
+        Parameters:
+            initial_capital - The starting capital of the portfolio
+            periods - Daily (252), Hourly (252*6.5), Minutely (252*6.5*60) etc.
+        """
+
+        self.initial_capital = initial_capital
+        self.periods = periods
+
+        self.bars = 0
+        self.total = initial_capital
+        self.returns = RunningStatistics()
+        self.equity = RunningStatistics()
+        self.drawdown = DrawdownTracker()
+
+        self.traded_value = 0.0
+        self.exposure = 0.0
+        self.exposures = RunningStatistics()
+
+    def update_bar(self, total, gross_value):
+        """
+        Updates the statistics with the latest bar of the portfolio
+
+        Parameters:
+            total - The total value of the portfolio, cash included
+            gross_value - The sum of the absolute market values of all the
+            positions
+        """
+
+        self.bars += 1
+        # Like pct_change, a return from a total of zero is missing
+        if self.total == 0:
+            self.returns.update(float('nan'))
+        else:
+            self.returns.update(total / self.total - 1.0)
+        self.total = total
+
+        self.equity.update(total)
+        self.drawdown.update(total / self.initial_capital)
+
+        # A portfolio worth nothing holds no exposure
+        self.exposure = gross_value / total if total != 0 else 0.0
+        self.exposures.update(self.exposure)
+
+    def update_fill(self, traded_value):
+        """
+        Updates the turnover with the (absolute) market value of a fill
+        """
+        self.traded_value += traded_value
+
+    @property
+    def total_return(self):
+        """
+        The return of the portfolio since the start, e.g. 0.05 for 5%
+        """
+        return self.total / self.initial_capital - 1.0
+
+    @property
+    def sharpe_ratio(self):
+        """
+        The Sharpe Ratio of the bar returns so far, as create_sharpe_ratio
+        """
+        return np.sqrt(self.periods) * self.returns.mean / self.returns.std
+
+    @property
+    def max_drawdown(self):
+        """
+        The largest peak-to-trough drawdown so far, as create_drawdowns
+        """
+        return self.drawdown.max_drawdown
+
+    @property
+    def drawdown_duration(self):
+        """
+        The longest drawdown duration (in bars) so far, as create_drawdowns
+        """
+        return self.drawdown.max_duration
+
+    @property
+    def turnover(self):
+        """
+        The total traded value as a multiple of the average portfolio value
+        """
+        if self.equity.count == 0:
+            return 0.0
+        return self.traded_value / self.equity.mean
 
+    @property
+    def mean_exposure(self):
+        """
+        The average gross exposure (gross value / total) over all bars
+        """
+        return self.exposures.mean
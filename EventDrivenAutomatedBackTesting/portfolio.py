@@ -30,8 +30,25 @@ except ImportError:
 import numpy as np
 import pandas as pd
 
-from event import FillEvent, OrderEvent
-from performance import create_sharpe_ratio, create_drawdowns
+from event import FillEvent, OrderEvent, OrderBatchEvent
+from ledger import Ledger
+from performance import create_sharpe_ratio, create_drawdowns, \
+    OnlinePerformance
+
+def calculate_ib_commission(quantity):
+    """
+    Array version of FillEvent.calculate_ib_commission, used when a whole
+    panel of fills is costed at once.
+
+    Parameters:
+        quantity - A NumPy array of (absolute) filled quantities
+    """
+
+    return np.where(
+        quantity <= 500,
+        np.maximum(1.3, 0.013*quantity),
+        np.maximum(1.3, 0.008*quantity)
+    )
 
 class Portfolio(object):
     """
@@ -45,8 +62,15 @@ class Portfolio(object):
     The holdings DataFrame stores the cash and total market holdings value of
     each symbol for a particular time-index, as well as the percentage change
     in portfolio total across bars.
+
+    Both are recorded bar by bar in a columnar Ledger (see ledger.py) rather
+    than as lists of dictionaries.
     """
 
+    mkt_quantity = 100 # Arbitrary fixed order size, see generate_naive_order
+    price_field = "adj_close" # The bar field positions are marked at
+    periods = 252 # Number of bars per year, for the Sharpe Ratio
+
     def __init__(self, bars, events, start_date, initial_capital=100000.0):
         """
         Initializes the portfolio with bars and an event queue. Also includes a
@@ -70,20 +94,23 @@ class Portfolio(object):
         self.current_positions = dict( (k,v) for k, v in \
             [(s, 0) for s in self.symbol_list] )
 
-        self.all_holdings = self.construct_all_positions()
+        self.all_holdings = self.construct_all_holdings()
         self.current_holdings = self.construct_current_holdings()
 
-    def construct_all_positions(Self):
+        # Summary statistics of the run so far, kept up to date bar by bar
+        self.performance = OnlinePerformance(
+            self.initial_capital, self.periods
+        )
+
+    def construct_all_positions(self):
         """
-        Constructs the positions list using the start_Date to determine
+        Constructs the positions ledger using the start_Date to determine
         when the time index will begin.
         """
 
-        # Use a dictionary comprehension to generate the time - price
-        # key-value pairs dictionary
-        d = dict( (k,v) for k, v in [(s, 0) for s in self.symbol_list] )
-        d['datetime'] = self.start_date
-        return [d]
+        ledger = Ledger(self.symbol_list)
+        ledger.append(self.start_date, [0] * len(self.symbol_list))
+        return ledger
 
     def construct_all_holdings(self):
         """
@@ -95,21 +122,20 @@ class Portfolio(object):
         requirements or shorting constraints.
         """
 
-        d = dict( (k,v) for k, v in [(s, 0.0) for s in self.symbol_list])
-        d['datetime'] = self.start_date
-        d['cash'] = self.initial_capital
-        d['commission'] = 0.0
-        d['total'] = self.initial_capital
-        return [d]
+        ledger = Ledger(self.symbol_list + ['cash', 'commission', 'total'])
+        ledger.append(self.start_date, [0.0] * len(self.symbol_list) + [
+            self.initial_capital, 0.0, self.initial_capital
+        ])
+        return ledger
 
     def construct_current_holdings(self):
         """
         Constructs the dictionary which will hold the instantaneous value of
         the portfolio across all symbols.
 
-        Note that the function is almost identical to the
-        'construct_all_holdings', the only difference being that it does not
-        wrap the dictionary in a list at the return. This is because we will
+        Note that the function holds the same fields as
+        'construct_all_holdings', the only difference being that it is a
+        single dictionary rather than a ledger. This is because we will
         only want one accumulated value/entry
         """
 
@@ -138,37 +164,41 @@ class Portfolio(object):
         Leverages individual MarketEvent from the events queue.
         """
 
-        latest_datetime =
-        self.bars.get_latest_bar_datetime(self.symbol_list[0])
+        latest_datetime = \
+            self.bars.get_latest_bar_datetime(self.symbol_list[0])
 
         # Update positions:
         # =================================================
-        dp = dict( (k,v) for k, v in [(s, 0) for s in self.symbol_list])
-        dp['datetime'] = latest_datetime
-
-        for s in self.symbol_list:
-            dp[s] = self.current_positions
+        dp = [self.current_positions[s] for s in self.symbol_list]
 
         # Append the current positions
-         self.all_positions.append(dp)
+        self.all_positions.append(latest_datetime, dp)
 
         # Update holdings
         # =================================================
-        dh = dict( (k,v) for k, v in [(s, 0) for s in self.symbol_list] )
-        dh['datetime'] = latest_datetime
-        dh['cash'] = self.current_holdings['cash']
-        dh['commission'] = self.current_holdings['commission']
-        dh['total'] = self.current_holdings['cash']
+        dh = []
+        total = self.current_holdings['cash']
+        gross_value = 0.0
 
         for s in self.symbol_list:
             # Approximation to the real value
             market_value = self.current_positions[s] * \
-                self.bars.get_latest_bar_value(s, "adj_close")
-            dh[s] = market_value
-            dh['total'] += market_value
+                self.bars.get_latest_bar_value(s, self.price_field)
+            dh.append(market_value)
+            total += market_value
+            gross_value += abs(market_value)
+
+        dh.extend([
+            self.current_holdings['cash'],
+            self.current_holdings['commission'],
+            total
+        ])
 
         # Append the current holdings
-        self.all_holdings.append(dh)
+        self.all_holdings.append(latest_datetime, dh)
+
+        # Update the running summary statistics
+        self.performance.update_bar(total, gross_value)
 
     def update_positions_from_fill(self, fill):
         """
@@ -215,12 +245,15 @@ class Portfolio(object):
             fill_dir = -1
 
         # Update the holdings list with new quantities
-        fill_cost = self.bars.get_latest_bar_value(fill.symbol, "adj_close")
+        fill_cost = self.bars.get_latest_bar_value(
+            fill.symbol, self.price_field
+        )
         cost = fill_dir * fill_cost * fill.quantity
         self.current_holdings[fill.symbol] += cost
-        self.current_holdingsp['commissions'] += fill.commission
+        self.current_holdings['commission'] += fill.commission
         self.current_holdings['cash'] -= (cost + fill.commission)
         self.current_holdings['total'] -= (cost + fill.commission)
+        self.performance.update_fill(abs(cost))
 
     def update_fill(self, event):
         """
@@ -265,20 +298,26 @@ class Portfolio(object):
         direction = signal.signal_type
         strength = signal.strength
 
-        mkt_quantity = 100 # Arbitrary
+        mkt_quantity = self.mkt_quantity
 
         cur_quantity = self.current_positions[symbol]
         order_type = 'MKT'
 
+        strategy_id = signal.strategy_id
+
         if direction == 'LONG' and cur_quantity == 0:
-            order = OrderEvent(symbol, order_type, mkt_quantity, 'BUY')
+            order = OrderEvent(symbol, order_type, mkt_quantity, 'BUY',
+                strategy_id)
         if direction == 'SHORT' and cur_quantity == 0:
-            order = OrderEvent(symbol, order_type, mkt_quantity, 'SELL')
+            order = OrderEvent(symbol, order_type, mkt_quantity, 'SELL',
+                strategy_id)
 
         if direction == 'EXIT' and cur_quantity > 0:
-            order = OrderEvent(symbol, order_type, abs(cur_quantity), 'SELL')
+            order = OrderEvent(symbol, order_type, abs(cur_quantity), 'SELL',
+                strategy_id)
         if direction == 'EXIT' and cur_quantity < 0:
-            order = OrderEvent(symbol, order_type, abs(cur_quantity), 'BUY')
+            order = OrderEvent(symbol, order_type, abs(cur_quantity), 'BUY',
+                strategy_id)
 
         return order
 
@@ -292,6 +331,58 @@ class Portfolio(object):
             order_event = self.generate_naive_order(event)
             self.events.put(order_event)
 
+    def generate_naive_order_batch(self, batch):
+        """
+        Vectorized counterpart of generate_naive_order, sizing all the
+        signals of a SignalBatchEvent at once with the same rules: LONG and
+        SHORT open a position of mkt_quantity shares when flat, EXIT closes
+        the whole current position, and anything else is ignored.
+
+        Parameters:
+            batch - The SignalBatchEvent
+
+        Returns:
+            An OrderBatchEvent, or None if none of the signals leads to an
+            order
+        """
+
+        symbols = np.asarray(batch.symbols, dtype=object)
+        direction = np.asarray(batch.signal_types, dtype=object)
+        cur_quantity = np.array(
+            [self.current_positions[s] for s in batch.symbols], dtype=np.int64
+        )
+
+        is_long = direction == 'LONG'
+        is_short = direction == 'SHORT'
+        is_exit = direction == 'EXIT'
+        flat = cur_quantity == 0
+
+        quantity = np.where(
+            (is_long | is_short) & flat, self.mkt_quantity,
+            np.where(is_exit, np.abs(cur_quantity), 0)
+        )
+        buy = is_long | (is_exit & (cur_quantity < 0))
+        side = np.where(buy, 'BUY', 'SELL')
+
+        traded = quantity > 0
+        if not traded.any():
+            return None
+        return OrderBatchEvent(
+            symbols[traded].tolist(), 'MKT', quantity[traded].tolist(),
+            side[traded].tolist(), batch.strategy_id
+        )
+
+    def update_signal_batch(self, event):
+        """
+        Acts on a SignalBatchEvent to generate a single OrderBatchEvent for
+        all of its signals
+        """
+
+        if event.type == 'SIGNAL_BATCH':
+            order_batch = self.generate_naive_order_batch(event)
+            if order_batch is not None:
+                self.events.put(order_batch)
+
     def create_equity_curve_dataframe(self):
         """
         The equity curve is the most important outcome of the portfolio. In
@@ -299,16 +390,113 @@ class Portfolio(object):
         basis with the initial account size as 1.0 (rather than absolute dollar
         amount).
 
-        Creates a pandas DataFrame from the all_holdings list of dictionaries.
+        Creates a pandas DataFrame wrapping the all_holdings ledger.
         """
 
-        curve = pd.DataFrame(self.all_holdings)
-        curve.set_index('datetime', inplace=True)
+        curve = self.all_holdings.to_dataframe()
         curve['returns'] = curve['total'].pct_change()
         curve['equity_curve'] = (1.0+curve['returns']).cumprod()
         self.equity_curve = curve
 
-    def output_summary_stats(self):
+    def create_vectorized_equity_curve_dataframe(self, signals):
+        """
+        Builds the same equity curve DataFrame as
+        create_equity_curve_dataframe, but from a whole panel of signals at
+        once rather than from the bar-by-bar holdings list. Used by the
+        vectorized mode of the Backtest.
+
+        The event-driven loop records the holdings of bar t BEFORE the signals
+        of bar t are filled, and fills at the latest close of bar t. The same
+        ordering is reproduced here by lagging the positions and the cash by
+        one bar, and the signals are sized with the rules of
+        generate_naive_order (a LONG or SHORT only opens a position when
+        flat, so a reversal needs an EXIT first), so both modes give
+        identical curves for strategies without path-dependent sizing.
+
+        Parameters:
+            signals - A DataFrame (datetime index, one column per symbol) of
+            1.0 (LONG), -1.0 (SHORT), 0.0 (EXIT) or NaN (no signal).
+
+        Returns:
+            The number of fills generated over the whole run.
+        """
+
+        prices = self.bars.get_bar_panel(self.price_field)
+        signals = signals.reindex(
+            index=prices.index, columns=self.symbol_list
+        )
+
+        # The position each signal leaves, sized as generate_naive_order
+        # does: LONG and SHORT are ignored unless flat, EXIT always flattens.
+        # Only the bars with a signal are visited, the position is held
+        # until the next one.
+        values = signals.values
+        targets = np.full(values.shape, np.nan)
+        for j in range(values.shape[1]):
+            position = 0.0
+            for i in np.flatnonzero(~np.isnan(values[:, j])).tolist():
+                signal = values[i, j]
+                if signal == 0.0 or position == 0.0:
+                    position = signal
+                targets[i, j] = position
+        targets = pd.DataFrame(targets).ffill().fillna(0.0).values * \
+            self.mkt_quantity
+        px = prices.values
+
+        # Trades made at each bar and what they cost, commission included
+        trades = np.diff(targets, axis=0, prepend=0.0)
+        traded = trades != 0.0
+        commission = np.cumsum(np.where(
+            traded, calculate_ib_commission(np.abs(trades)), 0.0
+        ).sum(axis=1))
+        paid = np.cumsum(np.where(traded, trades * px, 0.0).sum(axis=1)) + \
+            commission
+
+        # Lag everything by one bar, the holdings of bar t are marked before
+        # the fills of bar t arrive
+        positions = np.vstack([np.zeros((1, targets.shape[1])), targets[:-1]])
+        final_paid, final_commission = paid[-1], commission[-1]
+        paid = np.concatenate([[0.0], paid[:-1]])
+        commission = np.concatenate([[0.0], commission[:-1]])
+
+        holdings = positions * px
+        curve = pd.DataFrame(holdings, index=prices.index,
+            columns=self.symbol_list)
+        curve['cash'] = self.initial_capital - paid
+        curve['commission'] = commission
+        curve['total'] = curve['cash'] + holdings.sum(axis=1)
+
+        # Prepend the starting row exactly as construct_all_holdings does
+        start = self.construct_all_holdings().to_dataframe()
+        curve = pd.concat([start[curve.columns], curve])
+        curve.index.name = 'datetime'
+
+        curve['returns'] = curve['total'].pct_change()
+        curve['equity_curve'] = (1.0+curve['returns']).cumprod()
+        self.equity_curve = curve
+
+        # Feed the online statistics the same bars and fills as the
+        # event-driven loop would
+        gross_values = np.abs(holdings).sum(axis=1)
+        for total, gross_value in zip(curve['total'].values[1:].tolist(),
+                gross_values.tolist()):
+            self.performance.update_bar(total, gross_value)
+        self.performance.update_fill(
+            float(np.abs(np.where(traded, trades * px, 0.0)).sum())
+        )
+
+        # Leave the portfolio in its final state
+        for i, s in enumerate(self.symbol_list):
+            self.current_positions[s] = int(targets[-1, i])
+            self.current_holdings[s] = targets[-1, i] * px[-1, i]
+        self.current_holdings['cash'] = self.initial_capital - final_paid
+        self.current_holdings['commission'] = final_commission
+        self.current_holdings['total'] = self.current_holdings['cash'] + \
+            sum(self.current_holdings[s] for s in self.symbol_list)
+
+        return int(traded.sum())
+
+    def output_summary_stats(self, equity_filename='equity.csv'):
         """
         Creates a list of summary statistics for the portfolio
 
@@ -317,13 +505,17 @@ class Portfolio(object):
 
         Can be loaded into a Matplotlib script, or spreadsheet software for
         analysis
+
+        Parameters:
+            equity_filename - Where to write the equity curve, None to skip
+            writing it (e.g. when many backtests run side by side)
         """
 
-        total_return = self.equity_curve['equity_curve'][-1]
+        total_return = self.equity_curve['equity_curve'].iloc[-1]
         returns = self.equity_curve['returns']
         pnl = self.equity_curve['equity_curve']
 
-        sharpe_ratio = create_sharpe_ratio(returns)
+        sharpe_ratio = create_sharpe_ratio(returns, self.periods)
         drawdown, max_dd, dd_duration = create_drawdowns(pnl)
         self.equity_curve['drawdown'] = drawdown
 
@@ -333,7 +525,8 @@ class Portfolio(object):
                 ("Max Drawdown", "%0.2f%%" % (max_dd * 100.0)),
                 ("Drawdown Duration", "%d" % dd_duration)]
 
-        self.equity_curve.to_csv('equity.csv')
+        if equity_filename is not None:
+            self.equity_curve.to_csv(equity_filename)
 
         return stats
 
@@ -0,0 +1,81 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#==========================================================
+#====================== progress.py =======================
+#==========================================================
+
+# Purpose
+#----------------------------------------------------------
+# Printing to the console on every bar is surprisingly expensive over
+# multi-million bar backtests. The ProgressReporter is told about every bar
+# but only prints at most once per interval (a second by default), reporting
+# the throughput in bars/sec and, when the total number of bars is known, an
+# estimate of the remaining time.
+
+from __future__ import print_function
+
+import datetime as dt
+import time
+
+class ProgressReporter(object):
+    """
+    Rate limited progress output for the backtest loop
+    """
+
+    def __init__(self, total=None, interval=1.0, clock=time.time):
+        """
+        Initializes the reporter and starts its clock
+
+        Parameters:
+            total - The total number of bars, or None if unknown
+            interval - The minimum number of seconds between two reports
+            clock - The wall clock function, in seconds
+        """
+
+        self.total = total
+        self.interval = interval
+        self.clock = clock
+
+        self.start = self.clock()
+        self.last_report = self.start
+
+    def update(self, bars):
+        """
+        Reports progress if at least interval seconds have passed since the
+        last report
+
+        Parameters:
+            bars - The number of bars processed so far
+        """
+
+        now = self.clock()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            print(self.format(bars, now))
+
+    def format(self, bars, now):
+        """
+        Returns the progress line for a number of bars processed at time now
+        """
+
+        elapsed = now - self.start
+        rate = bars / elapsed if elapsed > 0 else 0.0
+
+        if self.total is None or rate == 0.0:
+            return "Bars: %d, %.0f bars/sec" % (bars, rate)
+
+        eta = dt.timedelta(seconds=int((self.total - bars) / rate))
+        return "Bars: %d/%d (%.1f%%), %.0f bars/sec, ETA %s" % (
+            bars, self.total, 100.0 * bars / self.total, rate, eta
+        )
+
+    def finish(self, bars):
+        """
+        Reports the final throughput
+
+        Parameters:
+            bars - The total number of bars processed
+        """
+
+        print(self.format(bars, self.clock()))
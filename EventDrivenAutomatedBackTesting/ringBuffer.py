@@ -0,0 +1,89 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#==========================================================
+#===================== ringBuffer.py ======================
+#==========================================================
+
+# Purpose
+#----------------------------------------------------------
+# Strategies only ever look back a bounded number of bars (e.g. the 400 bar
+# long window of the Moving Average Crossover), yet the data handlers used to
+# keep every bar they had ever pushed. The RingBuffer below keeps a fixed,
+# preallocated window of the latest values of a single bar field so memory
+# stays flat over arbitrarily long backtests, and hands out the latest N
+# values as a NumPy view without copying.
+
+from __future__ import print_function
+
+import numpy as np
+
+class RingBuffer(object):
+    """
+    A fixed size circular buffer of NumPy values.
+
+    Every value is written twice, at position i and i + size of an array of
+    length 2*size. The latest N values (N <= size) are therefore always a
+    contiguous slice of that array and can be returned as a zero-copy view,
+    at the cost of one extra store per append.
+    """
+
+    def __init__(self, size, dtype=np.float64):
+        """
+        Initializes the buffer
+
+        Parameters:
+            size - The maximum number of values kept (the maximum lookback)
+            dtype - The NumPy dtype of the stored values
+        """
+
+        if size < 1:
+            raise ValueError("RingBuffer size must be at least 1")
+
+        self.size = size
+        self.count = 0
+        self._data = np.zeros(2*size, dtype=dtype)
+
+    def __len__(self):
+        """
+        Returns the number of values currently available
+        """
+        return min(self.count, self.size)
+
+    def append(self, value):
+        """
+        Adds a new value, overwriting the oldest one if the buffer is full
+
+        Parameters:
+            value - The value to add
+        """
+
+        i = self.count % self.size
+        self._data[i] = value
+        self._data[i + self.size] = value
+        self.count += 1
+
+    def latest(self, N=1):
+        """
+        Returns a view of the last N values, oldest first, or N-k if less are
+        available.
+
+        The view points into the buffer itself, it is only valid until the
+        next append. Take a copy if the values must be kept.
+
+        Parameters:
+            N - The number of values requested
+        """
+
+        n = min(N, len(self))
+        end = (self.count - 1) % self.size + self.size + 1
+        return self._data[end-n:end]
+
+    def last(self):
+        """
+        Returns the most recently appended value
+        """
+
+        if self.count == 0:
+            raise IndexError("RingBuffer is empty")
+        return self._data[(self.count - 1) % self.size]
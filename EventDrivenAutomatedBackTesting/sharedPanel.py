@@ -0,0 +1,209 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#==========================================================
+#===================== sharedPanel.py =====================
+#==========================================================
+
+# Purpose
+#----------------------------------------------------------
+# When many backtests run in parallel over the same universe (see
+# parameterSweep.py) every process used to read, parse and hold its own copy
+# of the same bars. The SharedBarPanel loads the aligned bars of a universe
+# into a single block of shared memory once, and the SharedPanelDataHandler
+# attaches to it read-only, so N worker processes share one physical copy.
+#
+# Layout of the shared block, for T bars, S symbols and F fields:
+#   [ datetime64[ns] x T | float64 x S x T x F ]
+# so each symbol's bars are one contiguous T x F array, exactly the layout the
+# historic data handlers use.
+#
+# NOTE: requires Python 3.8+ for multiprocessing.shared_memory
+
+from __future__ import print_function
+
+import os, os.path
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+from barCache import read_csv_bars
+from dataHandler import HistoricCSVDataHandler
+from hft_dataHandler import HistoricCSVDataHandlerHFT
+
+def _attach(name):
+    """
+    Attaches to an existing shared memory block, which belongs to whoever
+    created the panel.
+    """
+
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 every attach is tracked. Worker processes
+        # started by multiprocessing share the resource tracker of their
+        # parent, so this only registers the block a second time
+        return shared_memory.SharedMemory(name=name)
+
+def _panel_arrays(shm, descriptor):
+    """
+    Returns the (datetimes, bars) arrays of a panel on top of its block
+    """
+
+    n_bars = descriptor['n_bars']
+    shape = (
+        len(descriptor['symbols']), n_bars, len(descriptor['fields'])
+    )
+    datetimes = np.ndarray(
+        (n_bars,), dtype='datetime64[ns]', buffer=shm.buf
+    )
+    bars = np.ndarray(
+        shape, dtype=np.float64, buffer=shm.buf, offset=datetimes.nbytes
+    )
+    return datetimes, bars
+
+class SharedBarPanel(object):
+    """
+    Owns the shared memory block holding the aligned bars of a universe.
+
+    The panel is created once in the parent process, its descriptor (a small
+    picklable dict) is handed to the workers in place of the csv_dir, and the
+    block is released with unlink() (or by using the panel as a context
+    manager) once all the workers are done.
+    """
+
+    def __init__(self, csv_dir, symbol_list, columns, use_cache=True):
+        """
+        Reads the CSV files, pads them onto a common index exactly as the
+        historic data handlers do and copies them into shared memory.
+
+        Parameters:
+            csv_dir - Absolute directory path to the CSV files
+            symbol_list - A list of symbol strings
+            columns - The CSV column names, e.g.
+            HistoricCSVDataHandler.csv_columns
+            use_cache - Whether to go through the binary CSV cache
+        """
+
+        if shared_memory is None:
+            raise RuntimeError("SharedBarPanel requires Python 3.8 or later")
+
+        frames = {}
+        comb_index = None
+        for s in symbol_list:
+            frames[s] = read_csv_bars(
+                os.path.join(csv_dir, '%s.csv' % s), columns,
+                use_cache=use_cache
+            )
+            if comb_index is None:
+                comb_index = frames[s].index
+            else:
+                comb_index = comb_index.union(frames[s].index)
+
+        self.descriptor = {
+            'name': None,
+            'symbols': list(symbol_list),
+            'fields': list(columns[1:]),
+            'n_bars': len(comb_index),
+        }
+        size = len(comb_index) * (
+            8 + 8 * len(symbol_list) * len(self.descriptor['fields'])
+        )
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.descriptor['name'] = self.shm.name
+
+        datetimes, bars = _panel_arrays(self.shm, self.descriptor)
+        datetimes[:] = comb_index.values.astype('datetime64[ns]')
+        for i, s in enumerate(symbol_list):
+            bars[i] = frames[s].reindex(index=comb_index, method='pad')\
+                [self.descriptor['fields']].values
+            del frames[s]
+
+    def close(self):
+        """
+        Detaches this process from the panel
+        """
+        self.shm.close()
+
+    def unlink(self):
+        """
+        Detaches and destroys the panel, workers must be done with it
+        """
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.unlink()
+
+class SharedPanelDataHandler(HistoricCSVDataHandler):
+    """
+    SharedPanelDataHandler serves the bars of a SharedBarPanel, attaching to
+    the shared memory block read-only instead of reading any CSV file. It
+    behaves exactly like the HistoricCSVDataHandler otherwise.
+
+    As it is constructed by the Backtest, the panel descriptor is passed in
+    place of the csv_dir.
+    """
+
+    def __init__(self, events, panel, symbol_list, max_lookback=1000):
+        """
+        Initializes the data handler on a shared panel
+
+        Parameters:
+            events - The Event Queue
+            panel - The descriptor of the SharedBarPanel
+            symbol_list - A list of symbol strings, all in the panel
+            max_lookback - The maximum number of bars kept per symbol
+        """
+
+        self.panel = panel
+        self.shm = None
+        super(SharedPanelDataHandler, self).__init__(
+            events, None, symbol_list, max_lookback, use_cache=False
+        )
+
+    def _open_convert_csv_files(self):
+        """
+        Attaches to the shared panel instead of reading the CSV files
+        """
+
+        if self.panel['fields'] != self.bar_fields:
+            raise ValueError(
+                "The shared panel fields %s do not match %s" %
+                (self.panel['fields'], self.bar_fields)
+            )
+
+        self.shm = _attach(self.panel['name'])
+        datetimes, bars = _panel_arrays(self.shm, self.panel)
+        datetimes.flags.writeable = False
+        bars.flags.writeable = False
+
+        self.bar_datetimes = datetimes
+        for s in self.symbol_list:
+            self.symbol_data[s] = bars[self.panel['symbols'].index(s)]
+            self._init_latest(s)
+
+    def _get_new_bar(self, symbol):
+        """
+        Returns the bar under the cursor as a bar record, converting the
+        shared datetime64 into a python datetime object
+        """
+
+        return self.bar_record(
+            self.bar_datetimes[self.bar_index].astype('datetime64[us]').item(),
+            *self.symbol_data[symbol][self.bar_index].tolist()
+        )
+
+class SharedPanelDataHandlerHFT(SharedPanelDataHandler):
+    """
+    SharedPanelDataHandler for a panel of DTN IQFeed minutely bars
+    """
+
+    csv_columns = HistoricCSVDataHandlerHFT.csv_columns
+    bar_record = HistoricCSVDataHandlerHFT.bar_record
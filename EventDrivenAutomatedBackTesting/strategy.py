@@ -14,8 +14,6 @@
 
 from __future__ import print_function
 
-from abc import print_function
-
 from abc import ABCMeta, abstractmethod
 import datetime
 try:
@@ -44,6 +42,10 @@ class Strategy(object):
 
     __metaclass__ = ABCMeta
 
+    # Tags every SignalEvent of the strategy, the Backtest assigns a distinct
+    # one to each strategy it hosts
+    strategy_id = 1
+
     @abstractmethod
     def calculate_signals(self):
         """
@@ -51,3 +53,15 @@ class Strategy(object):
         """
         raise NotImplementedError("Should implement calculate _signals()")
 
+    def calculate_vectorized_signals(self):
+        """
+        Optionally provides the signals over the whole bar panel at once, for
+        the vectorized mode of the Backtest. Should return a pandas DataFrame
+        indexed on datetime with one column per symbol containing 1.0 (LONG),
+        -1.0 (SHORT), 0.0 (EXIT) or NaN (no signal) for each bar.
+
+        Only strategies without path-dependent sizing can implement this.
+        """
+        raise NotImplementedError(
+            "Should implement calculate_vectorized_signals()"
+        )
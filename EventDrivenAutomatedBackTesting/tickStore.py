@@ -0,0 +1,555 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#==========================================================
+#====================== tickStore.py ======================
+#==========================================================
+
+# Purpose
+#----------------------------------------------------------
+# Tick data is orders of magnitude larger than the minute bars of the bar
+# store (see barStore.py), so the ticks of each symbol are kept in
+# compressed, column-wise chunks of a fixed number of ticks, one file per
+# symbol and (UTC) day:
+#
+#   store_dir/meta.json                 - the tick fields and the chunk size
+#   store_dir/SYMBOL/YYYY-MM-DD.ticks   - the chunks, one after the other,
+#                                         each one made of its columns
+#                                         compressed with zlib
+#   store_dir/SYMBOL/YYYY-MM-DD.idx.npy - the sparse index of the day, one
+#                                         record per chunk: its first and
+#                                         last timestamps, number of ticks,
+#                                         offset and compressed column sizes
+#
+# A time range query only reads the days of the range and, within them, the
+# chunks whose timestamps overlap it, found by binary search on the index.
+# The timestamps are stored as differences from the previous tick, which
+# compress several times better than the raw nanoseconds.
+#
+# Day files are only ever appended to, and the index is replaced as a whole
+# once the new chunks are written, so a crash midway through an append
+# leaves the previous index, and every chunk it points to, intact. A last
+# chunk which is not full is completed by writing it again, merged with the
+# new ticks, at the end of the file, its old copy being left unused. Once
+# the unused bytes would outgrow the chunks in use, the day is compacted:
+# the chunks in use are copied into a new file and a new index, written
+# under temporary (.compact) names, which then replace the day file and
+# its index in that order. A compaction interrupted between the two is
+# completed by the next append, and readers use the new index meanwhile.
+#
+# HistoricTickDataHandler streams the ticks of several symbols from a store,
+# chunk by chunk and in timestamp order, through the usual DataHandler
+# interface, so a whole symbol is never loaded at once.
+
+from __future__ import print_function
+
+from collections import namedtuple
+import heapq
+import json
+import os, os.path
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from dataHandler import HistoricCSVDataHandler
+from event import MarketEvent
+
+# The default tick layout, timestamps are nanoseconds since the epoch
+TICK_DTYPE = np.dtype([
+    ('timestamp', '<i8'),
+    ('price', '<f8'),
+    ('size', '<i8'),
+    ('bid', '<f8'),
+    ('ask', '<f8'),
+])
+
+NS_PER_DAY = 86400 * 10**9
+
+def _to_ns(t):
+    """
+    Converts a datetime, datetime64, date string or integer into nanoseconds
+    since the epoch
+    """
+
+    if t is None or isinstance(t, (int, np.integer)):
+        return t
+    return int(np.datetime64(t, 'ns').astype(np.int64))
+
+class TickStore(object):
+    """
+    A directory of chunked, compressed, columnar tick files with a sparse
+    time index, see the Purpose above
+    """
+
+    def __init__(self, store_dir, dtype=TICK_DTYPE, chunk_size=65536,
+            compression_level=1):
+        """
+        Opens a tick store, creating it if it does not exist. The dtype and
+        chunk size of an existing store are read from it.
+
+        Parameters:
+            store_dir - The directory of the store
+            dtype - The structured dtype of a tick, its first field being the
+            int64 timestamp in nanoseconds
+            chunk_size - The number of ticks per chunk
+            compression_level - The zlib level, from 1 (fastest) to 9
+        """
+
+        self.store_dir = store_dir
+        self.compression_level = compression_level
+
+        meta_path = os.path.join(store_dir, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            dtype = np.dtype([tuple(field) for field in meta['fields']])
+            chunk_size = meta['chunk_size']
+        else:
+            if not os.path.exists(store_dir):
+                os.makedirs(store_dir)
+            with open(meta_path, 'w') as f:
+                json.dump({
+                    'fields': [(n, dtype[n].str) for n in dtype.names],
+                    'chunk_size': chunk_size,
+                }, f)
+
+        self.dtype = np.dtype(dtype)
+        self.chunk_size = chunk_size
+        self.columns = list(self.dtype.names)
+        self.time_field = self.columns[0]
+        self.index_dtype = np.dtype([
+            ('first', '<i8'), ('last', '<i8'), ('rows', '<i8'),
+            ('offset', '<i8'), ('sizes', '<i8', (len(self.columns),)),
+        ])
+
+    def _paths(self, symbol, day):
+        base = os.path.join(
+            self.store_dir, symbol, str(np.datetime64(day, 'D'))
+        )
+        return base + '.ticks', base + '.idx.npy'
+
+    def symbols(self):
+        """
+        Returns the sorted list of the symbols in the store
+        """
+
+        return sorted(
+            d for d in os.listdir(self.store_dir)
+            if os.path.isdir(os.path.join(self.store_dir, d))
+        )
+
+    def days(self, symbol):
+        """
+        Returns the sorted list of the days (as day numbers since the epoch)
+        for which the store holds ticks of a symbol
+        """
+
+        symbol_dir = os.path.join(self.store_dir, symbol)
+        if not os.path.isdir(symbol_dir):
+            return []
+        return sorted(
+            int(np.datetime64(f[:-len('.idx.npy')], 'D').astype(np.int64))
+            for f in os.listdir(symbol_dir) if f.endswith('.idx.npy')
+        )
+
+    def read_index(self, symbol, day):
+        """
+        Returns the chunk index of a symbol on a day, empty if there is none
+        """
+
+        data_path, index_path = self._paths(symbol, day)
+        if os.path.exists(index_path + '.compact') and \
+                not os.path.exists(data_path + '.compact'):
+            # A compaction replaced the day file but not yet its index
+            index_path += '.compact'
+        if not os.path.exists(index_path):
+            return np.zeros(0, dtype=self.index_dtype)
+        return np.load(index_path)
+
+    def _save_index(self, path, index):
+        """
+        Writes an index under a temporary name and replaces path with it
+        """
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, index)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _finish_compaction(self, data_path, index_path):
+        """
+        Completes or rolls back a compaction which was interrupted
+        """
+
+        if not os.path.exists(index_path + '.compact'):
+            return
+        if os.path.exists(data_path + '.compact'):
+            # The day file was not replaced yet, the old one is still valid
+            os.remove(data_path + '.compact')
+            os.remove(index_path + '.compact')
+        else:
+            os.replace(index_path + '.compact', index_path)
+
+    def _compact(self, data_path, index_path, index):
+        """
+        Copies the chunks in use of a day file into a new file without any
+        unused bytes, and replaces the day file and its index with it
+
+        Returns:
+            The index of the new file
+        """
+
+        compacted = index.copy()
+        offset = 0
+        with open(data_path, 'rb') as src, \
+                open(data_path + '.compact', 'wb') as dst:
+            for i, entry in enumerate(index):
+                size = int(entry['sizes'].sum())
+                src.seek(int(entry['offset']))
+                dst.write(src.read(size))
+                compacted[i]['offset'] = offset
+                offset += size
+            dst.flush()
+            os.fsync(dst.fileno())
+        self._save_index(index_path + '.compact', compacted)
+
+        os.replace(data_path + '.compact', data_path)
+        os.replace(index_path + '.compact', index_path)
+        return compacted
+
+    def _encode(self, ticks):
+        """
+        Compresses the columns of a chunk
+
+        Returns:
+            (data, sizes) - The bytes of the chunk and of each column
+        """
+
+        blocks = []
+        for c in self.columns:
+            column = np.ascontiguousarray(ticks[c])
+            if c == self.time_field:
+                column = np.diff(column, prepend=column[:1])
+                column[0] = ticks[c][0]
+            blocks.append(zlib.compress(
+                column.tobytes(), self.compression_level
+            ))
+        return b''.join(blocks), [len(b) for b in blocks]
+
+    def _decode(self, data, entry):
+        """
+        Decompresses a chunk read from disk into an array of ticks
+        """
+
+        ticks = np.empty(int(entry['rows']), dtype=self.dtype)
+        start = 0
+        for c, size in zip(self.columns, entry['sizes'].tolist()):
+            column = np.frombuffer(
+                zlib.decompress(data[start:start + size]),
+                dtype=self.dtype[c]
+            )
+            if c == self.time_field:
+                column = np.cumsum(column)
+            ticks[c] = column
+            start += size
+        return ticks
+
+    def append(self, symbol, ticks):
+        """
+        Appends ticks to the store. They are split by day and written in
+        chunks of chunk_size ticks, the last chunk of a day being completed
+        by later appends.
+
+        Parameters:
+            symbol - The symbol string
+            ticks - A structured array of the store dtype (or a sequence of
+            tuples), in timestamp order and later than the ticks already
+            stored for the symbol
+        """
+
+        ticks = np.asarray(ticks, dtype=self.dtype)
+        if len(ticks) == 0:
+            return
+        times = ticks[self.time_field]
+        if np.any(np.diff(times) < 0):
+            raise ValueError("Ticks must be appended in timestamp order")
+
+        symbol_dir = os.path.join(self.store_dir, symbol)
+        if not os.path.exists(symbol_dir):
+            os.makedirs(symbol_dir)
+
+        days = times // NS_PER_DAY
+        bounds = np.flatnonzero(np.diff(days)) + 1
+        for part in np.split(ticks, bounds):
+            self._append_day(symbol, int(part[self.time_field][0] //
+                NS_PER_DAY), part)
+
+    def _append_day(self, symbol, day, ticks):
+        """
+        Appends the ticks of a single day at the end of its file, completing
+        its last chunk if it is not full, then replaces its index, see the
+        Purpose above
+        """
+
+        data_path, index_path = self._paths(symbol, day)
+        self._finish_compaction(data_path, index_path)
+        index = self.read_index(symbol, day)
+
+        if len(index):
+            last = index[-1]
+            if ticks[self.time_field][0] < last['last']:
+                raise ValueError(
+                    "Ticks of %s on %s are older than those already stored" %
+                    (symbol, np.datetime64(day, 'D'))
+                )
+            if last['rows'] < self.chunk_size:
+                # Anything past the chunks of the index (previous copies of
+                # a last chunk, or the chunks of an append which did not
+                # complete) is unused
+                used = int(index['sizes'].sum())
+                unused = os.path.getsize(data_path) - used
+                if unused + int(last['sizes'].sum()) > used:
+                    index = self._compact(data_path, index_path, index)
+                ticks = np.concatenate(
+                    [self._read_chunk(data_path, index[-1]), ticks]
+                )
+                index = index[:-1]
+
+        offset = os.path.getsize(data_path) if os.path.exists(data_path) \
+            else 0
+
+        entries = np.zeros(
+            (len(ticks) + self.chunk_size - 1) // self.chunk_size,
+            dtype=self.index_dtype
+        )
+        with open(data_path, 'ab') as f:
+            for i, start in enumerate(range(0, len(ticks), self.chunk_size)):
+                chunk = ticks[start:start + self.chunk_size]
+                data, sizes = self._encode(chunk)
+                f.write(data)
+                entries[i] = (
+                    chunk[self.time_field][0], chunk[self.time_field][-1],
+                    len(chunk), offset, sizes
+                )
+                offset += len(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # The new index only replaces the old one once it is fully written
+        self._save_index(index_path, np.concatenate([index, entries]))
+
+    def _read_chunk(self, data_path, entry, f=None):
+        """
+        Reads and decompresses one chunk of a day file
+        """
+
+        if f is None:
+            with open(data_path, 'rb') as f:
+                return self._read_chunk(data_path, entry, f)
+        f.seek(int(entry['offset']))
+        return self._decode(f.read(int(entry['sizes'].sum())), entry)
+
+    def _select(self, symbol, start, end):
+        """
+        Yields (day, data path, index entries) of the chunks of a symbol
+        overlapping the time range [start, end)
+        """
+
+        first_day = None if start is None else start // NS_PER_DAY
+        last_day = None if end is None else (end - 1) // NS_PER_DAY
+        for day in self.days(symbol):
+            if (first_day is not None and day < first_day) or \
+                    (last_day is not None and day > last_day):
+                continue
+            index = self.read_index(symbol, day)
+            lo, hi = 0, len(index)
+            if start is not None:
+                lo = int(np.searchsorted(index['last'], start, side='left'))
+            if end is not None:
+                hi = int(np.searchsorted(index['first'], end, side='left'))
+            if lo < hi:
+                yield day, self._paths(symbol, day)[0], index[lo:hi]
+
+    def count(self, symbol, start=None, end=None):
+        """
+        Returns the number of ticks of the chunks overlapping a time range,
+        from the index alone: an upper bound on the ticks in the range
+        """
+
+        start, end = _to_ns(start), _to_ns(end)
+        return sum(
+            int(entries['rows'].sum())
+            for _, _, entries in self._select(symbol, start, end)
+        )
+
+    def iter_chunks(self, symbol, start=None, end=None):
+        """
+        Yields the ticks of a symbol in a time range, one chunk (a structured
+        array) at a time, only reading the chunks the range overlaps
+
+        Parameters:
+            symbol - The symbol string
+            start - The first time included, None for the first tick
+            end - The first time excluded, None for after the last tick
+        """
+
+        start, end = _to_ns(start), _to_ns(end)
+        for day, data_path, entries in self._select(symbol, start, end):
+            with open(data_path, 'rb') as f:
+                for entry in entries:
+                    ticks = self._read_chunk(data_path, entry, f)
+                    times = ticks[self.time_field]
+                    # Only the chunks at the ends of the range need trimming
+                    if start is not None and entry['first'] < start:
+                        ticks = ticks[np.searchsorted(times, start):]
+                        times = ticks[self.time_field]
+                    if end is not None and entry['last'] >= end:
+                        ticks = ticks[:np.searchsorted(times, end)]
+                    if len(ticks):
+                        yield ticks
+
+    def read(self, symbol, start=None, end=None):
+        """
+        Returns the ticks of a symbol in a time range as a single structured
+        array, see iter_chunks
+        """
+
+        chunks = list(self.iter_chunks(symbol, start, end))
+        if not chunks:
+            return np.zeros(0, dtype=self.dtype)
+        return np.concatenate(chunks)
+
+# A tick handed out by the HistoricTickDataHandler, as a bar record
+Tick = namedtuple('Tick', ['datetime', 'price', 'size', 'bid', 'ask'])
+
+class HistoricTickDataHandler(HistoricCSVDataHandler):
+    """
+    HistoricTickDataHandler replays the ticks of a TickStore, of the default
+    TICK_DTYPE layout, as if each was a bar: every call to update_bars pushes
+    the next tick over all the symbols, in timestamp order, into the latest
+    bars of its symbol, and puts a MarketEvent on the queue.
+
+    The ticks are read one chunk per symbol at a time, so the memory used
+    does not depend on the length of the history. The store directory is
+    passed in place of the csv_dir.
+    """
+
+    csv_columns = ['datetime', 'price', 'size', 'bid', 'ask']
+    bar_record = Tick
+
+    def __init__(self, events, store_dir, symbol_list, max_lookback=1000,
+            start=None, end=None):
+        """
+        Initializes the tick data handler
+
+        Parameters:
+            events - The Event Queue
+            store_dir - Absolute directory path to the TickStore
+            symbol_list - A list of symbol strings
+            max_lookback - The maximum number of ticks kept per symbol
+            start, end - The time range to replay, see TickStore.iter_chunks
+        """
+
+        self.store = TickStore(store_dir)
+        self.start = start
+        self.end = end
+        super(HistoricTickDataHandler, self).__init__(
+            events, store_dir, symbol_list, max_lookback, use_cache=False
+        )
+
+    def _iter_ticks(self, symbol):
+        """
+        Yields (timestamp, symbol, tick) for every tick of a symbol, the
+        timestamps being converted a chunk at a time
+        """
+
+        for chunk in self.store.iter_chunks(symbol, self.start, self.end):
+            times = chunk[self.store.time_field]
+            datetimes = times.view('datetime64[ns]').astype(
+                'datetime64[us]'
+            ).tolist()
+            columns = [chunk[f].tolist() for f in self.bar_fields]
+            for t, d, values in zip(times.tolist(), datetimes,
+                    zip(*columns)):
+                yield t, symbol, self.bar_record(d, *values)
+
+    def _open_convert_csv_files(self):
+        """
+        Sets up the merged stream of the ticks of every symbol, nothing is
+        read yet
+        """
+
+        for s in self.symbol_list:
+            self._init_latest(s)
+        self.ticks = heapq.merge(
+            *[self._iter_ticks(s) for s in self.symbol_list]
+        )
+
+    def get_total_bars(self):
+        """
+        Returns the number of ticks to replay, from the store index
+        """
+
+        return sum(
+            self.store.count(s, self.start, self.end)
+            for s in self.symbol_list
+        )
+
+    def get_bar_panel(self, val_type):
+        """
+        Returns one of the tick fields of every symbol as a pandas DataFrame
+        with one row per tick, in the order update_bars replays them, and
+        one column per symbol holding its latest value at that tick (NaN
+        before its first one). Unlike update_bars, the whole time range is
+        read into memory.
+
+        Parameters:
+            val_type - The tick field, e.g. 'price'
+        """
+
+        time_field = self.store.time_field
+        times, columns, values = [], [], []
+        for j, s in enumerate(self.symbol_list):
+            ticks = self.store.read(s, self.start, self.end)
+            times.append(ticks[time_field])
+            columns.append(np.full(len(ticks), j))
+            values.append(ticks[val_type].astype(np.float64))
+        times = np.concatenate(times)
+        columns = np.concatenate(columns)
+        values = np.concatenate(values)
+
+        # update_bars merges the symbols on (timestamp, symbol), keeping the
+        # order of the ticks of a symbol, lexsort being stable does the same
+        ranks = np.argsort(np.argsort(self.symbol_list, kind='stable'))
+        order = np.lexsort((ranks[columns], times))
+
+        panel = np.full((len(order), len(self.symbol_list)), np.nan)
+        panel[np.arange(len(order)), columns[order]] = values[order]
+        return pd.DataFrame(
+            panel, columns=self.symbol_list,
+            index=pd.DatetimeIndex(
+                times[order].view('datetime64[ns]'), name='datetime'
+            )
+        ).ffill()
+
+    def update_bars(self):
+        """
+        Pushes the next tick to the latest_symbol_data structure of its
+        symbol
+        """
+
+        tick = next(self.ticks, None)
+        if tick is None:
+            self.continue_backtest = False
+            return
+
+        _, s, bar = tick
+        self.latest_symbol_data[s].append(bar)
+        values = self.latest_symbol_values[s]
+        for f, value in zip(self.bar_fields, bar[1:]):
+            values[f].append(value)
+        self.bar_index += 1
+        self.events.put(MarketEvent(bar.datetime))
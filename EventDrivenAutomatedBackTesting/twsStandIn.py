@@ -0,0 +1,391 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#==========================================================
+#====================== twsStandIn.py =====================
+#==========================================================
+
+# Purpose
+#----------------------------------------------------------
+# The IBExecutionHandler cannot be load tested against a real Trader
+# Workstation. The TWSStandIn is a local server simulating one: it accepts
+# orders over a TCP socket and answers them with the nextValidId, openOrder,
+# orderStatus and error messages the handler relies upon, after configurable
+# latencies and in a configurable number of partial fills, recording when
+# each order was received, acknowledged and filled.
+#
+# TWSStandInConnection is the client side. It offers the part of the IbPy
+# connection interface the handler uses (register, registerAll, connect,
+# placeOrder, cancelOrder, reqIds, disconnect) and hands the replies to the
+# registered handlers from its own reader thread, like ibConnection() does,
+# so it can be returned by IBExecutionHandler.create_tws_connection.
+#
+# The wire format is a simplified version of the TWS one: one message per
+# line, made of its name and fields separated by NUL characters.
+
+from __future__ import print_function
+
+import heapq
+import itertools
+import socket
+import threading
+import time
+
+# The fields of every message, in wire order, with their types
+MESSAGES = {
+    # Client to server
+    'placeOrder': (
+        ('orderId', int), ('symbol', str), ('action', str),
+        ('totalQuantity', int), ('orderType', str)
+    ),
+    'cancelOrder': (('orderId', int),),
+    'reqIds': (('numIds', int),),
+    # Server to client
+    'nextValidId': (('orderId', int),),
+    'openOrder': (
+        ('orderId', int), ('symbol', str), ('action', str),
+        ('totalQuantity', int), ('orderType', str)
+    ),
+    'orderStatus': (
+        ('orderId', int), ('status', str), ('filled', int),
+        ('remaining', int), ('avgFillPrice', float), ('lastFillPrice', float)
+    ),
+    'error': (('id', int), ('errorCode', int), ('errorMsg', str)),
+}
+
+class Message(object):
+    """
+    A decoded message, with its fields as attributes like IbPy messages
+    """
+
+    def __init__(self, typeName, **fields):
+        self.typeName = typeName
+        self.__dict__.update(fields)
+
+    def __str__(self):
+        fields = ', '.join(
+            '%s=%s' % (name, getattr(self, name))
+            for name, _ in MESSAGES[self.typeName]
+        )
+        return '<%s %s>' % (self.typeName, fields)
+
+def encode(typeName, *values):
+    """
+    Encodes a message into its line on the wire
+    """
+    return ('\0'.join([typeName] + [str(v) for v in values]) + '\n').encode()
+
+def decode(line):
+    """
+    Decodes a line from the wire into a Message
+    """
+
+    values = line.decode().split('\0')
+    spec = MESSAGES[values[0]]
+    return Message(values[0], **dict(
+        (name, cast(v)) for (name, cast), v in zip(spec, values[1:])
+    ))
+
+class Contract(object):
+    """
+    Stand-in for the IbPy Contract, when IbPy is not installed
+    """
+
+    def __init__(self):
+        self.m_symbol = None
+        self.m_secType = None
+        self.m_exchange = None
+        self.m_primaryExch = None
+        self.m_currency = None
+
+class Order(object):
+    """
+    Stand-in for the IbPy Order, when IbPy is not installed
+    """
+
+    def __init__(self):
+        self.m_orderType = None
+        self.m_totalQuantity = 0
+        self.m_action = None
+
+class TWSStandInConnection(object):
+    """
+    Client connection to a TWSStandIn, with the interface of an IbPy
+    connection
+    """
+
+    def __init__(self, host='127.0.0.1', port=7496):
+        self.host = host
+        self.port = port
+        self.handlers = {}
+        self.all_handlers = []
+        self.sock = None
+        self.send_lock = threading.Lock()
+        self.reader = None
+
+    def register(self, handler, *types):
+        """
+        Registers a handler for the messages of the given types, e.g. 'Error'
+        """
+        for t in types:
+            t = t[0].lower() + t[1:]
+            self.handlers.setdefault(t, []).append(handler)
+
+    def registerAll(self, handler):
+        """
+        Registers a handler for every message
+        """
+        self.all_handlers.append(handler)
+
+    def connect(self):
+        """
+        Connects to the server and starts dispatching its messages
+        """
+
+        self.sock = socket.create_connection((self.host, self.port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = threading.Thread(target=self._read)
+        self.reader.daemon = True
+        self.reader.start()
+        return True
+
+    def disconnect(self):
+        """
+        Closes the connection
+        """
+
+        if self.sock is not None:
+            self.sock.shutdown(socket.SHUT_RDWR)
+            self.sock.close()
+            self.sock = None
+        return True
+
+    def _send(self, data):
+        with self.send_lock:
+            self.sock.sendall(data)
+
+    def _read(self):
+        reader = self.sock.makefile('rb')
+        for line in reader:
+            msg = decode(line.rstrip(b'\n'))
+            for handler in self.handlers.get(msg.typeName, ()):
+                handler(msg)
+            for handler in self.all_handlers:
+                handler(msg)
+
+    def placeOrder(self, id, contract, order):
+        self._send(encode(
+            'placeOrder', id, contract.m_symbol, order.m_action,
+            order.m_totalQuantity, order.m_orderType
+        ))
+
+    def cancelOrder(self, id):
+        self._send(encode('cancelOrder', id))
+
+    def reqIds(self, numIds):
+        self._send(encode('reqIds', numIds))
+
+class TWSStandIn(object):
+    """
+    Local server simulating the order handling of a Trader Workstation.
+
+    Every order is acknowledged (openOrder, then orderStatus 'Submitted')
+    ack_latency seconds after it is received, and then filled in
+    partial_fills equal parts spread evenly over the following fill_latency
+    seconds, at fill_price. The last part has the status 'Filled'. Orders
+    for a symbol in reject_symbols are refused with error 201 instead.
+
+    The time each order was received, acknowledged and filled is recorded
+    in timings, keyed by order ID.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, ack_latency=0.0,
+            fill_latency=0.0, partial_fills=1, fill_price=10.0,
+            next_valid_id=1, reject_symbols=(), clock=time.time):
+        """
+        Parameters:
+            host, port - Where to listen, port 0 picks a free port
+            ack_latency - Seconds between receiving and acknowledging orders
+            fill_latency - Seconds between acknowledging and fully filling
+            partial_fills - The number of parts each order is filled in
+            fill_price - The price every order is filled at
+            next_valid_id - The next valid order ID sent upon connection
+            reject_symbols - Symbols whose orders are rejected
+            clock - The wall clock function, in seconds
+        """
+
+        self.ack_latency = ack_latency
+        self.fill_latency = fill_latency
+        self.partial_fills = max(int(partial_fills), 1)
+        self.fill_price = fill_price
+        self.next_valid_id = next_valid_id
+        self.reject_symbols = set(reject_symbols)
+        self.clock = clock
+
+        self.timings = {}
+        self.cancelled = set()
+
+        # Messages waiting to be sent, as (due time, sequence, client, data)
+        self.schedule = []
+        self.sequence = itertools.count()
+        self.schedule_lock = threading.Condition()
+        self.running = False
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.host, self.port = self.server.getsockname()
+
+    def start(self):
+        """
+        Starts accepting connections, and returns at once
+        """
+
+        self.running = True
+        self.server.listen(5)
+        for target in (self._accept, self._send_scheduled):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops the server
+        """
+
+        self.running = False
+        with self.schedule_lock:
+            self.schedule_lock.notify_all()
+        self.server.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+
+    def _accept(self):
+        while self.running:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client_lock = threading.Lock()
+            self._send(client, client_lock,
+                encode('nextValidId', self.next_valid_id))
+            thread = threading.Thread(
+                target=self._serve, args=(client, client_lock)
+            )
+            thread.daemon = True
+            thread.start()
+
+    def _send(self, client, client_lock, data):
+        with client_lock:
+            try:
+                client.sendall(data)
+            except OSError:
+                pass
+
+    def _later(self, delay, client, data, order_id=None, on_send=None):
+        """
+        Schedules data to be sent to a client delay seconds from now. If it
+        is for an order, it is dropped if the order is cancelled meanwhile,
+        and on_send is called with the time it is sent
+        """
+
+        with self.schedule_lock:
+            heapq.heappush(self.schedule, (
+                self.clock() + delay, next(self.sequence), client, data,
+                order_id, on_send
+            ))
+            self.schedule_lock.notify()
+
+    def _send_scheduled(self):
+        while True:
+            with self.schedule_lock:
+                while self.running and (not self.schedule or
+                        self.schedule[0][0] > self.clock()):
+                    timeout = None
+                    if self.schedule:
+                        timeout = self.schedule[0][0] - self.clock()
+                    self.schedule_lock.wait(timeout)
+                if not self.running:
+                    return
+                _, _, client, data, order_id, on_send = \
+                    heapq.heappop(self.schedule)
+                if order_id in self.cancelled:
+                    continue
+
+            self._send(client[0], client[1], data)
+            if on_send is not None:
+                on_send(self.clock())
+
+    def _serve(self, client, client_lock):
+        peer = (client, client_lock)
+        for line in client.makefile('rb'):
+            msg = decode(line.rstrip(b'\n'))
+            if msg.typeName == 'placeOrder':
+                self._place_order(peer, msg)
+            elif msg.typeName == 'cancelOrder':
+                self._cancel_order(peer, msg)
+            elif msg.typeName == 'reqIds':
+                self._send(client, client_lock,
+                    encode('nextValidId', self.next_valid_id))
+
+    def _record(self, order_id, event):
+        def on_send(t):
+            self.timings[order_id][event] = t
+        return on_send
+
+    def _place_order(self, peer, msg):
+        """
+        Schedules the replies to a new order
+        """
+
+        order_id, qty = msg.orderId, msg.totalQuantity
+        self.timings[order_id] = {'received': self.clock()}
+        self.next_valid_id = max(self.next_valid_id, order_id + 1)
+
+        if msg.symbol in self.reject_symbols:
+            self._later(self.ack_latency, peer, encode(
+                'error', order_id, 201, 'Order rejected'
+            ), order_id, self._record(order_id, 'rejected'))
+            return
+
+        self._later(self.ack_latency, peer, encode(
+            'openOrder', order_id, msg.symbol, msg.action, qty, msg.orderType
+        ), order_id, self._record(order_id, 'acknowledged'))
+        self._later(self.ack_latency, peer, encode(
+            'orderStatus', order_id, 'Submitted', 0, qty, 0.0, 0.0
+        ), order_id)
+
+        # Equal parts, the last one takes any remainder
+        for k in range(1, self.partial_fills + 1):
+            filled = qty if k == self.partial_fills else \
+                qty * k // self.partial_fills
+            status = 'Filled' if filled == qty else 'Submitted'
+            on_send = None
+            if status == 'Filled':
+                on_send = self._record(order_id, 'filled')
+            self._later(
+                self.ack_latency + self.fill_latency * k / self.partial_fills,
+                peer, encode(
+                    'orderStatus', order_id, status, filled, qty - filled,
+                    self.fill_price, self.fill_price
+                ), order_id, on_send
+            )
+
+    def _cancel_order(self, peer, msg):
+        """
+        Drops the replies still to be sent for an order and confirms its
+        cancellation
+        """
+
+        order_id = msg.orderId
+        with self.schedule_lock:
+            self.cancelled.add(order_id)
+        self._send(peer[0], peer[1], encode(
+            'orderStatus', order_id, 'Cancelled', 0, 0, 0.0, 0.0
+        ))
@@ -21,18 +21,18 @@
 # NOTE: a higher frequency datahandler and portfolio program must be created
 # for this strategy to function
 
-form __future__ import print_function
+from __future__ import print_function
 
 import datetime as dt
 
 import numpy as np
 import pandas as pd
-import statsmodels.api as sm
 
 from strategy import Strategy
 from event import SignalEvent
+from indicators import RollingOLS
 from backtest import Backtest
-from hft_data import HistoricCSVDataHandlerHFT
+from hft_dataHandler import HistoricCSVDataHandlerHFT
 from hft_portfolio import PortfolioHFT
 from execution import SimulatedExecutionHandler
 
@@ -70,6 +70,11 @@ class IntradayOLSMRStrategy(Strategy):
         self.long_market = False
         self.short_market = False
 
+        # Online fit of the hedge ratio and of the spread z-score, updated
+        # with one bar of the pair per MarketEvent
+        self.ols = RollingOLS(ols_window)
+        self.hedge_ratio = None
+
     def calculate_xy_signals(self, zscore_last):
         """
         Calculates the actual x, y signal pairings to be sent to the signal
@@ -87,30 +92,30 @@ class IntradayOLSMRStrategy(Strategy):
 
         # If we're long the market and below the negative of the high
         # zscore threshold
-        if zscore_last <= -selff.zscore_high and not self.long_market:
+        if zscore_last <= -self.zscore_high and not self.long_market:
             self.long_market = True
-            y_signal = SignalEvent(1, p0, dt, 'LONG', 1.0)
-            x_signal = SignalEvent(1, p1, dt, 'SHORT', hr)
+            y_signal = SignalEvent(self.strategy_id, p0, dt, 'LONG', 1.0)
+            x_signal = SignalEvent(self.strategy_id, p1, dt, 'SHORT', hr)
 
         # If we're long the market and between the absolute value of the
         # low zscore threshold
-        if abs(zscore_last) <= self.zscore_low and not self.long_market:
-            self.long_market = True
-            y_signal = SignalEvent(1, p0, dt, 'EXIT', 1.0)
-            x_signal = SignalEvent(1, p1, dt, 'EXIT', 1.0)
+        if abs(zscore_last) <= self.zscore_low and self.long_market:
+            self.long_market = False
+            y_signal = SignalEvent(self.strategy_id, p0, dt, 'EXIT', 1.0)
+            x_signal = SignalEvent(self.strategy_id, p1, dt, 'EXIT', 1.0)
 
         # If we're short the market and above the high zscore threshold
         if zscore_last >= self.zscore_high and not self.short_market:
             self.short_market = True
-            y_signal = SignalEvent(1, p0, dt, 'SHORT', 1.0)
-            x_signal = SignalEvent(1, p1, dt, 'LONG', hr)
+            y_signal = SignalEvent(self.strategy_id, p0, dt, 'SHORT', 1.0)
+            x_signal = SignalEvent(self.strategy_id, p1, dt, 'LONG', hr)
 
         # If we're short the market and between the absolute value of the low
         # zscore threshold
         if abs(zscore_last) <= self.zscore_low and self.short_market:
             self.short_market = False
-            y_signal = SignalEvent(1, p0, dt, 'EXIT', 1.0)
-            x_signal = SignalEvent(1, p1, dt, 'EXIT', 1.0)
+            y_signal = SignalEvent(self.strategy_id, p0, dt, 'EXIT', 1.0)
+            x_signal = SignalEvent(self.strategy_id, p1, dt, 'EXIT', 1.0)
 
         return y_signal, x_signal
 
@@ -120,32 +125,28 @@ class IntradayOLSMRStrategy(Strategy):
 
         Calculates the hedge ratio between the pair of tickers. We will use OLS
         for this although a fleshed out CADF would be superior.
-        """
 
-        # Obtain the latest window of values for each component of the pair of
-        # tickers
-        y = self.bars.get_latest_bars_values(
-            self.pair[0], "close", N=self.ols_window
-        )
-        x = self.bars.get_latest_bars_values(
-            self.pair[1], "close", N=self.ols_window
-        )
+        The OLS fit (equivalent to sm.OLS(y, x) over the last ols_window bars)
+        and the z-score of the spread are updated recursively from the latest
+        bar only, see indicators.RollingOLS.
+        """
 
-        if y is not None and x is not None:
-            # Check that all window periods are available
-            if len(y) >= self.ols_window and len(x) >= self.ols_window:
-                # Calculate the current hedge ratio using OLS
-                self.hedge_ratio = sm.OLS(y, x).fit().params[0]
+        # Obtain the latest value for each component of the pair of tickers
+        y = self.bars.get_latest_bar_value(self.pair[0], "close")
+        x = self.bars.get_latest_bar_value(self.pair[1], "close")
+        self.ols.update(x, y)
 
-                # Calculate the current z-score of the residuals
-                spread = y - self.hedge_ratio * x
-                zscore_last = ((spread - spread.mean())/spread.std())[-1]
+        # Check that all window periods are available
+        if self.ols.ready:
+            # The current hedge ratio and z-score of the residuals
+            self.hedge_ratio = self.ols.hedge_ratio
+            zscore_last = self.ols.zscore
 
-                # Calculate signals and add to events queue if valid
-                y_signal, x_signal = self.calculate_xy_signals(zscore_last)
-                if y_signal is not None and x_signal is not None:
-                    self.events.put(y_signal)
-                    self.events.put(x_signal)
+            # Calculate signals and add to events queue if valid
+            y_signal, x_signal = self.calculate_xy_signals(zscore_last)
+            if y_signal is not None and x_signal is not None:
+                self.events.put(y_signal)
+                self.events.put(x_signal)
 
     def calculate_signals(self, event):
         """
@@ -154,7 +155,7 @@ class IntradayOLSMRStrategy(Strategy):
         return SignalEvents based on the market data.
         """
 
-        if event.type == 'Market':
+        if event.type == 'MARKET':
             self.calculate_signals_for_pairs()
 
 #TODO: make ticker names inputs and store in symbol_list. Dates as well
@@ -171,7 +172,7 @@ if __name__ == "__main__":
 
     backtest = Backtest(
             csv_dir, symbol_list, initial_capital, heartbeat, start_date,
-            HistoricCsvDataHandlerHFT, SimulatedExecutionHandler, PortfolioHFT,
+            HistoricCSVDataHandlerHFT, SimulatedExecutionHandler, PortfolioHFT,
             IntradayOLSMRStrategy
         )
 
@@ -19,13 +19,14 @@ from __future__ import print_function
 import datetime as dt
 import numpy as np
 import pandas as pd
-import statsmodels.apu as sm
+import statsmodels.api as sm
 
 # We will need most components from our Backtesting suite
 from strategy import Strategy
-from event import SignalEvent
+from event import SignalEvent, SignalBatchEvent
+from indicators import SMA
 from backtest import Backtest
-from data import HistoricCSVDataHandler
+from dataHandler import HistoricCSVDataHandler
 from execution import SimulatedExecutionHandler
 from portfolio import Portfolio
 
@@ -36,7 +37,8 @@ class MovingAverageCrossStrategy(Strategy):
     periods respectively.
     """
 
-    def __init__(self, bars, events, short_window=100, long_window=400):
+    def __init__(self, bars, events, short_window=100, long_window=400,
+            batch_signals=False):
         """ Initializes the Moving Average Cross Strategy
 
         Parameters:
@@ -44,17 +46,24 @@ class MovingAverageCrossStrategy(Strategy):
             events - The event Queue object
             short_window - The short moving average lookback
             long_window - The long moving average lookback
+            batch_signals - Emit all the signals of a bar as a single
+            SignalBatchEvent rather than one SignalEvent per symbol
         """
 
         self.bars = bars
-        self.symbols_list = self.bars.symbol_list
+        self.symbol_list = self.bars.symbol_list
         self.events = events
         self.short_window = short_window
         self.long_window = long_window
+        self.batch_signals = batch_signals
 
         # Set to True if a symbol is "in the market"
         self.bought = self._calculate_initial_bought()
 
+        # Incremental moving averages, updated with one bar per MarketEvent
+        self.short_sma = dict((s, SMA(short_window)) for s in self.symbol_list)
+        self.long_sma = dict((s, SMA(long_window)) for s in self.symbol_list)
+
     def _calculate_initial_bought(self):
         """
         Since the strategy begins out of the market, set the initial "bought"
@@ -65,7 +74,7 @@ class MovingAverageCrossStrategy(Strategy):
         """
 
         bought = {}
-        for s in s.symbol_list:
+        for s in self.symbol_list:
             bought[s] = 'OUT'
         return bought
 
@@ -75,49 +84,100 @@ class MovingAverageCrossStrategy(Strategy):
         SMA with the short window crossing the long window meaning a long entry
         and vice versa for a short entry.
 
+        Both SMAs are updated in O(1) from the latest bar only, rather than
+        being recomputed over long_window bars every time.
+
         Parameters:
             event - A MarketEvent object
         """
 
         if event.type == 'MARKET':
+            cur_dt = dt.datetime.utcnow()
+            signals = []
             for s in self.symbol_list:
-                bars = self.bars.get_latest_bars_values(
-                    s, "adj_close", N=self.long_window
-                    )
+                price = self.bars.get_latest_bar_value(s, "adj_close")
                 bar_date = self.bars.get_latest_bar_datetime(s)
-                if bars is not None and bars != []:
-                    short_sma = np.mean(bars[-self.short_window:])
-                    long_sma = np.mean(bars[-self.long_window:])
+                if price is not None:
+                    short_sma = self.short_sma[s].update(price)
+                    long_sma = self.long_sma[s].update(price)
 
-                    symbol = s
-                    dt = dt.datetime.utcnow()
                     sig_dir = ""
 
-                    if short_sma > long_sma and self.bought[s] == "OUT"
+                    if short_sma > long_sma and self.bought[s] == "OUT":
                         print("LONG: %s" % bar_date)
                         sig_dir = 'LONG'
-                        signal = SignalEvent(1, symbol, dt, sig_dir, 1.0)
-                        self.events.put(signal)
-                        self.boughht[s] = 'LONG'
+                        self.bought[s] = 'LONG'
                     elif short_sma < long_sma and self.bought[s] == "LONG":
                         print("SHORT: %s" % bar_date)
                         sig_dir = 'EXIT'
-                        signal = SignalEvent(1, symbol, dt, sig_dir, 1.0)
-                        self.events.put(signal)
                         self.bought[s] = 'OUT'
 
+                    if sig_dir:
+                        signals.append((s, sig_dir))
+
+            if self.batch_signals:
+                if signals:
+                    symbols, sig_dirs = zip(*signals)
+                    self.events.put(SignalBatchEvent(
+                        self.strategy_id, cur_dt, list(symbols),
+                        list(sig_dirs), [1.0] * len(signals)
+                    ))
+            else:
+                for symbol, sig_dir in signals:
+                    signal = SignalEvent(
+                        self.strategy_id, symbol, cur_dt, sig_dir, 1.0
+                    )
+                    self.events.put(signal)
+
+    def _rolling_sma(self, closes, window):
+        """
+        Rolling mean over at most window bars which, like np.mean over the
+        latest bars, is NaN whenever the window contains a missing price.
+        """
+
+        sma = closes.rolling(window, min_periods=1).mean()
+        missing = closes.isnull().astype(float).rolling(
+            window, min_periods=1).max()
+        return sma.where(missing == 0.0)
+
+    def calculate_vectorized_signals(self):
+        """
+        Generates the same LONG/EXIT signals as calculate_signals, but for
+        every bar of every symbol at once, for the vectorized Backtest.
+
+        The SMAs use at most short/long_window bars, and fewer at the start of
+        the data, exactly as the event-driven version does with the bars made
+        available so far. A signal is only emitted on the bar where the
+        strategy changes between "OUT" and "LONG".
+        """
+
+        closes = self.bars.get_bar_panel("adj_close")
+        short_sma = self._rolling_sma(closes, self.short_window)
+        long_sma = self._rolling_sma(closes, self.long_window)
+
+        # 1.0 is "LONG", 0.0 is "OUT", ties keep the previous state
+        state = pd.DataFrame(np.nan, index=closes.index,
+            columns=closes.columns)
+        state[short_sma > long_sma] = 1.0
+        state[short_sma < long_sma] = 0.0
+        state = state.ffill().fillna(0.0)
+
+        # Only keep the bars where the state flips
+        changed = state.diff().fillna(state) != 0.0
+        return state.where(changed)
+
 if __name__ == "__main__":
-    csv_dir = 'ENTER PATH IN UBUNTU OS HERE (developing on Mac os partition at
-    the moment'
-    symbo_list = ['AAPL']
+    csv_dir = 'ENTER PATH IN UBUNTU OS HERE (developing on Mac os partition at ' \
+        'the moment'
+    symbol_list = ['AAPL']
     initial_capital = 100000.0
     heartbeat = 0.0
     start_date = dt.datetime(1990, 1, 1, 0, 0, 0)
 
     backtest = Backtest(
-        csv_dir, symbol_list, initial capital, heartbeat, start_date,
+        csv_dir, symbol_list, initial_capital, heartbeat, start_date,
         HistoricCSVDataHandler, SimulatedExecutionHandler, Portfolio,
-        MovingAverageCrossStrategt
+        MovingAverageCrossStrategy
     )
     backtest.simulate_trading()
 
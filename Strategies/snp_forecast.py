@@ -23,7 +23,7 @@ import pandas as pd
 from sklearn.qda import QDA
 
 from strategy import Strategy
-from event import Signal Event
+from event import SignalEvent
 from backtest import Backtest
 from data import HistoricCSVDataHandler
 from execution import SimulatedExecutionHandler
@@ -97,12 +97,16 @@ class SPYDailyForecastStrategy(Strategy):
                 pred = self.model.predict(pred_series)
                 if pred > 0 and not self.long_market:
                     self.long_market = True
-                    signal = ASignalEvent(1, sym, dt, 'LONG', 1.0)
+                    signal = SignalEvent(
+                        self.strategy_id, sym, dt, 'LONG', 1.0
+                    )
                     self.events.put(signal)
 
                 if pred < 0 and self.long_market:
                     self.long_market = False
-                    signal = SignalEvent(1, sym, dt, 'EXIT', 1.0)
+                    signal = SignalEvent(
+                        self.strategy_id, sym, dt, 'EXIT', 1.0
+                    )
                     self.events.put(signal)
 
 if __name__ == "__main__":
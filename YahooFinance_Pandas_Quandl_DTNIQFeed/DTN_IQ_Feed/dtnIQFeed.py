@@ -9,56 +9,161 @@
 #----------------------------------------------------------
 # NOTE: EITHER MUST RUN ON WINDOWS OR THROUGH WINE AND ALSO HAVE A DTN IQFEED
 # ACCOUNT PURCHASED
-# 
-# Connect with DTN IQFeeds "miniserver" set up to retrieve SPY and IWM ETGs 
+#
+# Connect with DTN IQFeeds "miniserver" set up to retrieve SPY and IWM ETGs
 # intraday data (minutely) for Jan 1st 2007 to now, leveraging sockets.
+#
+# Multi-year minute bar responses run into hundreds of MB. They are received
+# into a preallocated bytearray through a memoryview (no string is ever grown
+# by concatenation), only the bytes just received are searched for the
+# !ENDMSG! terminator, and the complete records are cleaned up and written
+# to disk as they arrive, so the time taken is linear in the size of the
+# response and the memory used is that of the receive buffer.
+#
+# See iqFeedStandIn.py to run this against a local stand-in for IQFeed.
+
+from __future__ import print_function
 
-import sys
 import socket
+import sys
+
+ENDMSG = b"!ENDMSG!"
+
+class IQFeedError(IOError):
+    """
+    An error message sent by IQFeed in reply to a request, e.g.
+    E,!NO_DATA!, for a range without any bar
+    """
+    pass
+
+def hit_request(symbol, interval=60, start="20070101 075000", end="",
+        max_points="", filter_start="093000", filter_end="160000",
+        direction=1):
+    """
+    Returns the HIT (historical interval) request for the bars of a symbol
+
+    Parameters:
+        symbol - The ticker symbol, e.g. 'SPY'
+        interval - The bar interval in seconds
+        start, end - 'YYYYMMDD HHmmSS', an empty end is now
+        max_points - The maximum number of bars, empty for all of them
+        filter_start, filter_end - The time of day filter, 'HHmmSS'
+        direction - 1 for the oldest bar first, 0 for the newest first
+    """
+
+    return ("HIT,%s,%s,%s,%s,%s,%s,%s,%s\n" % (
+        symbol, interval, start, end, max_points, filter_start, filter_end,
+        direction
+    )).encode()
+
+def _write_records(data, out, first):
+    """
+    Removes the carriage returns and the trailing comma of every record of a
+    block of complete lines, and writes them to out
+
+    Returns:
+        The number of records written
+    """
+
+    data = bytes(data).replace(b"\r", b"").replace(b",\n", b"\n")
+    if first and data.startswith(b"E,"):
+        raise IQFeedError(
+            "IQFeed error: %s" % data.split(b"\n", 1)[0].decode()
+        )
+    out.write(data)
+    return data.count(b"\n")
 
-def read_historical_data_socket(sock, recv_buffer=4096):
+def read_historical_data_socket(sock, out, recv_buffer=1 << 20):
     """
-    Read the information from the socket, in a buffered
-    fashion, receiving only 4096 bytes at a time.
-   
-   Parameters:
-   sock - The socket object
-   recv_buffer - Amount in bytes to receive per read
-   """
-   buffer = ""
-   data = ""
-   while True:
-       data = sock.recv(recv_buffer)
-       buffer += data
-       # Check if the end message string arrives
-       if "!ENDMSG!" in buffer:
-           break
-       # Remove the end message string
-       buffer = buffer[:-12]
-       return buffer
+    Read the information from the socket, in a buffered fashion, writing
+    the records to out as they arrive until the !ENDMSG! terminator.
+
+    The bytes are received straight into a bytearray of recv_buffer bytes.
+    After every read the complete lines are written out and the incomplete
+    last line is moved to the front of the buffer. The buffer only grows if
+    a single line does not fit in it. The whole terminator line is read, so
+    the socket can be used for another request afterwards.
+
+    Parameters:
+        sock - The socket object
+        out - A binary file object the records are written to
+        recv_buffer - Size in bytes of the receive buffer
+
+    Returns:
+        The number of records written
+    """
+
+    buf = bytearray(recv_buffer)
+    view = memoryview(buf)
+    start = 0 # buf[:start] holds the incomplete line of the previous read
+    records = 0
+
+    while True:
+        if start == len(buf):
+            grown = bytearray(2 * len(buf))
+            grown[:start] = buf
+            buf, view = grown, memoryview(grown)
+
+        n = sock.recv_into(view[start:])
+        if n == 0:
+            raise IOError("Connection closed before %s" % ENDMSG.decode())
+        end = start + n
+
+        # The terminator may straddle two reads
+        done = buf.find(ENDMSG, max(start - len(ENDMSG) + 1, 0), end)
+        stop = end if done < 0 else done
+
+        last_line = buf.rfind(b"\n", 0, stop) + 1
+        if last_line > 0:
+            records += _write_records(view[:last_line], out, records == 0)
+        if done >= 0:
+            tail = bytes(view[done:end])
+            while not tail.endswith(b"\n"):
+                data = sock.recv(64)
+                if not data:
+                    break
+                tail += data
+            return records
+
+        # Keep the incomplete line for the next read, copied out first as
+        # the two ranges may overlap
+        rest = end - last_line
+        if last_line > 0:
+            buf[:rest] = bytes(view[last_line:end])
+        start = rest
+
+def download_symbol(symbol, csv_path, host="127.0.0.1", port=9100,
+        recv_buffer=1 << 20, **request):
+    """
+    Downloads the bars of a symbol into a CSV file
+
+    Parameters:
+        symbol - The ticker symbol
+        csv_path - The path of the CSV file to write
+        host, port - The address of the IQFeed historical data socket
+        recv_buffer - Size in bytes of the receive buffer
+        request - Keyword arguments for hit_request, e.g. interval=60
+
+    Returns:
+        The number of records written
+    """
+
+    sock = socket.create_connection((host, port))
+    try:
+        sock.sendall(hit_request(symbol, **request))
+        with open(csv_path, "wb") as out:
+            return read_historical_data_socket(sock, out, recv_buffer)
+    finally:
+        sock.close()
+
 if __name__ == "__main__":
     # Define server host, port and symbols to download
     host = "127.0.0.1" # Localhost
     port = 9100 # Historical data socket port
     syms = ["SPY", "IWM"]
+    if len(sys.argv) > 1:
+        port = int(sys.argv[1])
     # Download each symbol to disk
     for sym in syms:
-        print "Downloading symbol: %s..." % sym
-        # Construct the message needed by IQFeed to retrieve data
-        message = "HIT,%s,60,20070101 075000,,,093000,160000,1\n" % sym
-        # Open a streaming socket to the IQFeed server locally
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.connect((host, port))
-        # Send the historical data request
-        # message and buffer the data
-        sock.sendall(message)74
-        data = read_historical_data_socket(sock)
-        sock.close
-        # Remove all the endlines and line-ending
-        # comma delimiter from each record
-        data = "".join(data.split("\r"))
-        data = data.replace(",\n","\n")[:-1]
-        # Write the data stream to disk
-        f = open("%s.csv" % sym, "w")
-        f.write(data)
-        f.close()
+        print("Downloading symbol: %s..." % sym)
+        download_symbol(sym, "%s.csv" % sym, host, port)
@@ -0,0 +1,193 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#==========================================================
+#=================== iqFeedBenchmark.py ===================
+#==========================================================
+
+# Purpose
+#----------------------------------------------------------
+# Measures how fast historical bar downloads are received and written to
+# disk, against a local IQFeedStandIn (see iqFeedStandIn.py): the streaming
+# read_historical_data_socket of dtnIQFeed.py for several receive buffer
+# sizes, and for comparison the previous approach of growing a string by
+# 4096 byte reads and searching all of it for the terminator after each one.
+#
+# run_download_benchmark times the download of many symbols with the
+# IQFeedDownloader (see iqFeedDownloader.py), for a given parallelism and
+# split of the date range, against a stand-in with a round trip latency.
+
+from __future__ import print_function
+
+import datetime as dt
+import os
+import shutil
+import socket
+import tempfile
+import time
+
+from dtnIQFeed import ENDMSG, hit_request, read_historical_data_socket
+from iqFeedDownloader import IQFeedDownloader, split_range
+from iqFeedStandIn import IQFeedStandIn
+
+def read_concatenating(sock, out, recv_buffer=4096):
+    """
+    The previous reader: the whole response is accumulated in a growing
+    bytes object and searched for the terminator after every read, which is
+    quadratic in the size of the response
+    """
+
+    buffer = b""
+    while True:
+        data = sock.recv(recv_buffer)
+        if not data:
+            break
+        buffer += data
+        if ENDMSG in buffer:
+            break
+    data = buffer[:buffer.find(ENDMSG)]
+    data = data.replace(b"\r", b"").replace(b",\n", b"\n")
+    out.write(data)
+    return data.count(b"\n")
+
+def run_benchmark(reader=read_historical_data_socket, recv_buffer=1 << 20,
+        start="20070101 000000", end="20071231 235959", symbol="SPY"):
+    """
+    Downloads the minute bars of a symbol from a fresh IQFeedStandIn with a
+    reader, writing them to a temporary file
+
+    Parameters:
+        reader - The function reading the response, see
+        read_historical_data_socket
+        recv_buffer - The receive buffer size given to the reader
+        start, end - The range of the request, 'YYYYMMDD HHmmSS'
+        symbol - The ticker symbol
+
+    Returns:
+        A dict of the results: the number of records, the bytes received,
+        the elapsed seconds, the records per second and the MB per second
+    """
+
+    with IQFeedStandIn() as server:
+        request = hit_request(symbol, 60, start, end, "", "093000", "160000")
+        # Build the response beforehand, only the transfer is timed
+        size = len(server.response(request.strip().decode()))
+
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        try:
+            sock = socket.create_connection((server.host, server.port))
+            begin = time.time()
+            sock.sendall(request)
+            with open(path, 'wb') as out:
+                records = reader(sock, out, recv_buffer)
+            elapsed = time.time() - begin
+            sock.close()
+        finally:
+            os.remove(path)
+
+    return {
+        'records': records,
+        'bytes': size,
+        'elapsed': elapsed,
+        'records_per_sec': records / elapsed,
+        'mb_per_sec': size / elapsed / 1e6,
+    }
+
+def run_download_benchmark(n_symbols=50, parallelism=8, split_days=365,
+        latency=0.05, start="20070101 000000", end="20081231 235959"):
+    """
+    Downloads the minute bars of n_symbols symbols with an IQFeedDownloader
+    from a fresh IQFeedStandIn answering every request after latency
+    seconds, into a temporary directory
+
+    Parameters:
+        n_symbols - The number of symbols
+        parallelism, split_days - As for IQFeedDownloader
+        latency - The round trip latency of the stand-in in seconds
+        start, end - The range of the download, 'YYYYMMDD HHmmSS'
+
+    Returns:
+        A dict of the results: the number of symbols and records, the
+        requests made, the elapsed seconds, the records per second and the
+        MB per second
+    """
+
+    symbols = ['S%03d' % i for i in range(n_symbols)]
+    csv_dir = tempfile.mkdtemp()
+    try:
+        with IQFeedStandIn(latency=latency) as server:
+            downloader = IQFeedDownloader(
+                server.host, server.port, parallelism=parallelism,
+                split_days=split_days
+            )
+
+            # Build the responses beforehand, only the downloads are timed
+            first = dt.datetime.strptime(start, downloader.datetime_format)
+            last = dt.datetime.strptime(end, downloader.datetime_format)
+            ranges = [(first, last)] if split_days is None else \
+                split_range(first, last, split_days)
+            size = 0
+            for s in symbols:
+                for sub_start, sub_end in ranges:
+                    size += len(server.response(downloader._request(
+                        s, sub_start, sub_end).strip().decode()))
+
+            begin = time.time()
+            records, errors = downloader.download(
+                symbols, csv_dir, start, end
+            )
+            elapsed = time.time() - begin
+    finally:
+        shutil.rmtree(csv_dir)
+
+    total = sum(records.values())
+    return {
+        'symbols': len(records),
+        'records': total,
+        'requests': downloader.attempts,
+        'bytes': size,
+        'elapsed': elapsed,
+        'records_per_sec': total / elapsed,
+        'mb_per_sec': size / elapsed / 1e6,
+    }
+
+def format_download_results(results):
+    """
+    Returns the results of run_download_benchmark as a line of text
+    """
+
+    return (
+        "%(symbols)d symbols, %(records)d records in %(requests)d requests "
+        "in %(elapsed).3fs: %(records_per_sec).0f records/sec, "
+        "%(mb_per_sec).1f MB/sec" % results
+    )
+
+def format_results(results):
+    """
+    Returns the results of run_benchmark as a line of text
+    """
+
+    return (
+        "%(records)d records (%(bytes)d bytes) in %(elapsed).3fs: "
+        "%(records_per_sec).0f records/sec, %(mb_per_sec).1f MB/sec" % results
+    )
+
+if __name__ == "__main__":
+    for recv_buffer in (4096, 1 << 16, 1 << 20):
+        print("Streaming reader, %d byte buffer, 2007-2010 minute bars" %
+            recv_buffer)
+        print(format_results(run_benchmark(
+            recv_buffer=recv_buffer, end="20101231 235959"
+        )))
+    print("Concatenating reader, 4096 byte reads, 2007 minute bars")
+    print(format_results(run_benchmark(read_concatenating, 4096)))
+    print("Streaming reader, 4096 byte buffer, 2007 minute bars")
+    print(format_results(run_benchmark(recv_buffer=4096)))
+    for parallelism, split_days in ((1, None), (8, None), (8, 182)):
+        print("50 symbols of 2007-2008 minute bars, 50ms latency, "
+            "parallelism %d, split into %s day requests" % (parallelism,
+                split_days))
+        print(format_download_results(run_download_benchmark(
+            parallelism=parallelism, split_days=split_days
+        )))
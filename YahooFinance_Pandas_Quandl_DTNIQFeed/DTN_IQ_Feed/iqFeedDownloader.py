@@ -0,0 +1,317 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#==========================================================
+#=================== iqFeedDownloader.py ==================
+#==========================================================
+
+# Purpose
+#----------------------------------------------------------
+# NOTE: EITHER MUST RUN ON WINDOWS OR THROUGH WINE AND ALSO HAVE A DTN IQFEED
+# ACCOUNT PURCHASED (or see iqFeedStandIn.py)
+#
+# dtnIQFeed.py downloads one symbol at a time over a new connection each, so
+# a few hundred symbols spend most of their time waiting on round trips. The
+# IQFeedDownloader downloads many symbols at once instead:
+#
+#   - a small pool of connections to the historical data socket is kept
+#     open and reused from one request to the next
+#   - long date ranges are split into sub-requests (of split_days days),
+#     downloaded in parallel into part files and joined in order once all
+#     the parts of a symbol are done
+#   - at most parallelism requests are in flight at any time
+#   - a failed request (dropped connection, timeout) is retried on a fresh
+#     connection, with an exponential backoff
+#
+# A sub-range without any bar (e.g. before a listing) is answered with
+# E,!NO_DATA!, by IQFeed and simply contributes no records.
+
+from __future__ import print_function
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+import datetime as dt
+import os, os.path
+import shutil
+import socket
+import sys
+import threading
+import time
+
+from dtnIQFeed import IQFeedError, hit_request, read_historical_data_socket
+
+class ConnectionPool(object):
+    """
+    A bounded pool of connections to a server. Connections are opened as
+    they are first needed, at most size of them at a time, and kept open
+    for reuse once returned. A connection which failed is closed instead.
+    """
+
+    def __init__(self, host, port, size=8, timeout=60.0):
+        """
+        Parameters:
+            host, port - The address of the server
+            size - The maximum number of connections
+            timeout - The socket timeout in seconds
+        """
+
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.idle = []
+        self.opened = 0
+
+    def acquire(self):
+        """
+        Returns an idle connection, or a new one, waiting for one to be
+        released if size of them are in use
+        """
+
+        self.slots.acquire()
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+            self.opened += 1
+        try:
+            return socket.create_connection(
+                (self.host, self.port), self.timeout
+            )
+        except Exception:
+            self.slots.release()
+            raise
+
+    def release(self, sock, broken=False):
+        """
+        Returns a connection to the pool, closing it if it is broken
+        """
+
+        if broken:
+            sock.close()
+        else:
+            with self.lock:
+                self.idle.append(sock)
+        self.slots.release()
+
+    @contextmanager
+    def connection(self):
+        """
+        A connection from the pool for the duration of a with block, closed
+        rather than reused if the block raises
+        """
+
+        sock = self.acquire()
+        try:
+            yield sock
+        except Exception:
+            self.release(sock, broken=True)
+            raise
+        else:
+            self.release(sock)
+
+    def close(self):
+        """
+        Closes the idle connections
+        """
+
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for sock in idle:
+            sock.close()
+
+def split_range(start, end, days):
+    """
+    Splits a date range into consecutive sub-ranges of at most days days
+
+    Parameters:
+        start, end - datetimes, both included
+        days - The length of the sub-ranges in days
+
+    Returns:
+        A list of (start, end) datetimes, both included
+    """
+
+    step = dt.timedelta(days=days)
+    ranges = []
+    while start <= end:
+        sub_end = min(start + step - dt.timedelta(seconds=1), end)
+        ranges.append((start, sub_end))
+        start = sub_end + dt.timedelta(seconds=1)
+    return ranges
+
+class IQFeedDownloader(object):
+    """
+    Downloads the interval bars of many symbols concurrently over a pool of
+    connections to the IQFeed historical data socket, see the Purpose above
+    """
+
+    datetime_format = "%Y%m%d %H%M%S"
+
+    def __init__(self, host="127.0.0.1", port=9100, parallelism=8,
+            split_days=365, retries=3, retry_delay=1.0, timeout=60.0,
+            recv_buffer=1 << 20, interval=60, filter_start="093000",
+            filter_end="160000"):
+        """
+        Parameters:
+            host, port - The address of the IQFeed historical data socket
+            parallelism - The maximum number of requests in flight, which is
+            also the size of the connection pool
+            split_days - The length in days of the sub-requests a date range
+            is split into, None for a single request per symbol
+            retries - The number of times a failed request is retried
+            retry_delay - Seconds before the first retry, doubling after
+            every further one
+            timeout - The socket timeout in seconds
+            recv_buffer - Size in bytes of the receive buffer per request
+            interval - The bar interval in seconds
+            filter_start, filter_end - The time of day filter, 'HHmmSS'
+        """
+
+        self.parallelism = parallelism
+        self.split_days = split_days
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.recv_buffer = recv_buffer
+        self.interval = interval
+        self.filter_start = filter_start
+        self.filter_end = filter_end
+        self.pool = ConnectionPool(host, port, parallelism, timeout)
+        self.attempts = 0
+        self.retried = 0
+        self.lock = threading.Lock()
+
+    def _request(self, symbol, start, end):
+        return hit_request(
+            symbol, self.interval, start.strftime(self.datetime_format),
+            end.strftime(self.datetime_format), "", self.filter_start,
+            self.filter_end
+        )
+
+    def _download_part(self, symbol, start, end, part_path):
+        """
+        Downloads the bars of a symbol over a sub-range into a part file,
+        retrying on failure
+
+        Returns:
+            The number of records written
+        """
+
+        request = self._request(symbol, start, end)
+        for attempt in range(self.retries + 1):
+            with self.lock:
+                self.attempts += 1
+                self.retried += attempt > 0
+            try:
+                with self.pool.connection() as sock:
+                    sock.sendall(request)
+                    with open(part_path, "wb") as out:
+                        return read_historical_data_socket(
+                            sock, out, self.recv_buffer
+                        )
+            except IQFeedError as e:
+                if "!NO_DATA!" in str(e):
+                    open(part_path, "wb").close()
+                    return 0
+                raise
+            except (IOError, OSError, socket.error) as e:
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.retry_delay * 2 ** attempt)
+
+    def _join_parts(self, csv_path, part_paths):
+        """
+        Concatenates the part files of a symbol, in order, into its CSV file
+        """
+
+        with open(csv_path, "wb") as out:
+            for path in part_paths:
+                with open(path, "rb") as part:
+                    shutil.copyfileobj(part, out, 1 << 20)
+                os.remove(path)
+
+    def download(self, symbols, csv_dir, start, end=None):
+        """
+        Downloads the bars of the symbols into csv_dir/SYMBOL.csv files
+
+        Parameters:
+            symbols - The list of ticker symbols
+            csv_dir - The directory of the CSV files
+            start - The first datetime (or 'YYYYMMDD HHmmSS')
+            end - The last datetime (or 'YYYYMMDD HHmmSS'), None for now
+
+        Returns:
+            (records, errors) - dicts of symbol to the number of records
+            written, for the symbols downloaded, and to the exception, for
+            those which failed
+        """
+
+        if not isinstance(start, dt.datetime):
+            start = dt.datetime.strptime(start, self.datetime_format)
+        if end is None:
+            end = dt.datetime.now().replace(microsecond=0)
+        elif not isinstance(end, dt.datetime):
+            end = dt.datetime.strptime(end, self.datetime_format)
+        if not os.path.exists(csv_dir):
+            os.makedirs(csv_dir)
+
+        if self.split_days is None:
+            ranges = [(start, end)]
+        else:
+            ranges = split_range(start, end, self.split_days)
+
+        records = {}
+        errors = {}
+        parts = {}
+        remaining = {}
+        executor = ThreadPoolExecutor(max_workers=self.parallelism)
+        try:
+            futures = {}
+            # Symbol by symbol, so the first symbols are completed first
+            for s in symbols:
+                csv_path = os.path.join(csv_dir, "%s.csv" % s)
+                parts[s] = ["%s.part%d" % (csv_path, i)
+                    for i in range(len(ranges))]
+                remaining[s] = len(ranges)
+                records[s] = 0
+                for (sub_start, sub_end), path in zip(ranges, parts[s]):
+                    futures[executor.submit(
+                        self._download_part, s, sub_start, sub_end, path
+                    )] = s
+
+            for future in as_completed(futures):
+                s = futures[future]
+                try:
+                    records[s] += future.result()
+                except Exception as e:
+                    errors.setdefault(s, e)
+                remaining[s] -= 1
+                if remaining[s] == 0 and s not in errors:
+                    self._join_parts(
+                        os.path.join(csv_dir, "%s.csv" % s), parts[s]
+                    )
+        finally:
+            executor.shutdown(wait=True)
+            self.pool.close()
+
+        # Leave no part files behind for the failed symbols
+        for s in errors:
+            del records[s]
+            for path in parts[s]:
+                if os.path.exists(path):
+                    os.remove(path)
+        return records, errors
+
+if __name__ == "__main__":
+    # Define server host, port and symbols to download
+    host = "127.0.0.1" # Localhost
+    port = 9100 # Historical data socket port
+    syms = sys.argv[1:] or ["SPY", "IWM"]
+
+    downloader = IQFeedDownloader(host, port)
+    begin = time.time()
+    records, errors = downloader.download(syms, ".", "20070101 075000")
+    print("Downloaded %d records of %d symbols in %.1fs" % (
+        sum(records.values()), len(records), time.time() - begin))
+    for s, e in sorted(errors.items()):
+        print("Failed to download %s: %s" % (s, e))
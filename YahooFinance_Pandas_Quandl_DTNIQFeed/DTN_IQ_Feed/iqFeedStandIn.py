@@ -0,0 +1,222 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#==========================================================
+#==================== iqFeedStandIn.py ====================
+#==========================================================
+
+# Purpose
+#----------------------------------------------------------
+# IQFeed only runs on Windows (or through WINE) with a paid account, so the
+# download scripts cannot be tested or benchmarked without it. The
+# IQFeedStandIn is a local server answering HIT (historical interval)
+# requests on a TCP socket like the IQFeed historical data socket does:
+# one record per bar,
+#
+#   YYYY-MM-DD HH:MM:SS,high,low,open,close,total volume,period volume,\r\n
+#
+# followed by "!ENDMSG!,\r\n". The bars are synthetic (a random walk), one
+# per interval between the filter times of every weekday of the requested
+# range. Symbols in no_data_symbols get the "E,!NO_DATA!," error instead.
+#
+# A latency before every response simulates the round trip to IQFeed, and
+# every fail_every-th request can have its connection dropped halfway
+# through the response, to exercise the retries of the downloaders.
+
+from __future__ import print_function
+
+import datetime as dt
+import socket
+import threading
+import time
+
+import numpy as np
+
+class IQFeedStandIn(object):
+    """
+    Local server simulating the IQFeed historical data socket, see the
+    Purpose above. Responses are built once per distinct request and cached.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, send_size=1 << 16,
+            end_date="20151231", no_data_symbols=(), latency=0.0,
+            fail_every=0):
+        """
+        Parameters:
+            host, port - Where to listen, port 0 picks a free port
+            send_size - The number of bytes sent per send call
+            end_date - The last day of a request without an end, 'YYYYMMDD'
+            no_data_symbols - Symbols answered with the no data error
+            latency - Seconds between receiving a request and answering it
+            fail_every - Drop the connection halfway through every
+            fail_every-th response, 0 never does
+        """
+
+        self.send_size = send_size
+        self.end_date = end_date
+        self.no_data_symbols = set(no_data_symbols)
+        self.latency = latency
+        self.fail_every = fail_every
+        self.requests = 0
+        self.failures = 0
+        self.connections = 0
+        self.responses = {}
+        self.lock = threading.Lock()
+        self.running = False
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.host, self.port = self.server.getsockname()
+
+    def start(self):
+        """
+        Starts accepting connections, and returns at once
+        """
+
+        self.running = True
+        self.server.listen(16)
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops the server
+        """
+
+        self.running = False
+        self.server.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+
+    def _accept(self):
+        while self.running:
+            try:
+                client, _ = self.server.accept()
+            except (OSError, socket.error):
+                return
+            with self.lock:
+                self.connections += 1
+            thread = threading.Thread(target=self._serve, args=(client,))
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, client):
+        """
+        Answers every request line received on a connection
+        """
+
+        try:
+            for line in client.makefile('rb'):
+                with self.lock:
+                    self.requests += 1
+                    fail = self.fail_every and \
+                        self.requests % self.fail_every == 0
+                    if fail:
+                        self.failures += 1
+                response = self.response(line.strip().decode())
+                if self.latency:
+                    time.sleep(self.latency)
+                if fail:
+                    response = response[:len(response) // 2]
+                view = memoryview(response)
+                for i in range(0, len(response), self.send_size):
+                    client.sendall(view[i:i + self.send_size])
+                if fail:
+                    return
+        except (OSError, socket.error):
+            pass
+        finally:
+            client.close()
+
+    def response(self, request):
+        """
+        Returns the bytes answering a request, terminator included
+        """
+
+        with self.lock:
+            response = self.responses.get(request)
+        if response is None:
+            response = self._build(request) + b"!ENDMSG!,\r\n"
+            with self.lock:
+                self.responses[request] = response
+        return response
+
+    def _build(self, request):
+        fields = request.split(",")
+        if fields[0] != "HIT" or len(fields) < 4:
+            return b"E,!SYNTAX_ERROR!,\r\n"
+        symbol = fields[1]
+        if symbol in self.no_data_symbols:
+            return b"E,!NO_DATA!,\r\n"
+
+        def field(i, default):
+            return fields[i] if len(fields) > i and fields[i] else default
+
+        interval = int(field(2, "60"))
+        start = dt.datetime.strptime(field(3, "20070101 000000"),
+            "%Y%m%d %H%M%S")
+        end = dt.datetime.strptime(field(4, self.end_date + " 235959"),
+            "%Y%m%d %H%M%S")
+        filter_start = field(6, "000000")
+        filter_end = field(7, "235959")
+        return bars_csv(symbol, interval, start, end, filter_start,
+            filter_end)
+
+def bars_csv(symbol, interval, start, end, filter_start="000000",
+        filter_end="235959"):
+    """
+    Builds the synthetic bar records of a symbol between two datetimes, as
+    the bytes IQFeed would send. The bars are seeded from the symbol, so
+    the same request always gets the same bars.
+
+    Parameters:
+        symbol - The ticker symbol
+        interval - The bar interval in seconds
+        start, end - The first and last datetimes
+        filter_start, filter_end - The time of day filter, 'HHmmSS'
+    """
+
+    def seconds(hhmmss):
+        return int(hhmmss[:2]) * 3600 + int(hhmmss[2:4]) * 60 + \
+            int(hhmmss[4:6])
+
+    # The bar close times of one day, then of every weekday in the range
+    day = np.arange(
+        seconds(filter_start) + interval, seconds(filter_end) + 1, interval
+    ).astype('timedelta64[s]')
+    days = np.arange(
+        np.datetime64(start.date(), 'D'), np.datetime64(end.date(), 'D') + 1
+    )
+    days = days[np.is_busday(days)]
+    times = (days.astype('datetime64[s]')[:, None] + day[None, :]).ravel()
+    times = times[(times >= np.datetime64(start, 's')) &
+        (times <= np.datetime64(end, 's'))]
+    if len(times) == 0:
+        return b"E,!NO_DATA!,\r\n"
+
+    rng = np.random.RandomState(sum(ord(c) for c in symbol))
+    close = np.round(100.0 + np.cumsum(rng.normal(0, 0.05, len(times))), 2)
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.round(np.maximum(open_, close) + rng.uniform(0, 0.05,
+        len(times)), 2)
+    low = np.round(np.minimum(open_, close) - rng.uniform(0, 0.05,
+        len(times)), 2)
+    volume = rng.randint(100, 10000, len(times))
+    total = np.cumsum(volume)
+
+    stamps = np.datetime_as_string(times, unit='s')
+    lines = [
+        "%s,%.2f,%.2f,%.2f,%.2f,%d,%d,\r\n" % (t.replace('T', ' '), h, l, o,
+            c, tv, v)
+        for t, h, l, o, c, tv, v in zip(stamps.tolist(), high.tolist(),
+            low.tolist(), open_.tolist(), close.tolist(), total.tolist(),
+            volume.tolist())
+    ]
+    return "".join(lines).encode()